@@ -258,6 +258,8 @@ def download_books(
     sleep: float,
     no_collections: bool,
     debug: bool = False,
+    workers: int = 1,
+    catalog: Optional[str] = None,
 ) -> tuple[bool, int]:
     """
     Run the book download script.
@@ -283,6 +285,8 @@ def download_books(
         out_dir,
         "--sleep",
         str(sleep),
+        "--workers",
+        str(workers),
     ]
 
     if genres:
@@ -294,6 +298,9 @@ def download_books(
     if debug:
         cmd.append("--debug")
 
+    if catalog:
+        cmd.extend(["--catalog", catalog])
+
     try:
         log(f"Running: {' '.join(cmd)}", "INFO")
         result = subprocess.run(cmd, check=False)  # Don't raise on non-zero
@@ -374,6 +381,9 @@ Examples:
   # Download to custom directory
   python %(prog)s --mode popular --count 50 --out ./MyLibrary
 
+  # Select from a local catalog file instead of Gutendex (no Docker)
+  python %(prog)s --mode popular --count 50 --catalog ./rdf-files.tar.bz2
+
   # Just start containers (no download)
   python %(prog)s --start-only
 
@@ -424,9 +434,20 @@ Examples:
         default=1.0,
         help="Sleep between downloads in seconds (default: 1.0)",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Concurrent EPUB downloads (default: 1)",
+    )
     parser.add_argument(
         "--no-collections", action="store_true", help="Skip collection metadata"
     )
+    parser.add_argument(
+        "--catalog",
+        type=str,
+        help="Local Project Gutenberg catalog (pg_catalog.csv or RDF tarball); skips Docker/Gutendex entirely",
+    )
 
     # Container management
     parser.add_argument(
@@ -460,6 +481,12 @@ Examples:
 
     args = parser.parse_args()
 
+    # --catalog never touches Docker, so the container-only modes make no sense with it
+    if args.catalog:
+        for flag in ("start_only", "stop_only"):
+            if getattr(args, flag):
+                parser.error(f"--{flag.replace('_', '-')} manages the Docker containers and cannot be used with --catalog")
+
     # Handle stop-only mode
     if args.stop_only:
         if stop_containers():
@@ -471,60 +498,75 @@ Examples:
     log("Automated Gutendex Downloader", "HEADER")
     log("=" * 60, "HEADER")
 
-    if not check_docker_installed():
-        return 1
-
-    if not check_docker_running():
-        return 1
-
-    if not check_docker_compose_installed():
-        return 1
+    if args.catalog:
+        # The offline catalog answers selection queries in-process
+        containers_already_running = True  # nothing to stop afterwards
+        if not Path(args.catalog).exists():
+            log(f"Offline catalog not found: {args.catalog}", "ERROR")
+            return 1
+        if not DOWNLOADER_SCRIPT.exists():
+            log(f"Downloader script not found: {DOWNLOADER_SCRIPT}", "ERROR")
+            return 1
+        log(f"Using offline catalog {args.catalog} - Docker is not needed", "INFO")
+        ignored = [f"--{flag.replace('_', '-')}" for flag in ("show_logs", "keep_running", "skip_wait") if getattr(args, flag)]
+        if ignored:
+            log(f"Ignoring {', '.join(ignored)}: there are no containers with --catalog", "WARNING")
+            args.show_logs = args.keep_running = args.skip_wait = False
+    else:
+        if not check_docker_installed():
+            return 1
 
-    if not DOCKER_COMPOSE_FILE.exists():
-        log(f"Docker Compose file not found: {DOCKER_COMPOSE_FILE}", "ERROR")
-        return 1
+        if not check_docker_running():
+            return 1
 
-    if not DOWNLOADER_SCRIPT.exists() and not args.start_only:
-        log(f"Downloader script not found: {DOWNLOADER_SCRIPT}", "ERROR")
-        return 1
+        if not check_docker_compose_installed():
+            return 1
 
-    # Start containers if needed
-    containers_already_running = check_containers_running()
+        if not DOCKER_COMPOSE_FILE.exists():
+            log(f"Docker Compose file not found: {DOCKER_COMPOSE_FILE}", "ERROR")
+            return 1
 
-    if not containers_already_running:
-        if not start_containers():
+        if not DOWNLOADER_SCRIPT.exists() and not args.start_only:
+            log(f"Downloader script not found: {DOWNLOADER_SCRIPT}", "ERROR")
             return 1
 
-        # Wait for API to be ready
-        if not args.skip_wait:
-            if not wait_for_api_ready():
-                log("Showing recent logs for debugging:", "INFO")
-                show_container_logs(50)
+        # Start containers if needed
+        containers_already_running = check_containers_running()
+
+        if not containers_already_running:
+            if not start_containers():
                 return 1
+
+            # Wait for API to be ready
+            if not args.skip_wait:
+                if not wait_for_api_ready():
+                    log("Showing recent logs for debugging:", "INFO")
+                    show_container_logs(50)
+                    return 1
+            else:
+                log("Skipping API ready wait (--skip-wait)", "WARNING")
         else:
-            log("Skipping API ready wait (--skip-wait)", "WARNING")
-    else:
-        log("Using already-running containers", "INFO")
-
-        # Quick health check
-        if not args.skip_wait:
-            log("Checking API health...", "INFO")
-            try:
-                response = requests.get(GUTENDEX_HEALTH_URL, timeout=10)
-                if response.status_code == 200:
-                    data = response.json()
-                    count = data.get("count", 0)
-                    log(f"✓ API is healthy: {count:,} books available", "SUCCESS")
-                else:
-                    log(f"API returned status {response.status_code}", "WARNING")
-            except Exception as e:
-                log(f"Could not verify API health: {e}", "WARNING")
-                log("Continuing anyway...", "INFO")
-
-    # Start-only mode
-    if args.start_only:
-        log("Containers started. Exiting (--start-only mode)", "SUCCESS")
-        return 0
+            log("Using already-running containers", "INFO")
+
+            # Quick health check
+            if not args.skip_wait:
+                log("Checking API health...", "INFO")
+                try:
+                    response = requests.get(GUTENDEX_HEALTH_URL, timeout=10)
+                    if response.status_code == 200:
+                        data = response.json()
+                        count = data.get("count", 0)
+                        log(f"✓ API is healthy: {count:,} books available", "SUCCESS")
+                    else:
+                        log(f"API returned status {response.status_code}", "WARNING")
+                except Exception as e:
+                    log(f"Could not verify API health: {e}", "WARNING")
+                    log("Continuing anyway...", "INFO")
+
+        # Start-only mode
+        if args.start_only:
+            log("Containers started. Exiting (--start-only mode)", "SUCCESS")
+            return 0
 
     # Download books
     success, exit_code = download_books(
@@ -537,6 +579,8 @@ Examples:
         sleep=args.sleep,
         no_collections=args.no_collections,
         debug=args.debug,
+        workers=args.workers,
+        catalog=args.catalog,
     )
 
     # Show logs if requested
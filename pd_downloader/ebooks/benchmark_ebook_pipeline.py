@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+"""
+Ebook Pipeline Benchmark
+Times the offline stages of the ebook downloaders against a synthetic EPUB
+corpus: Gutenberg cleaning, Kavita metadata embedding, OPF lookup and the
+Standard Ebooks OPF rewrite.  Nothing touches the network.
+
+Each stage runs in a fresh process so its peak RSS can be reported on its own.
+Results are printed and saved as JSON; pass --compare with an earlier result
+file to see the change per stage.
+"""
+
+import argparse
+import io
+import json
+import math
+import multiprocessing
+import platform
+import random
+import shutil
+import struct
+import sys
+import tempfile
+import time
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+import gutendex_selfhosted_to_kavita as gutendex
+import standard_ebooks_to_kavita as standard_ebooks
+
+try:
+    import resource
+except ImportError:
+    resource = None  # Windows: peak RSS is not reported
+
+# ---------------------------- Config ----------------------------
+
+CORPUS_MANIFEST = "corpus.json"
+DEFAULT_RESULTS_DIR = "./bench_results"
+
+WORDS = (
+    "the of and to in a was he that it his with as had for on her at by which "
+    "but not be from they were this all she or an my one have their so there "
+    "upon said when would been no into him more could some what them very then "
+    "little about time man great before over now only out other such than"
+).split()
+
+# Paragraphs mixed into chapters at the --boilerplate rate; every one of them
+# matches something clean_epub_bytes() strips or rewrites.
+BOILERPLATE = (
+    "<p>This eBook is for the use of anyone anywhere at no cost. You may copy it, give it away or "
+    "re-use it under the terms of the Project Gutenberg License included with this eBook or online "
+    'at <a href="https://www.gutenberg.org/">www.gutenberg.org</a>.</p>',
+    '<div class="pg-boilerplate"><p>Project Gutenberg-tm is synonymous with the free distribution '
+    "of electronic works.</p></div>",
+    "<!-- Produced by volunteers of Project Gutenberg -->",
+    '<section class="pg-footer"><p>Updated editions will replace the previous one. The Gutenberg '
+    "Literary Archive Foundation is a non-profit.</p></section>",
+)
+
+
+# ---------------------------- Helpers ----------------------------
+
+
+def log(msg: str) -> None:
+    print(f"[ebook-bench] {msg}", flush=True)
+
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    """Nearest-rank percentile of a non-empty sequence."""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process so far, or None where unsupported."""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1 << 20) if sys.platform == "darwin" else rss / 1024  # bytes on macOS, KiB on Linux
+
+
+# ---------------------------- Synthetic corpus ----------------------------
+
+
+@dataclass
+class CorpusSpec:
+    books: int = 40
+    chapters: int = 20
+    chapter_kb: int = 24
+    images: int = 4
+    image_kb: int = 200
+    boilerplate: float = 0.05  # fraction of paragraphs that are Gutenberg boilerplate
+    malformed: float = 0.1  # fraction of books with an unparseable container.xml
+    missing: float = 0.1  # fraction of books with no container.xml at all
+    seed: int = 1
+
+
+def _paragraph(rng: random.Random) -> str:
+    return "<p>" + " ".join(rng.choice(WORDS) for _ in range(rng.randint(40, 120))).capitalize() + ".</p>"
+
+
+def _chapter(rng: random.Random, book: int, number: int, spec: CorpusSpec) -> str:
+    parts = [f"<h2>Chapter {number}</h2>"]
+    size = 0
+    while size < spec.chapter_kb * 1024:
+        if rng.random() < spec.boilerplate:
+            para = rng.choice(BOILERPLATE)
+        else:
+            para = _paragraph(rng)
+        parts.append(para)
+        size += len(para)
+    body = "\n".join(parts)
+    if number == 1:
+        body = f"<p>*** START OF THE PROJECT GUTENBERG EBOOK {book} ***</p>\n" + body
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        '<html xmlns="http://www.w3.org/1999/xhtml"><head><title>Chapter '
+        f'{number}</title><link rel="stylesheet" href="style.css"/></head>\n<body>\n{body}\n</body></html>\n'
+    )
+
+
+def _png(rng: random.Random, size: int) -> bytes:
+    """A PNG header and IHDR followed by incompressible bytes, like a real photo scan."""
+    ihdr = struct.pack(">IIBBBBB", 800, 1200, 8, 2, 0, 0, 0)
+    chunk = b"IHDR" + ihdr
+    head = b"\x89PNG\r\n\x1a\n" + struct.pack(">I", len(ihdr)) + chunk + struct.pack(">I", zlib.crc32(chunk))
+    return head + rng.randbytes(max(0, size - len(head)))
+
+
+def _opf(book: int, spec: CorpusSpec) -> str:
+    items = [f'<item id="c{i}" href="text/chapter{i}.xhtml" media-type="application/xhtml+xml"/>'
+             for i in range(1, spec.chapters + 1)]
+    items += [f'<item id="img{i}" href="images/img{i}.png" media-type="image/png"/>'
+              for i in range(1, spec.images + 1)]
+    items += ['<item id="css" href="text/style.css" media-type="text/css"/>',
+              '<item id="ncx" href="toc.ncx" media-type="application/x-dtbncx+xml"/>']
+    spine = "".join(f'<itemref idref="c{i}"/>' for i in range(1, spec.chapters + 1))
+    return f"""<?xml version="1.0" encoding="utf-8"?>
+<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="id">
+  <metadata xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:opf="http://www.idpf.org/2007/opf">
+    <dc:identifier id="id">http://www.gutenberg.org/{book}</dc:identifier>
+    <dc:title>Synthetic Book {book}</dc:title>
+    <dc:creator>Author {book % 17}</dc:creator>
+    <dc:language>en</dc:language>
+    <dc:publisher>Project Gutenberg</dc:publisher>
+    <dc:subject>Fiction</dc:subject>
+    <meta property="dcterms:modified">2024-01-01T00:00:00Z</meta>
+  </metadata>
+  <manifest>
+    {"".join(items)}
+  </manifest>
+  <spine toc="ncx">{spine}</spine>
+</package>
+"""
+
+
+def make_epub(rng: random.Random, book: int, spec: CorpusSpec, container: str) -> bytes:
+    """
+    One synthetic EPUB.  `container` is "ok", "malformed" (truncated XML, so
+    the OPF must be found by scanning) or "missing".
+    """
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr(zipfile.ZipInfo("mimetype"), "application/epub+zip")
+        if container == "ok":
+            z.writestr(
+                "META-INF/container.xml",
+                '<?xml version="1.0"?><container version="1.0" '
+                'xmlns="urn:oasis:names:tc:opendocument:xmlns:container"><rootfiles>'
+                '<rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>'
+                "</rootfiles></container>",
+            )
+        elif container == "malformed":
+            z.writestr("META-INF/container.xml", '<?xml version="1.0"?><container version="1.0"><rootfiles><rootf')
+        z.writestr("OEBPS/content.opf", _opf(book, spec))
+        z.writestr("OEBPS/toc.ncx", f'<?xml version="1.0"?><ncx xmlns="http://www.daisy.org/z3986/2005/ncx/">'
+                                    f"<docTitle><text>Synthetic Book {book}</text></docTitle></ncx>")
+        z.writestr("OEBPS/text/style.css", "body { font-family: serif; }\n.pg-boilerplate { display: none; }\n")
+        for i in range(1, spec.chapters + 1):
+            z.writestr(f"OEBPS/text/chapter{i}.xhtml", _chapter(rng, book, i, spec))
+        for i in range(1, spec.images + 1):
+            # Images are stored, as most EPUB producers do for already-compressed data
+            z.writestr(f"OEBPS/images/img{i}.png", _png(rng, spec.image_kb * 1024), compress_type=zipfile.ZIP_STORED)
+    return buf.getvalue()
+
+
+def generate_corpus(spec: CorpusSpec, corpus_dir: Path) -> List[Path]:
+    """Write the corpus into `corpus_dir`, reusing it if it was built from the same spec."""
+    manifest = corpus_dir / CORPUS_MANIFEST
+    paths = [corpus_dir / f"book-{i:04d}.epub" for i in range(1, spec.books + 1)]
+    if manifest.is_file() and json.loads(manifest.read_text(encoding="utf-8")) == asdict(spec):
+        if all(p.is_file() for p in paths):
+            log(f"Reusing corpus in {corpus_dir}")
+            return paths
+
+    log(f"Generating {spec.books} synthetic EPUBs in {corpus_dir}...")
+    corpus_dir.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(spec.seed)
+    for book, path in enumerate(paths, 1):
+        roll = rng.random()
+        if roll < spec.malformed:
+            container = "malformed"
+        elif roll < spec.malformed + spec.missing:
+            container = "missing"
+        else:
+            container = "ok"
+        path.write_bytes(make_epub(rng, book, spec, container))
+    manifest.write_text(json.dumps(asdict(spec), indent=2), encoding="utf-8")
+    return paths
+
+
+# ---------------------------- Stages ----------------------------
+
+
+def _find_opf(raw: bytes) -> None:
+    with zipfile.ZipFile(io.BytesIO(raw)) as z:
+        gutendex.find_opf_path(z)
+
+
+def _se_find_opf(raw: bytes) -> None:
+    with zipfile.ZipFile(io.BytesIO(raw)) as z:
+        standard_ebooks.find_opf_path(z)
+
+
+def _embed(raw: bytes, clean: bool = False) -> None:
+    gutendex.embed_kavita_metadata(
+        raw,
+        title="Synthetic Book",
+        authors=["Author"],
+        language="en",
+        subjects=["Fiction", "Adventure stories"],
+        collection_name="Adventure stories",
+        collection_position=1,
+        clean=clean,
+    )
+
+
+STAGES: Dict[str, Callable[[bytes], object]] = {
+    "baseline": lambda raw: None,  # just reads the files: the RSS floor for the others
+    "find_opf_path": _find_opf,
+    "clean": gutendex.clean_epub_bytes,
+    "embed": _embed,
+    "clean_embed": lambda raw: _embed(raw, clean=True),  # the single pass the Gutendex downloader makes
+    "se_find_opf_path": _se_find_opf,
+    "se_embed": lambda raw: standard_ebooks.embed_kavita_metadata(raw, ["Fiction", "Adventure"]),
+}
+
+
+def run_stage(stage: str, paths: List[Path], repeat: int) -> Dict[str, object]:
+    """
+    Time one stage over the whole corpus (best of `repeat` passes).
+
+    Runs in its own process; books are read one at a time, as the downloaders
+    see them, so peak RSS reflects the stage's working set.
+    """
+    fn = STAGES[stage]
+    best: Optional[List[float]] = None
+    errors = 0
+    total_bytes = 0
+    for _ in range(max(1, repeat)):
+        per_book: List[float] = []
+        errors = 0
+        total_bytes = 0
+        for path in paths:
+            raw = path.read_bytes()
+            total_bytes += len(raw)
+            started = time.perf_counter()
+            try:
+                fn(raw)
+            except Exception:
+                errors += 1
+            per_book.append(time.perf_counter() - started)
+        if best is None or sum(per_book) < sum(best):
+            best = per_book
+    elapsed = sum(best)
+    return {
+        "books": len(paths),
+        "errors": errors,
+        "seconds": round(elapsed, 6),
+        "books_per_s": round(len(paths) / elapsed, 2) if elapsed > 0 else None,
+        "mb_per_s": round(total_bytes / (1 << 20) / elapsed, 2) if elapsed > 0 else None,
+        "p50_ms": round(percentile(best, 50) * 1000, 3),
+        "p95_ms": round(percentile(best, 95) * 1000, 3),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+# ---------------------------- Reporting ----------------------------
+
+
+def log_results(stages: Dict[str, Dict[str, object]], previous: Optional[dict]) -> None:
+    log(f"{'stage':<17} {'books/s':>9} {'MB/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'RSS MB':>8}  errors")
+    for name, r in stages.items():
+        rss = f"{r['peak_rss_mb']:.1f}" if r["peak_rss_mb"] is not None else "-"
+        line = (f"{name:<17} {r['books_per_s'] or 0:>9.1f} {r['mb_per_s'] or 0:>8.1f} "
+                f"{r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {rss:>8}  {r['errors']}")
+        old = (previous or {}).get("stages", {}).get(name)
+        if old and old.get("books_per_s") and r["books_per_s"]:
+            line += f"  ({(r['books_per_s'] / old['books_per_s'] - 1) * 100:+.1f}% books/s)"
+        log(line)
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    defaults = CorpusSpec()
+    ap = argparse.ArgumentParser(
+        description="Benchmark the ebook pipeline stages on a synthetic EPUB corpus"
+    )
+    ap.add_argument("--books", type=int, default=defaults.books,
+                    help=f"EPUBs in the corpus (default: {defaults.books})")
+    ap.add_argument("--chapters", type=int, default=defaults.chapters,
+                    help=f"Chapters per book (default: {defaults.chapters})")
+    ap.add_argument("--chapter-kb", type=int, default=defaults.chapter_kb,
+                    help=f"Approximate XHTML size per chapter in KB (default: {defaults.chapter_kb})")
+    ap.add_argument("--images", type=int, default=defaults.images,
+                    help=f"Images per book (default: {defaults.images})")
+    ap.add_argument("--image-kb", type=int, default=defaults.image_kb,
+                    help=f"Size per image in KB (default: {defaults.image_kb})")
+    ap.add_argument("--boilerplate", type=float, default=defaults.boilerplate,
+                    help=f"Fraction of paragraphs that are Gutenberg boilerplate (default: {defaults.boilerplate})")
+    ap.add_argument("--malformed", type=float, default=defaults.malformed,
+                    help=f"Fraction of books with a malformed container.xml (default: {defaults.malformed})")
+    ap.add_argument("--missing", type=float, default=defaults.missing,
+                    help=f"Fraction of books with no container.xml (default: {defaults.missing})")
+    ap.add_argument("--seed", type=int, default=defaults.seed,
+                    help=f"Corpus random seed (default: {defaults.seed})")
+    ap.add_argument("--corpus", type=str, default="",
+                    help="Keep the corpus in this directory and reuse it on later runs (default: a temp dir)")
+    ap.add_argument("--repeat", type=int, default=3,
+                    help="Passes per stage; the fastest is reported (default: 3)")
+    ap.add_argument("--stages", type=str, default=",".join(STAGES),
+                    help=f"Comma-separated stages to run (default: {','.join(STAGES)})")
+    ap.add_argument("--json", type=str, default="",
+                    help=f"Result file (default: {DEFAULT_RESULTS_DIR}/ebook-bench-<timestamp>.json)")
+    ap.add_argument("--compare", type=str, default="",
+                    help="Earlier result file to compare books/sec against")
+    return ap.parse_args(argv)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = parse_args(argv)
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        log(f"Unknown stage(s): {', '.join(unknown)} (choose from {', '.join(STAGES)})")
+        return 2
+    spec = CorpusSpec(
+        books=args.books,
+        chapters=args.chapters,
+        chapter_kb=args.chapter_kb,
+        images=args.images,
+        image_kb=args.image_kb,
+        boilerplate=args.boilerplate,
+        malformed=args.malformed,
+        missing=args.missing,
+        seed=args.seed,
+    )
+    previous = json.loads(Path(args.compare).read_text(encoding="utf-8")) if args.compare else None
+
+    corpus_dir = Path(args.corpus) if args.corpus else Path(tempfile.mkdtemp(prefix="ebook-bench-"))
+    try:
+        paths = generate_corpus(spec, corpus_dir)
+        corpus_bytes = sum(p.stat().st_size for p in paths)
+        log(f"Corpus: {len(paths)} books, {corpus_bytes / (1 << 20):.1f} MB")
+
+        results: Dict[str, Dict[str, object]] = {}
+        # A fresh interpreter per stage keeps each peak RSS separate
+        ctx = multiprocessing.get_context("spawn")
+        for stage in stages:
+            log(f"Running {stage}...")
+            with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                results[stage] = pool.submit(run_stage, stage, paths, args.repeat).result()
+    finally:
+        if not args.corpus:
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+
+    log_results(results, previous)
+
+    out = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "corpus": dict(asdict(spec), total_mb=round(corpus_bytes / (1 << 20), 2)),
+        "repeat": args.repeat,
+        "stages": results,
+    }
+    json_path = Path(args.json) if args.json else Path(DEFAULT_RESULTS_DIR) / f"ebook-bench-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    json_path.parent.mkdir(parents=True, exist_ok=True)
+    json_path.write_text(json.dumps(out, indent=2), encoding="utf-8")
+    log(f"Results: {json_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
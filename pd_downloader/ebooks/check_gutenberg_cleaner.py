@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Gutenberg Cleaner Check
+Compares the Gutenberg boilerplate cleaner in gutendex_selfhosted_to_kavita.py
+with the original nine `re.sub` passes it replaced, member by member.
+
+Members that mention "gutenberg" must come out byte-for-byte identical to
+what the original cleaner produced.  Members that do not are now left as
+they are (the original only normalized their newlines and stripped
+surrounding whitespace), so for those the check is that they are unchanged.
+
+The corpus is any EPUBs given on the command line (files or directories,
+e.g. a folder of downloaded Gutenberg books), the synthetic books of
+benchmark_ebook_pipeline.py, and randomized documents built from boilerplate
+fragments that exercise the edge cases of the lazy DOTALL patterns.  Exits 1
+if any member differs.  Nothing touches the network.
+"""
+
+import argparse
+import io
+import random
+import re
+import sys
+import zipfile
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import benchmark_ebook_pipeline as bench
+import gutendex_selfhosted_to_kavita as gutendex
+
+# ---------------------------- Config ----------------------------
+
+MAX_REPORTED = 10
+
+# Pieces the randomized documents are assembled from: tag openers and
+# closers, comment and banner delimiters, every spelling the rules look for
+# and near misses, and all three newline styles.
+FRAGMENTS = (
+    "<p>", "</p>", "<p class=\"x\">", "<div>", "</div>", "<DIV id=a>", "<span>", "</span>",
+    "<section>", "</section>", "<footer>", "</footer>", "<pre>", "</pre>", "<", ">",
+    "<!--", "-->", "<!-- ", " -->", "***", "*** ", "* **", "*** START OF", "***\nend of",
+    "start of", "END OF", "Project Gutenberg", "PROJECT\nGUTENBERG", "project  gutenberg",
+    "project gutenberg", "projectgutenberg", "Gutenberg", "gutenberg-tm", "Gutenberg-TM",
+    "gutenberg.org", "www.gutenberg.org", "full Project Gutenberg-tm License",
+    'href="https://www.gutenberg.org/ebooks/1"', 'href="http://example.com/"', 'href="http://gutenberg',
+    "\r\n", "\r", "\n", " ", "\t", "text", "Chapter I", "é", "—",
+)
+
+
+# ---------------------------- Helpers ----------------------------
+
+
+def log(msg: str) -> None:
+    print(f"[cleaner-check] {msg}", flush=True)
+
+
+def first_difference(a: bytes, b: bytes) -> int:
+    for i, (x, y) in enumerate(zip(a, b)):
+        if x != y:
+            return i
+    return min(len(a), len(b))
+
+
+# ---------------------------- Reference cleaner ----------------------------
+
+
+def reference_strip(html: str) -> str:
+    """strip_headers_footers_html() as it was before the linear scanners."""
+    s = html.replace("\r\n", "\n").replace("\r", "\n")
+    s = re.sub(r"(?is)<!--.*?project gutenberg.*?-->", "", s)
+    s = re.sub(
+        r"(?is)<(div|p|span|section|footer)[^>]*>.*?project gutenberg.*?</\1>", "", s
+    )
+    s = re.sub(r"(?is)\*{3}\s*start of.*?project gutenberg.*?\*{3}", "", s)
+    s = re.sub(r"(?is)\*{3}\s*end of.*?project gutenberg.*?\*{3}", "", s)
+    s = re.sub(r'(?is)href="https?://[^"]*gutenberg[^"]*"', 'href="#"', s)
+    s = re.sub(r"(?is)project\s+gutenberg", "", s)
+    s = re.sub(r"(?is)gutenberg\-tm", "", s)
+    s = re.sub(r"(?is)gutenberg\.org", "", s)
+    return s.strip()
+
+
+def reference_clean(data: bytes) -> Optional[bytes]:
+    """One text member as the original clean_epub_bytes() wrote it; None if it was kept as is."""
+    for enc in ("utf-8", "windows-1252", "latin-1"):
+        try:
+            txt = data.decode(enc)
+            break
+        except UnicodeDecodeError:
+            continue
+    else:
+        return None
+    cleaned = reference_strip(txt)
+    for pat in gutendex.TRADEMARK_TERMS:
+        cleaned = re.sub(pat, "", cleaned, flags=re.IGNORECASE)
+    return cleaned.encode("utf-8")
+
+
+def expected(data: bytes) -> bytes:
+    if b"gutenberg" not in data.lower():
+        return data
+    ref = reference_clean(data)
+    return data if ref is None else ref
+
+
+# ---------------------------- Corpus ----------------------------
+
+
+def epub_paths(args: Sequence[str]) -> List[Path]:
+    paths: List[Path] = []
+    for arg in args:
+        p = Path(arg)
+        paths += sorted(p.rglob("*.epub")) if p.is_dir() else [p]
+    return paths
+
+
+def random_documents(count: int, seed: int) -> Iterator[Tuple[str, bytes]]:
+    rng = random.Random(seed)
+    for i in range(count):
+        parts = [rng.choice(FRAGMENTS) for _ in range(rng.randint(1, 40))]
+        enc = "utf-8" if rng.random() < 0.9 else "windows-1252"
+        yield f"random-{i}.xhtml", "".join(parts).encode(enc)
+
+
+def synthetic_epubs(count: int, seed: int) -> Iterator[Tuple[str, bytes]]:
+    rng = random.Random(seed)
+    spec = bench.CorpusSpec(books=count, chapters=4, chapter_kb=8, images=0, boilerplate=0.2, seed=seed)
+    for book in range(1, count + 1):
+        yield f"synthetic-{book}.epub", bench.make_epub(rng, book, spec, "ok")
+
+
+# ---------------------------- Checks ----------------------------
+
+
+class Checker:
+    def __init__(self) -> None:
+        self.members = 0
+        self.cleaned = 0
+        self.mismatches: List[str] = []
+
+    def member(self, label: str, data: bytes, actual: bytes) -> None:
+        self.members += 1
+        want = expected(data)
+        if want is not data:
+            self.cleaned += 1
+        if actual != want:
+            at = first_difference(actual, want)
+            self.mismatches.append(
+                f"{label}: differs at byte {at}: got {actual[max(0, at - 20):at + 40]!r}, "
+                f"expected {want[max(0, at - 20):at + 40]!r}"
+            )
+
+    def epub(self, label: str, raw: bytes) -> None:
+        """Both the per-member cleaner and the whole-archive pass the downloader makes."""
+        cleaned = gutendex.clean_epub_bytes(raw)
+        with zipfile.ZipFile(io.BytesIO(raw)) as zin, zipfile.ZipFile(io.BytesIO(cleaned)) as zout:
+            for info in zin.infolist():
+                if not info.filename.lower().endswith(gutendex.TEXT_EXTS):
+                    continue
+                data = zin.read(info)
+                self.member(f"{label}:{info.filename}", data, gutendex.clean_member(info.filename, data))
+                self.member(f"{label}:{info.filename} (archive)", data, zout.read(info.filename))
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    ap = argparse.ArgumentParser(
+        description="Check the Gutenberg cleaner against the original regex passes"
+    )
+    ap.add_argument("epubs", nargs="*",
+                    help="EPUB files or directories of EPUBs to check (e.g. downloaded Gutenberg books)")
+    ap.add_argument("--random", type=int, default=100000,
+                    help="Randomized fragment documents to check (default: 100000)")
+    ap.add_argument("--synthetic", type=int, default=20,
+                    help="Synthetic benchmark EPUBs to check (default: 20)")
+    ap.add_argument("--seed", type=int, default=1,
+                    help="Random seed (default: 1)")
+    return ap.parse_args(argv)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = parse_args(argv)
+    check = Checker()
+
+    for path in epub_paths(args.epubs):
+        try:
+            raw = path.read_bytes()
+            zipfile.ZipFile(io.BytesIO(raw)).close()
+        except (OSError, zipfile.BadZipFile) as e:
+            log(f"Skipping {path}: {e}")
+            continue
+        check.epub(path.name, raw)
+    for label, raw in synthetic_epubs(args.synthetic, args.seed):
+        check.epub(label, raw)
+    for label, data in random_documents(args.random, args.seed):
+        check.member(label, data, gutendex.clean_member(label, data))
+
+    log(f"{check.members} member(s) checked, {check.cleaned} cleaned, "
+        f"{check.members - check.cleaned} left as they are")
+    if check.mismatches:
+        for line in check.mismatches[:MAX_REPORTED]:
+            log(f"  {line}")
+        log(f"{len(check.mismatches)} mismatch(es)")
+        return 1
+    log("Output matches the original cleaner")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Download Helpers
+Pieces shared by the Gutendex, Standard Ebooks and music downloaders.  The
+scripts import this module from their own directory (the music downloader
+adds ../ebooks to its path), so keep it next to them when copying them
+elsewhere.  Only the standard library is used here.
+"""
+
+import copy
+import csv
+import email.utils
+import math
+import os
+import struct
+import threading
+import time
+import zipfile
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Sequence
+from urllib.parse import urlparse
+
+if TYPE_CHECKING:
+    import requests
+
+# ---------------------------- Request pacing ----------------------------
+
+DEFAULT_BURST = 1
+DEFAULT_RETRY_AFTER = 5.0  # 429/503 without a usable Retry-After header
+MAX_RETRY_AFTER = 300.0
+
+
+def parse_retry_after(value: Optional[str]) -> float:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)."""
+    delay = DEFAULT_RETRY_AFTER
+    if value:
+        try:
+            delay = float(value)
+        except ValueError:
+            try:
+                delay = email.utils.parsedate_to_datetime(value).timestamp() - time.time()
+            except (TypeError, ValueError):
+                pass
+    return min(max(delay, 0.0), MAX_RETRY_AFTER)
+
+
+class RateLimiter:
+    """
+    Per-host token bucket: `rate` requests per second, bursts of up to `burst`.
+
+    acquire() waits only as long as the host's budget requires; a rate of 0
+    means no limit.  defer() pauses a host that answered 429/503 until its
+    Retry-After has passed.  Safe to share between threads.
+    """
+
+    def __init__(self, rate: float, burst: int = DEFAULT_BURST):
+        self.rate = max(rate, 0.0)
+        self.burst = max(1, burst)
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, List[float]] = {}  # host -> [tokens, refilled_at, paused_until]
+
+    def _bucket(self, url: str, now: float) -> List[float]:
+        host = urlparse(url).netloc.lower()
+        return self._buckets.setdefault(host, [float(self.burst), now, 0.0])
+
+    def acquire(self, url: str) -> float:
+        """Take a request token for `url`'s host, sleeping if needed; returns seconds waited."""
+        with self._lock:
+            now = time.monotonic()
+            bucket = self._bucket(url, now)
+            wait = bucket[2] - now
+            if self.rate > 0:
+                # Tokens may go negative: each waiter reserves its own future slot
+                bucket[0] = min(float(self.burst), bucket[0] + (now - bucket[1]) * self.rate) - 1
+                bucket[1] = now
+                if bucket[0] < 0:
+                    wait = max(wait, -bucket[0] / self.rate)
+        if wait > 0:
+            time.sleep(wait)
+            return wait
+        return 0.0
+
+    def defer(self, response: Optional["requests.Response"]) -> Optional[float]:
+        """Pause the host after a 429/503; returns the Retry-After delay, or None."""
+        if response is None or response.status_code not in (429, 503):
+            return None
+        delay = parse_retry_after(response.headers.get("Retry-After"))
+        with self._lock:
+            now = time.monotonic()
+            bucket = self._bucket(response.url, now)
+            bucket[0] = min(bucket[0], 0.0)
+            bucket[2] = max(bucket[2], now + delay)
+        return delay
+
+
+# ---------------------------- Reports ----------------------------
+
+# Report CSVs are flushed (and fsynced) at least this often while a run is going
+REPORT_FLUSH_ROWS = 50
+REPORT_FLUSH_SECONDS = 5.0
+
+
+class ReportWriter:
+    """
+    CSV report written row by row as books finish.
+
+    Rows go to `<name>.part` next to the final file through a buffered writer
+    that is flushed and fsynced every REPORT_FLUSH_ROWS rows or
+    REPORT_FLUSH_SECONDS, so a crash loses at most the unflushed tail and the
+    previous report stays intact.  close() (also on leaving a `with` block
+    normally) flushes and atomically renames the .part over the final path;
+    if the block raises, the partial rows are kept in the .part file and the
+    previous report is left in place.
+    """
+
+    def __init__(self, path: Path, fieldnames: List[str]):
+        self.path = path
+        self.part_path = path.with_name(path.name + ".part")
+        self._f = self.part_path.open("w", newline="", encoding="utf-8", buffering=1 << 16)
+        self._writer = csv.DictWriter(self._f, fieldnames=fieldnames)
+        self._writer.writeheader()
+        self._pending = 0
+        self._flushed_at = time.monotonic()
+
+    def write(self, row: Dict[str, str]) -> None:
+        self._writer.writerow(row)
+        self._pending += 1
+        if self._pending >= REPORT_FLUSH_ROWS or time.monotonic() - self._flushed_at >= REPORT_FLUSH_SECONDS:
+            self.flush()
+
+    def flush(self) -> None:
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._pending = 0
+        self._flushed_at = time.monotonic()
+
+    def close(self, complete: bool = True) -> None:
+        if self._f.closed:
+            return
+        self.flush()
+        self._f.close()
+        if complete:
+            os.replace(self.part_path, self.path)
+
+    def __enter__(self) -> "ReportWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close(complete=exc[0] is None)
+
+
+# ---------------------------- Stage timings ----------------------------
+
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    """Nearest-rank percentile of a non-empty sequence."""
+    ordered = sorted(values)
+    k = math.ceil(pct / 100 * len(ordered)) - 1
+    return ordered[max(0, min(len(ordered) - 1, k))]
+
+
+def log_stage_summary(
+    log: Callable[[str], None],
+    stages: Sequence[str],
+    stage_values: Dict[str, Sequence[float]],
+    books: int,
+    total_bytes: int,
+    elapsed_s: float,
+) -> None:
+    """Print p50/p95/max per stage and overall throughput for the books a run processed."""
+    if not books:
+        return
+    log("Stage timings (seconds):")
+    for stage in stages:
+        values = stage_values.get(stage)
+        if values:
+            log(
+                f"  {stage:<9} p50 {percentile(values, 50):7.3f}  "
+                f"p95 {percentile(values, 95):7.3f}  max {max(values):7.3f}"
+            )
+    if elapsed_s > 0:
+        log(
+            f"Throughput: {books / elapsed_s * 60:.1f} books/min, "
+            f"{total_bytes / elapsed_s / (1 << 20):.2f} MB/s downloaded"
+        )
+
+
+# ---------------------------- EPUB archives ----------------------------
+
+# ZipFile attributes copy_member_raw() updates the way ZipFile.writestr() does
+_ZIP_WRITER_STATE = ("fp", "start_dir", "filelist", "NameToInfo", "_didModify")
+
+
+def _strip_zip64_extra(extra: bytes) -> bytes:
+    out = b""
+    i = 0
+    while i + 4 <= len(extra):
+        tp, ln = struct.unpack("<HH", extra[i:i + 4])
+        if tp != 1:
+            out += extra[i:i + 4 + ln]
+        i += 4 + ln
+    return out
+
+
+def _can_copy_raw(zin: zipfile.ZipFile, zout: zipfile.ZipFile) -> bool:
+    if getattr(zin, "fp", None) is None or not all(hasattr(zout, name) for name in _ZIP_WRITER_STATE):
+        return False
+    if zout.fp is None or getattr(zout, "_writing", False):
+        return False
+    try:
+        return zout.fp.seekable() and zin.fp.seekable()
+    except (AttributeError, ValueError):
+        return False
+
+
+def copy_member_raw(zin: zipfile.ZipFile, zout: zipfile.ZipFile, info: zipfile.ZipInfo) -> None:
+    """
+    Copy one member's compressed bytes verbatim, without inflating or deflating.
+
+    zipfile has no public API for this, so the local header is located by hand
+    and the copied entry is registered with `zout` the same way
+    ZipFile.writestr() does internally.  CRC, sizes, timestamps and extra fields
+    are carried over unchanged.  When `zout` does not have the writer state
+    this relies on (another Python version, an unseekable file), the member is
+    recompressed with writestr() instead.  `zout` is only updated once the
+    whole member has been copied; a truncated source leaves it as it was.
+    """
+    if not _can_copy_raw(zin, zout):
+        zout.writestr(info, zin.read(info))
+        return
+    zin.fp.seek(info.header_offset)
+    fheader = zin.fp.read(zipfile.sizeFileHeader)
+    if len(fheader) != zipfile.sizeFileHeader or fheader[:4] != b"PK\x03\x04":
+        zout.writestr(info, zin.read(info))
+        return
+    fname_len, extra_len = struct.unpack("<HH", fheader[26:30])
+    zin.fp.seek(info.header_offset + zipfile.sizeFileHeader + fname_len + extra_len)
+
+    new = copy.copy(info)
+    new.extra = _strip_zip64_extra(info.extra)
+    new.flag_bits &= ~0x08  # sizes are known up front, no data descriptor
+    zout.fp.seek(zout.start_dir)
+    new.header_offset = zout.fp.tell()
+    try:
+        zout.fp.write(new.FileHeader())
+        remaining = info.compress_size
+        while remaining > 0:
+            chunk = zin.fp.read(min(remaining, 1 << 20))
+            if not chunk:
+                raise zipfile.BadZipFile(f"Truncated member {info.filename!r}")
+            zout.fp.write(chunk)
+            remaining -= len(chunk)
+    except BaseException:
+        # Drop the partial entry so the archive written so far stays valid
+        zout.fp.seek(zout.start_dir)
+        zout.fp.truncate()
+        raise
+    zout.filelist.append(new)
+    zout.NameToInfo[new.filename] = new
+    zout.start_dir = zout.fp.tell()
+    zout._didModify = True
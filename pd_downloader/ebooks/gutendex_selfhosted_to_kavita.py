@@ -11,22 +11,42 @@ See SELF_HOST_GUTENDEX.md for setup instructions.
 """
 
 import argparse
+import array
 import csv
+import hashlib
+import heapq
 import io
+import json
+import multiprocessing
 import os
 import random
 import re
+import sqlite3
+import tarfile
+import tempfile
+import threading
 import time
 import zipfile
-from dataclasses import dataclass
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from functools import partial
+from dataclasses import dataclass, field
 from html import unescape
 from pathlib import Path
-from typing import Dict, Iterable, List, Optional, Sequence, Tuple
-from urllib.parse import urlparse
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import urlencode, urlparse
 
 import requests
 from lxml import etree
 
+from download_common import DEFAULT_BURST, RateLimiter, ReportWriter, copy_member_raw, log_stage_summary
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None  # only needed for --optimize-images
+
 # ---------------------------- Config ----------------------------
 
 # Default to local Gutendex instance
@@ -40,6 +60,44 @@ INITIAL_BACKOFF = 0.5
 MAX_BACKOFF = 5.0
 REQUEST_TIMEOUT = 30
 
+# Mirror pool (--mirror takes a comma-separated list)
+MIRROR_PROBE_BYTES = 256 * 1024  # read this much of a sample EPUB per mirror at startup
+MIRROR_EWMA_ALPHA = 0.3  # weight of the newest throughput sample
+MIRROR_COOLDOWN = 60.0  # seconds a failing mirror is ranked last
+
+# Storage budget (--budget-gb): each book is fetched as one of these EPUB variants
+VARIANTS = ("images", "noimages")
+UNKNOWN_EPUB_BYTES = 8 << 20  # budgeted for a book no size probe answered, when no other size is known
+LIBRARY_FILE_RE = re.compile(r"Gutenberg(\d+)\.epub$")
+
+# Download pipeline defaults
+DEFAULT_WORKERS = 1
+DEFAULT_MAX_PER_HOST = 2
+DEFAULT_MAX_MEMORY_MB = 16  # per download; larger EPUBs spill to a temp file
+DOWNLOAD_SUFFIX = ".epub.download"  # downloads handed to the transform processes by path
+
+# Gutendex response cache defaults
+DEFAULT_CACHE_TTL_HOURS = 24.0
+DEFAULT_CACHE_MAX_MB = 64
+
+# Per-book stages timed in the report and the end-of-run summary
+STAGES = ("query", "download", "clean", "images", "embed", "write")
+
+# Image optimisation (--optimize-images, needs Pillow)
+DEFAULT_IMAGE_MAX_DIM = 1600  # px, longest side
+DEFAULT_JPEG_QUALITY = 80
+IMAGE_EXTS = (".jpg", ".jpeg", ".png")
+IMAGE_MIN_BYTES = 64 * 1024  # smaller images are copied as they are
+PNG_TO_JPEG_MIN_BYTES = 256 * 1024  # only PNGs this heavy are considered for JPEG
+PNG_TO_JPEG_RATIO = 0.5  # ...and only converted if the JPEG is at most half the size
+
+# Subject discovery (--mode discover)
+DISCOVER_PAGES = 50
+DEFAULT_DISCOVER_WORKERS = 4
+
+# --ids-file: IDs per Gutendex `ids=` request (one full results page)
+IDS_BATCH = 32
+
 # Trademark cleanup patterns
 TRADEMARK_TERMS = [
     r"project\s+gutenberg",
@@ -48,6 +106,7 @@ TRADEMARK_TERMS = [
     r"gutenberg\.org",
     r"full project gutenberg\-tm license",
 ]
+TRADEMARK_RES = [re.compile(pat, re.IGNORECASE) for pat in TRADEMARK_TERMS]
 
 # Namespaces for EPUB/OPF/DC
 NSMAP = {
@@ -56,6 +115,16 @@ NSMAP = {
     "dc": "http://purl.org/dc/elements/1.1/",
 }
 
+# Offline catalog (--catalog): Project Gutenberg RDF namespaces
+RDF_NS = {
+    "rdf": "http://www.w3.org/1999/02/22-rdf-syntax-ns#",
+    "dcterms": "http://purl.org/dc/terms/",
+    "dcam": "http://purl.org/dc/dcam/",
+    "pgterms": "http://www.gutenberg.org/2009/pgterms/",
+}
+GUTENBERG_EBOOKS_URL = "https://www.gutenberg.org/ebooks"
+OFFLINE_PAGE_SIZE = 32  # same page size Gutendex serves
+
 # ---------------------------- Helpers ----------------------------
 
 session = requests.Session()
@@ -66,16 +135,29 @@ def log(msg: str) -> None:
     print(f"[gutendex-self-hosted] {msg}", flush=True)
 
 
+# Replaced in run() with the configured per-host budget
+rate_limiter = RateLimiter(0)
+
+
+def is_client_error(e: Exception) -> bool:
+    """True for 4xx responses (other than 429) that retrying will not fix."""
+    status = getattr(getattr(e, "response", None), "status_code", None)
+    return status is not None and 400 <= status < 500 and status != 429
+
+
 def retry_with_backoff(func, *args, **kwargs):
     """Retry a function with exponential backoff."""
     for attempt in range(MAX_RETRIES):
         try:
             return func(*args, **kwargs)
         except requests.exceptions.RequestException as e:
-            if attempt == MAX_RETRIES - 1:
+            if attempt == MAX_RETRIES - 1 or is_client_error(e):
                 raise
             
             backoff = min(INITIAL_BACKOFF * (2 ** attempt), MAX_BACKOFF)
+            retry_after = rate_limiter.defer(getattr(e, "response", None))
+            if retry_after is not None:
+                backoff = retry_after  # the server said how long; other threads wait too
             status_code = getattr(e.response, 'status_code', None) if hasattr(e, 'response') else None
             log(f"Request failed (attempt {attempt + 1}/{MAX_RETRIES}): {e}")
             if status_code:
@@ -98,12 +180,117 @@ def series_folder_from_meta(title: str, series: Optional[str]) -> str:
     return slugify(base) or "Untitled"
 
 
-def ensure_dirs(base_out: Path) -> Dict[str, Path]:
+def ensure_dirs(base_out: Path, shard: Optional[Tuple[int, int]] = None) -> Dict[str, Path]:
     reports = base_out / "_reports"
+    if shard is not None:
+        # Shards share the library but keep their reports, journal and caches apart
+        reports = reports / shard_dir_name(shard)
     reports.mkdir(parents=True, exist_ok=True)
     return {"reports": reports}
 
 
+# ---------------------------- Gutendex response cache ----------------------------
+
+
+class ResponseCache:
+    """
+    On-disk cache of Gutendex JSON responses, keyed by URL + normalized params.
+
+    Entries older than `ttl_s` are refetched; once the stored bodies exceed
+    `max_bytes` the least recently used entries are evicted.  With `refresh`
+    set, lookups always miss but fresh responses are still stored.
+    """
+
+    FILENAME = "gutendex_cache.sqlite3"
+
+    def __init__(self, reports_dir: Path, ttl_s: float, max_bytes: int, refresh: bool = False):
+        self.path = reports_dir / self.FILENAME
+        self.ttl_s = ttl_s
+        self.max_bytes = max_bytes
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                fetched_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )"""
+        )
+        self._db.commit()
+
+    @staticmethod
+    def key(url: str, params: Optional[Dict[str, object]]) -> str:
+        items = sorted((str(k), str(v)) for k, v in (params or {}).items())
+        return f"{url.rstrip('/')}?{urlencode(items)}"
+
+    def get(self, key: str) -> Optional[dict]:
+        if self.refresh:
+            self.misses += 1
+            return None
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT body FROM responses WHERE key = ? AND fetched_at > ?",
+                (key, now - self.ttl_s),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, data: dict) -> None:
+        body = json.dumps(data, separators=(",", ":")).encode("utf-8")
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, body, size, fetched_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, body, len(body), now, now),
+            )
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                rows = self._db.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall()
+                evict = []
+                for k, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    evict.append((k,))
+                    total -= size
+                self._db.executemany("DELETE FROM responses WHERE key = ?", evict)
+            self._db.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+# Set by run() when caching is enabled
+response_cache: Optional[ResponseCache] = None
+
+
+def gutendex_get(url: str, params: Optional[Dict[str, object]] = None, timeout: float = REQUEST_TIMEOUT) -> dict:
+    """GET a Gutendex JSON endpoint, answering from `response_cache` when possible."""
+    cache = response_cache
+    key = ResponseCache.key(url, params) if cache else ""
+    if cache:
+        data = cache.get(key)
+        if data is not None:
+            return data
+    r = session.get(url, params=params, timeout=timeout)
+    r.raise_for_status()
+    data = r.json()
+    if cache:
+        cache.put(key, data)
+    return data
+
+
 # ---------------------------- Gutendex API queries ----------------------------
 
 
@@ -112,9 +299,7 @@ def test_gutendex_connection(api_url: str) -> bool:
     try:
         # Try to fetch just one book to test connection
         test_url = api_url.rstrip('/books') if api_url.endswith('/books') else api_url
-        r = session.get(f"{test_url}/books", params={"page_size": 1}, timeout=10)
-        r.raise_for_status()
-        data = r.json()
+        data = gutendex_get(f"{test_url}/books", {"page_size": 1}, timeout=10)
         count = data.get("count", 0)
         log(f"✓ Gutendex API connected: {count:,} books available")
         return True
@@ -138,12 +323,7 @@ def topic_query_epub(api_url: str, topic: str, languages: str, page: int = 1) ->
         "page": page,
     }
     
-    def _fetch():
-        r = session.get(api_url, params=params, timeout=REQUEST_TIMEOUT)
-        r.raise_for_status()
-        return r.json()
-    
-    return retry_with_backoff(_fetch)
+    return retry_with_backoff(gutendex_get, api_url, params)
 
 
 def get_popular_books(api_url: str, languages: str, limit: int, debug: bool = False) -> List[dict]:
@@ -162,20 +342,14 @@ def get_popular_books(api_url: str, languages: str, limit: int, debug: bool = Fa
     while len(books) < limit:
         params["page"] = page
         
-        def _fetch():
-            r = session.get(api_url, params=params, timeout=REQUEST_TIMEOUT)
-            r.raise_for_status()
-            return r.json()
-        
         try:
-            data = retry_with_backoff(_fetch)
+            data = retry_with_backoff(gutendex_get, api_url, params)
             results = data.get("results", [])
             if not results:
                 break
             
             # Debug: print first book's data
             if debug and len(books) == 0 and results:
-                import json
                 log("=" * 70)
                 log("DEBUG: First book data from API:")
                 log("=" * 70)
@@ -195,13 +369,233 @@ def get_popular_books(api_url: str, languages: str, limit: int, debug: bool = Fa
     return books[:limit]
 
 
-def get_all_subjects(api_url: str, languages: str, min_books: int = 10) -> List[Tuple[str, int]]:
+def iter_all_books(api_url: str, languages: str) -> Iterator[dict]:
+    """
+    Every EPUB in `languages`, in ascending Gutenberg ID order.
+
+    ID order rather than popularity keeps a book's position stable while
+    download counts drift and new books are added, which sharded runs rely on.
+    Stops at the first page that still fails after retries.
+    """
+    params = {
+        "mime_type": "application/epub+zip",
+        "languages": languages,
+        "copyright": "false",
+        "sort": "ascending",
+        "page": 1,
+    }
+    page = 1
+    while True:
+        params["page"] = page
+        try:
+            data = retry_with_backoff(gutendex_get, api_url, params)
+        except Exception as e:
+            log(f"  ERROR: Failed to fetch catalog page {page}: {e}")
+            log("  Stopping the catalog walk here")
+            return
+        yield from data.get("results", [])
+        if not data.get("next"):
+            return
+        page += 1
+
+
+_IDS_URL_RE = re.compile(r"/ebooks/(\d+)|/epub/(\d+)/")
+
+
+def read_ids_file(path: Path) -> List[int]:
+    """
+    Gutenberg IDs from a curated list, in file order without duplicates.
+
+    Entries are separated by whitespace or commas; each is a bare ID or a
+    gutenberg.org URL (`/ebooks/<id>` or `/cache/epub/<id>/...`).  `#` starts
+    a comment.  Entries that are neither are logged and ignored.
+    """
+    ids: Dict[int, None] = {}
+    for lineno, line in enumerate(path.read_text(encoding="utf-8").splitlines(), 1):
+        for token in re.split(r"[\s,]+", line.split("#", 1)[0].strip()):
+            if not token:
+                continue
+            if token.isdigit():
+                ids.setdefault(int(token), None)
+                continue
+            m = _IDS_URL_RE.search(token)
+            if m:
+                ids.setdefault(int(m.group(1) or m.group(2)), None)
+            else:
+                log(f"  ⚠ {path.name}:{lineno}: no Gutenberg ID in '{token}', ignored")
+    return list(ids)
+
+
+def get_books_by_ids(api_url: str, ids: List[int], workers: int = DEFAULT_DISCOVER_WORKERS) -> List[dict]:
+    """
+    Resolve Gutenberg IDs with Gutendex's `ids=` filter, returned in `ids` order.
+
+    IDs go out IDS_BATCH at a time (a full results page, so normally one
+    request per batch) with up to `workers` requests in flight.  IDs Gutendex
+    does not know are logged and left out.
+    """
+    batches = [ids[i:i + IDS_BATCH] for i in range(0, len(ids), IDS_BATCH)]
+
+    def _batch(batch: List[int]) -> List[dict]:
+        params = {"ids": ",".join(str(gid) for gid in batch), "page": 1}
+        found: List[dict] = []
+        while True:
+            data = retry_with_backoff(gutendex_get, api_url, params)
+            found.extend(data.get("results", []))
+            if not data.get("next"):
+                return found
+            params["page"] += 1
+
+    log(f"  Resolving {len(ids)} IDs in {len(batches)} request(s)...")
+    by_id: Dict[int, dict] = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="ids") as pool:
+        for batch, fut in zip(batches, [pool.submit(_batch, batch) for batch in batches]):
+            try:
+                for b in fut.result():
+                    by_id[b.get("id")] = b
+            except Exception as e:
+                log(f"  ERROR: Failed to resolve IDs {batch[0]}..{batch[-1]}: {e}")
+    missing = [gid for gid in ids if gid not in by_id]
+    if missing:
+        log(f"  {len(missing)} ID(s) not found: {', '.join(map(str, missing[:20]))}{' ...' if len(missing) > 20 else ''}")
+    return [by_id[gid] for gid in ids if gid in by_id]
+
+
+class SubjectIndex:
+    """
+    Subject/bookshelf -> book index built from Gutendex discovery pages.
+
+    Pages are merged in as they arrive, and each book's subjects are stored
+    against its Gutenberg ID. Refetching a page, or seeing a book again on a
+    different page, therefore never double counts. Each page's book list is
+    kept too: a refetched page replaces it, and books no longer on any page
+    (they dropped out of the sampled popularity ranks) are forgotten, so the
+    counts follow the current sample instead of growing run after run. A
+    persistent index (in `_reports/subject_index.sqlite3`) lets later runs
+    fetch only the pages that are missing or older than `max_age_s`. Pass
+    `reports_dir=None` for a throwaway in-memory index.
+    """
+
+    FILENAME = "subject_index.sqlite3"
+
+    def __init__(self, reports_dir: Optional[Path]):
+        target = str(reports_dir / self.FILENAME) if reports_dir else ":memory:"
+        self._db = sqlite3.connect(target)
+        had_members = self._db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'page_books'"
+        ).fetchone()
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS pages (
+                languages TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                fetched_at REAL NOT NULL,
+                is_last INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (languages, page)
+            );
+            CREATE TABLE IF NOT EXISTS book_subjects (
+                languages TEXT NOT NULL,
+                gutenberg_id INTEGER NOT NULL,
+                subject TEXT NOT NULL,
+                PRIMARY KEY (languages, gutenberg_id, subject)
+            );
+            CREATE TABLE IF NOT EXISTS page_books (
+                languages TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                gutenberg_id INTEGER NOT NULL,
+                PRIMARY KEY (languages, page, gutenberg_id)
+            );
+            """
+        )
+        if not had_members:
+            # Indexes from before page membership was kept cannot be pruned; start over
+            self._db.execute("DELETE FROM pages")
+            self._db.execute("DELETE FROM book_subjects")
+        self._db.commit()
+
+    def fresh_pages(self, languages: str, max_age_s: float) -> Dict[int, bool]:
+        """{page: is_last_page} for pages fetched within `max_age_s`."""
+        rows = self._db.execute(
+            "SELECT page, is_last FROM pages WHERE languages = ? AND fetched_at > ?",
+            (languages, time.time() - max_age_s),
+        ).fetchall()
+        return {page: bool(is_last) for page, is_last in rows}
+
+    def merge_page(self, languages: str, page: int, books: List[dict], is_last: bool = False) -> None:
+        self._db.execute("DELETE FROM page_books WHERE languages = ? AND page = ?", (languages, page))
+        for book in books:
+            gid = book.get("id")
+            if gid is None:
+                continue
+            self._db.execute(
+                "INSERT OR IGNORE INTO page_books (languages, page, gutenberg_id) VALUES (?, ?, ?)",
+                (languages, page, gid),
+            )
+            # Subjects + bookshelves, replacing whatever this book had before
+            labels = set(book.get("subjects", [])) | set(book.get("bookshelves", []))
+            self._db.execute(
+                "DELETE FROM book_subjects WHERE languages = ? AND gutenberg_id = ?", (languages, gid)
+            )
+            self._db.executemany(
+                "INSERT OR IGNORE INTO book_subjects (languages, gutenberg_id, subject) VALUES (?, ?, ?)",
+                [(languages, gid, label) for label in labels],
+            )
+        self._db.execute(
+            "INSERT OR REPLACE INTO pages (languages, page, fetched_at, is_last) VALUES (?, ?, ?, ?)",
+            (languages, page, time.time(), int(is_last)),
+        )
+        self._forget_unlisted(languages)
+        self._db.commit()
+
+    def trim(self, languages: str, last_page: int) -> None:
+        """Drop pages past `last_page` (the sample shrank) and the books only they listed."""
+        self._db.execute("DELETE FROM pages WHERE languages = ? AND page > ?", (languages, last_page))
+        self._db.execute("DELETE FROM page_books WHERE languages = ? AND page > ?", (languages, last_page))
+        self._forget_unlisted(languages)
+        self._db.commit()
+
+    def _forget_unlisted(self, languages: str) -> None:
+        self._db.execute(
+            """DELETE FROM book_subjects WHERE languages = ? AND gutenberg_id NOT IN
+               (SELECT gutenberg_id FROM page_books WHERE languages = ?)""",
+            (languages, languages),
+        )
+
+    def counts(self, languages: str, min_books: int) -> List[Tuple[str, int]]:
+        return [
+            (subject, count)
+            for subject, count in self._db.execute(
+                """SELECT subject, COUNT(*) AS n FROM book_subjects WHERE languages = ?
+                   GROUP BY subject HAVING n >= ? ORDER BY n DESC, subject""",
+                (languages, min_books),
+            )
+        ]
+
+    def close(self) -> None:
+        self._db.close()
+
+
+def get_all_subjects(
+    api_url: str,
+    languages: str,
+    min_books: int = 10,
+    index: Optional[SubjectIndex] = None,
+    workers: int = DEFAULT_DISCOVER_WORKERS,
+    max_age_s: float = DEFAULT_CACHE_TTL_HOURS * 3600,
+) -> List[Tuple[str, int]]:
     """
     Get all subjects/genres with book counts from Gutendex.
     Returns list of (subject_name, book_count) tuples.
+
+    The first `DISCOVER_PAGES` popularity pages are fetched concurrently and
+    merged into `index`.  Pages the index already holds (younger than
+    `max_age_s`) are not fetched again.
     """
     log("Discovering all available subjects from Gutendex...")
-    
+    own_index = index is None
+    if own_index:
+        index = SubjectIndex(None)
+
     # Fetch a large sample of books to extract subjects
     params = {
         "languages": languages,
@@ -209,93 +603,722 @@ def get_all_subjects(api_url: str, languages: str, min_books: int = 10) -> List[
         "sort": "popular",
         "page_size": 32,  # Gutendex max
     }
-    
-    subject_counts: Dict[str, int] = {}
-    pages_to_check = 50  # Check ~1600 books (32 * 50)
-    
-    for page in range(1, pages_to_check + 1):
-        params["page"] = page
+
+    def _fetch_page(page: int) -> dict:
+        return gutendex_get(api_url, dict(params, page=page))
+
+    have = index.fresh_pages(languages, max_age_s)
+    pages_to_check = DISCOVER_PAGES  # Check ~1600 books (32 * 50)
+    if 1 not in have:
+        # Page 1 tells us how many pages actually exist
         try:
-            r = session.get(api_url, params=params, timeout=REQUEST_TIMEOUT)
-            r.raise_for_status()
-            data = r.json()
-            
-            for book in data.get("results", []):
-                # Count subjects
-                for subj in book.get("subjects", []):
-                    subject_counts[subj] = subject_counts.get(subj, 0) + 1
-                # Count bookshelves as subjects too
-                for shelf in book.get("bookshelves", []):
-                    subject_counts[shelf] = subject_counts.get(shelf, 0) + 1
-            
-            if not data.get("next"):
-                break
-                
+            first = _fetch_page(1)
+            results = first.get("results", [])
+            per_page = len(results) or 32
+            available = max(1, -(-int(first.get("count", 0)) // per_page))
+            index.merge_page(languages, 1, results, is_last=not first.get("next"))
+            pages_to_check = min(pages_to_check, available)
         except Exception as e:
-            log(f"Error fetching subjects on page {page}: {e}")
-            break
-    
-    # Filter and sort
-    subjects = [(s, c) for s, c in subject_counts.items() if c >= min_books]
-    subjects.sort(key=lambda x: x[1], reverse=True)
-    
+            log(f"Error fetching subjects on page 1: {e}")
+            pages_to_check = 0
+    last_known = [p for p, is_last in have.items() if is_last]
+    if last_known:
+        pages_to_check = min(pages_to_check, min(last_known))
+    if pages_to_check > 0:
+        index.trim(languages, pages_to_check)
+
+    missing = [p for p in range(2, pages_to_check + 1) if p not in have]
+    if missing:
+        log(f"  Fetching {len(missing)} discovery page(s) ({len(have)} already indexed)")
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="discover") as pool:
+            futures = {pool.submit(_fetch_page, p): p for p in missing}
+            for fut in as_completed(futures):
+                page = futures[fut]
+                try:
+                    data = fut.result()
+                except Exception as e:
+                    log(f"Error fetching subjects on page {page}: {e}")
+                    continue
+                index.merge_page(languages, page, data.get("results", []), is_last=not data.get("next"))
+
+    subjects = index.counts(languages, min_books)
+    if own_index:
+        index.close()
+
     log(f"Found {len(subjects)} subjects with {min_books}+ books")
     return subjects
 
 
-# ---------------------------- EPUB cleaning (same as original) ----------------------------
+# ---------------------------- Offline catalog ----------------------------
+
+
+_AUTHOR_ROLE_RE = re.compile(r"\s*\[[^\]]*\]$")
+_AUTHOR_DATES_RE = re.compile(r",[^,]*\d[^,]*$")
+
+
+def _split_catalog_field(value: Optional[str]) -> List[str]:
+    return [v.strip() for v in (value or "").split(";") if v.strip()]
+
+
+def _csv_authors(value: str) -> List[str]:
+    """Creators from a pg_catalog.csv Authors cell, minus dates and role-tagged contributors."""
+    names = []
+    for entry in _split_catalog_field(value):
+        if _AUTHOR_ROLE_RE.search(entry):
+            continue  # "[Editor]", "[Translator]", ... are not authors in Gutendex either
+        names.append(_AUTHOR_DATES_RE.sub("", entry).strip())
+    return [n for n in names if n]
+
+
+def iter_catalog_csv(path: Path) -> Iterable[dict]:
+    """Catalog records from pg_catalog.csv (no download counts or rights)."""
+    with path.open(newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            if (row.get("Type") or "Text") != "Text":
+                continue
+            try:
+                gid = int(row.get("Text#") or "")
+            except ValueError:
+                continue
+            yield {
+                "id": gid,
+                "title": (row.get("Title") or "").strip(),
+                "authors": _csv_authors(row.get("Authors") or ""),
+                "languages": _split_catalog_field(row.get("Language")),
+                "subjects": _split_catalog_field(row.get("Subjects")),
+                "bookshelves": _split_catalog_field(row.get("Bookshelves")),
+                "rights": "",
+                "copyright": None,
+                "downloads": 0,
+                "has_epub": True,
+                "epub_sizes": {},
+            }
+
+
+def parse_catalog_rdf(fp: BinaryIO) -> Optional[dict]:
+    """One catalog record from a pgNNN.rdf file, or None for non-text entries."""
+    ebook = etree.parse(fp).getroot().find("pgterms:ebook", RDF_NS)
+    if ebook is None:
+        return None
+    m = re.search(r"(\d+)$", ebook.get(f"{{{RDF_NS['rdf']}}}about", ""))
+    if not m:
+        return None
+    if ebook.findtext("dcterms:type/rdf:Description/rdf:value", "Text", RDF_NS) != "Text":
+        return None
+
+    subjects = []
+    for desc in ebook.findall("dcterms:subject/rdf:Description", RDF_NS):
+        scheme = desc.find("dcam:memberOf", RDF_NS)
+        if scheme is not None and scheme.get(f"{{{RDF_NS['rdf']}}}resource", "").endswith("LCSH"):
+            subjects.append((desc.findtext("rdf:value", "", RDF_NS)).strip())
+    formats = ebook.findall("dcterms:hasFormat/pgterms:file/dcterms:format/rdf:Description/rdf:value", RDF_NS)
+    # EPUB sizes per variant (.epub.images / .epub.noimages; .epub3.images if that is all there is)
+    epub_sizes: Dict[str, int] = {}
+    for f in ebook.findall("dcterms:hasFormat/pgterms:file", RDF_NS):
+        about = f.get(f"{{{RDF_NS['rdf']}}}about", "")
+        variant = "noimages" if about.endswith(".noimages") else "images" if about.endswith(".images") else None
+        if variant is None or ".epub" not in about:
+            continue
+        try:
+            size = int(f.findtext("dcterms:extent", "", RDF_NS))
+        except ValueError:
+            continue
+        if variant not in epub_sizes or ".epub." in about:
+            epub_sizes[variant] = size
+    rights = (ebook.findtext("dcterms:rights", "", RDF_NS)).strip()
+    try:
+        downloads = int(ebook.findtext("pgterms:downloads", "0", RDF_NS))
+    except ValueError:
+        downloads = 0
+    return {
+        "id": int(m.group(1)),
+        "title": (ebook.findtext("dcterms:title", "", RDF_NS)).strip(),
+        "authors": [
+            name.strip()
+            for name in (
+                c.findtext("pgterms:agent/pgterms:name", "", RDF_NS)
+                for c in ebook.findall("dcterms:creator", RDF_NS)
+            )
+            if name.strip()
+        ],
+        "languages": [
+            (v.text or "").strip()
+            for v in ebook.findall("dcterms:language/rdf:Description/rdf:value", RDF_NS)
+            if (v.text or "").strip()
+        ],
+        "subjects": [s for s in subjects if s],
+        "bookshelves": [
+            (v.text or "").strip()
+            for v in ebook.findall("pgterms:bookshelf/rdf:Description/rdf:value", RDF_NS)
+            if (v.text or "").strip()
+        ],
+        "rights": rights,
+        "copyright": (
+            False if rights.lower().startswith("public domain")
+            else True if rights.lower().startswith("copyrighted")
+            else None
+        ),
+        "downloads": downloads,
+        "has_epub": any((v.text or "").startswith("application/epub+zip") for v in formats),
+        "epub_sizes": epub_sizes,
+    }
+
+
+def _iter_rdf_members(tar: tarfile.TarFile) -> Iterable[dict]:
+    for member in tar:
+        if not (member.isfile() and member.name.endswith(".rdf")):
+            continue
+        fp = tar.extractfile(member)
+        if fp is None:
+            continue
+        try:
+            rec = parse_catalog_rdf(fp)
+        except etree.XMLSyntaxError as e:
+            log(f"  Skipping unreadable catalog entry {member.name}: {e}")
+            continue
+        if rec:
+            yield rec
+
+
+def iter_catalog_rdf(path: Path) -> Iterable[dict]:
+    """Catalog records from rdf-files.tar.bz2 / .tar.zip or an extracted cache/epub tree."""
+    if path.is_dir():
+        for rdf in sorted(path.rglob("*.rdf")):
+            try:
+                with rdf.open("rb") as fp:
+                    rec = parse_catalog_rdf(fp)
+            except etree.XMLSyntaxError as e:
+                log(f"  Skipping unreadable catalog entry {rdf}: {e}")
+                continue
+            if rec:
+                yield rec
+    elif path.suffix.lower() == ".zip":
+        with zipfile.ZipFile(path) as zf:
+            inner = next((n for n in zf.namelist() if n.endswith(".tar")), None)
+            if inner is None:
+                raise ValueError(f"No .tar archive inside {path}")
+            with zf.open(inner) as fp, tarfile.open(fileobj=fp, mode="r|") as tar:
+                yield from _iter_rdf_members(tar)
+    else:
+        # Stream mode: members are parsed as they are decompressed, nothing is extracted
+        with tarfile.open(path, mode="r|*") as tar:
+            yield from _iter_rdf_members(tar)
+
+
+class OfflineCatalog:
+    """
+    Project Gutenberg catalog answering topic/popular/discover queries in-process.
+
+    Built from the offline catalog files (`pg_catalog.csv`, the RDF tarball or
+    an extracted `cache/epub` tree) into `offline_catalog.sqlite3`, which is
+    rebuilt whenever the source file changes.  Only the books Gutendex queries
+    would return are stored: text entries with an EPUB that are not marked
+    copyrighted.  Each book has a download rank, and the language and
+    subject/bookshelf indexes are ordered by it, so a page of results is a
+    short index range scan.  Results are Gutendex-shaped book dicts.
+
+    pg_catalog.csv has no download counts, rights statements or file sizes;
+    with it the rank falls back to ascending Gutenberg ID and every book counts
+    as public domain.  Use the RDF tarball for real popularity ordering.
+    """
+
+    VERSION = 2  # bump when the stored book dicts change, to force a rebuild
+
+    def __init__(self, source: Path, reports_dir: Path):
+        self.source = source
+        self.path = reports_dir / "offline_catalog.sqlite3"
+        stamp = self._stamp()
+        db = sqlite3.connect(self.path) if self.path.exists() else None
+        if db is not None:
+            try:
+                built = dict(db.execute("SELECT key, value FROM meta"))
+            except sqlite3.DatabaseError:
+                built = {}
+            if built.get("stamp") != stamp:
+                db.close()
+                db = None
+        if db is None:
+            self._build(stamp)
+            db = sqlite3.connect(self.path)
+        self._db = db
+        self._topics: Dict[str, List[int]] = {}
+
+    def _stamp(self) -> str:
+        st = self.source.stat()
+        return f"v{self.VERSION}|{self.source.resolve()}|{st.st_size}|{st.st_mtime_ns}"
+
+    def _records(self) -> Iterable[dict]:
+        if self.source.is_file() and self.source.suffix.lower() == ".csv":
+            return iter_catalog_csv(self.source)
+        return iter_catalog_rdf(self.source)
+
+    def _build(self, stamp: str) -> None:
+        log(f"Building offline catalog from {self.source} (one-time)...")
+        started = time.time()
+        tmp = self.path.with_name(self.path.name + ".part")
+        tmp.unlink(missing_ok=True)
+        db = sqlite3.connect(tmp)
+        db.executescript(
+            """
+            CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            CREATE TABLE books (
+                id INTEGER PRIMARY KEY,
+                rank INTEGER,
+                downloads INTEGER NOT NULL,
+                data TEXT NOT NULL
+            );
+            CREATE TABLE labels (label_id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+            CREATE TABLE staged_labels (label_id INTEGER NOT NULL, id INTEGER NOT NULL);
+            CREATE TABLE staged_languages (language TEXT NOT NULL, id INTEGER NOT NULL);
+            """
+        )
+        label_ids: Dict[str, int] = {}
+        total = 0
+        for rec in self._records():
+            if not rec["has_epub"] or rec["copyright"]:
+                continue
+            gid = rec["id"]
+            book = {
+                "id": gid,
+                "title": rec["title"],
+                "authors": [{"name": n} for n in rec["authors"]],
+                "subjects": rec["subjects"],
+                "bookshelves": rec["bookshelves"],
+                "languages": rec["languages"],
+                "copyright": rec["copyright"],
+                "rights": rec["rights"],
+                "media_type": "Text",
+                "formats": {"application/epub+zip": f"{GUTENBERG_EBOOKS_URL}/{gid}.epub3.images"},
+                "download_count": rec["downloads"],
+            }
+            if rec["epub_sizes"]:
+                book["epub_sizes"] = rec["epub_sizes"]  # not a Gutendex field; used by --budget-gb
+            db.execute(
+                "INSERT OR REPLACE INTO books (id, downloads, data) VALUES (?, ?, ?)",
+                (gid, rec["downloads"], json.dumps(book)),
+            )
+            for name in dict.fromkeys(rec["subjects"] + rec["bookshelves"]):
+                if name not in label_ids:
+                    label_ids[name] = len(label_ids) + 1
+                    db.execute("INSERT INTO labels (label_id, name) VALUES (?, ?)", (label_ids[name], name))
+                db.execute("INSERT INTO staged_labels (label_id, id) VALUES (?, ?)", (label_ids[name], gid))
+            db.executemany(
+                "INSERT INTO staged_languages (language, id) VALUES (?, ?)",
+                [(lang, gid) for lang in dict.fromkeys(rec["languages"])],
+            )
+            total += 1
+
+        # Download rank, then rank-ordered indexes for languages and labels
+        ranked = [gid for (gid,) in db.execute("SELECT id FROM books ORDER BY downloads DESC, id")]
+        db.executemany("UPDATE books SET rank = ? WHERE id = ?", [(r, gid) for r, gid in enumerate(ranked, 1)])
+        db.executescript(
+            """
+            CREATE UNIQUE INDEX books_rank ON books (rank);
+            CREATE TABLE book_languages (
+                language TEXT NOT NULL, rank INTEGER NOT NULL, id INTEGER NOT NULL,
+                PRIMARY KEY (language, rank)
+            ) WITHOUT ROWID;
+            INSERT OR IGNORE INTO book_languages
+                SELECT s.language, b.rank, b.id FROM staged_languages s JOIN books b ON b.id = s.id;
+            CREATE TABLE book_labels (
+                label_id INTEGER NOT NULL, rank INTEGER NOT NULL, id INTEGER NOT NULL,
+                PRIMARY KEY (label_id, rank)
+            ) WITHOUT ROWID;
+            INSERT OR IGNORE INTO book_labels
+                SELECT s.label_id, b.rank, b.id FROM staged_labels s JOIN books b ON b.id = s.id;
+            DROP TABLE staged_labels;
+            DROP TABLE staged_languages;
+            """
+        )
+        db.execute("INSERT INTO meta (key, value) VALUES ('stamp', ?)", (stamp,))
+        db.commit()
+        db.execute("VACUUM")
+        db.close()
+        os.replace(tmp, self.path)
+        log(f"  Indexed {total:,} books and {len(label_ids):,} subjects/bookshelves in {time.time() - started:.1f}s")
+
+    def count(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM books").fetchone()[0]
+
+    @staticmethod
+    def _languages(languages: str) -> List[str]:
+        return [l.strip() for l in languages.split(",") if l.strip()]
+
+    def _label_ids(self, topic: str) -> List[int]:
+        # Gutendex `topic`: case-insensitive substring of any subject or bookshelf
+        needle = topic.casefold()
+        if needle not in self._topics:
+            self._topics[needle] = [
+                label_id
+                for label_id, name in self._db.execute("SELECT label_id, name FROM labels")
+                if needle in name.casefold()
+            ]
+        return self._topics[needle]
+
+    def _books(self, rank_sql: str, params: Sequence[object]) -> List[dict]:
+        return [
+            json.loads(data)
+            for (data,) in self._db.execute(
+                f"SELECT b.data FROM books b JOIN ({rank_sql}) r ON r.rank = b.rank ORDER BY b.rank", params
+            )
+        ]
+
+    def _lang_filter(self, languages: str) -> Tuple[str, List[str]]:
+        langs = self._languages(languages)
+        if not langs:
+            return "", []
+        marks = ",".join("?" * len(langs))
+        return f"rank IN (SELECT rank FROM book_languages WHERE language IN ({marks}))", langs
+
+    def topic_query_epub(self, topic: str, languages: str, page: int = 1) -> dict:
+        """Offline equivalent of topic_query_epub(); `next` is the next page number."""
+        label_ids = self._label_ids(topic)
+        if not label_ids:
+            return {"count": 0, "next": None, "previous": None, "results": []}
+        marks = ",".join("?" * len(label_ids))
+        where = f"label_id IN ({marks})"
+        params: List[object] = list(label_ids)
+        lang_sql, langs = self._lang_filter(languages)
+        if lang_sql:
+            where += f" AND {lang_sql}"
+            params += langs
+        ranks = f"SELECT DISTINCT rank FROM book_labels WHERE {where}"
+        count = self._db.execute(f"SELECT COUNT(*) FROM ({ranks})", params).fetchone()[0]
+        offset = (max(page, 1) - 1) * OFFLINE_PAGE_SIZE
+        results = self._books(
+            f"{ranks} ORDER BY rank LIMIT ? OFFSET ?", params + [OFFLINE_PAGE_SIZE, offset]
+        )
+        return {
+            "count": count,
+            "next": page + 1 if offset + len(results) < count else None,
+            "previous": page - 1 if page > 1 else None,
+            "results": results,
+        }
+
+    def get_popular_books(self, languages: str, limit: int, debug: bool = False) -> List[dict]:
+        """Offline equivalent of get_popular_books()."""
+        lang_sql, langs = self._lang_filter(languages)
+        ranks = "SELECT rank FROM books" + (f" WHERE {lang_sql}" if lang_sql else "")
+        books = self._books(f"{ranks} ORDER BY rank LIMIT ?", langs + [max(limit, 0)])
+        if debug and books:
+            log("=" * 70)
+            log("DEBUG: First book data from offline catalog:")
+            log("=" * 70)
+            print(json.dumps(books[0], indent=2))
+            log("=" * 70)
+        return books
+
+    def get_books_by_ids(self, ids: List[int]) -> List[dict]:
+        """Offline equivalent of get_books_by_ids()."""
+        by_id: Dict[int, dict] = {}
+        for i in range(0, len(ids), 500):  # stay under SQLite's bound-parameter limit
+            chunk = ids[i:i + 500]
+            sql = f"SELECT id, data FROM books WHERE id IN ({','.join('?' * len(chunk))})"
+            by_id.update((gid, json.loads(data)) for gid, data in self._db.execute(sql, chunk))
+        missing = [gid for gid in ids if gid not in by_id]
+        if missing:
+            log(f"  {len(missing)} ID(s) not in the offline catalog (or without an EPUB): "
+                f"{', '.join(map(str, missing[:20]))}{' ...' if len(missing) > 20 else ''}")
+        return [by_id[gid] for gid in ids if gid in by_id]
+
+    def iter_books(self, languages: str) -> Iterator[dict]:
+        """Offline equivalent of iter_all_books()."""
+        lang_sql, langs = self._lang_filter(languages)
+        sql = "SELECT data FROM books" + (f" WHERE {lang_sql}" if lang_sql else "") + " ORDER BY id"
+        for (data,) in self._db.execute(sql, langs):
+            yield json.loads(data)
+
+    def get_all_subjects(self, languages: str, min_books: int = 10) -> List[Tuple[str, int]]:
+        """
+        Offline equivalent of get_all_subjects(), counted over the whole
+        catalog rather than a sample of popularity pages.
+        """
+        lang_sql, langs = self._lang_filter(languages)
+        rows = self._db.execute(
+            f"""SELECT l.name, COUNT(*) AS n FROM book_labels bl JOIN labels l ON l.label_id = bl.label_id
+                {"WHERE bl." + lang_sql if lang_sql else ""}
+                GROUP BY bl.label_id HAVING n >= ? ORDER BY n DESC, l.name""",
+            langs + [min_books],
+        ).fetchall()
+        log(f"Found {len(rows)} subjects with {min_books}+ books")
+        return [(name, n) for name, n in rows]
+
+    def close(self) -> None:
+        self._db.close()
+
+
+# ---------------------------- EPUB cleaning ----------------------------
+
+
+# The boilerplate rules below are the original nine `re.sub` passes, compiled
+# once.  The DOTALL `.*?` rules are evaluated by linear scanners that reproduce
+# their leftmost/lazy match semantics exactly, and every rule needs the word
+# "gutenberg", so clean_member() leaves members without it byte-for-byte as
+# they are (check_gutenberg_cleaner.py compares the result with the originals).
+_GUTENBERG_RE = re.compile(r"gutenberg", re.IGNORECASE)
+_PG_RE = re.compile(r"project gutenberg", re.IGNORECASE)
+_BLOCK_OPEN_RE = re.compile(r"<(div|p|span|section|footer)", re.IGNORECASE)
+_BLOCK_CLOSE_RES = {
+    tag: re.compile(f"</{tag}>", re.IGNORECASE) for tag in ("div", "p", "span", "section", "footer")
+}
+_START_OF_RE = re.compile(r"start of", re.IGNORECASE)
+_END_OF_RE = re.compile(r"end of", re.IGNORECASE)
+_PG_HREF_RE = re.compile(r'href="https?://[^"]*gutenberg[^"]*"', re.IGNORECASE | re.DOTALL)
+_PG_TERM_RES = [
+    re.compile(r"project\s+gutenberg", re.IGNORECASE),
+    re.compile(r"gutenberg\-tm", re.IGNORECASE),
+    re.compile(r"gutenberg\.org", re.IGNORECASE),
+]
+
+
+class _NextMatch:
+    """Memoized "first match at or after pos" lookups for non-decreasing pos."""
+
+    def __init__(self, pattern: "re.Pattern[str]", s: str):
+        self.pattern = pattern
+        self.s = s
+        self.last: Optional["re.Match[str]"] = None
+        self.exhausted_from: Optional[int] = None
+
+    def find(self, pos: int) -> Optional["re.Match[str]"]:
+        if self.last is not None and self.last.start() >= pos:
+            return self.last
+        if self.exhausted_from is not None and pos >= self.exhausted_from:
+            return None
+        m = self.pattern.search(self.s, pos)
+        if m is None:
+            self.exhausted_from = pos
+        else:
+            self.last = m
+        return m
+
+
+def _strip_pg_comments(s: str) -> str:
+    """Equivalent of re.sub(r"(?is)<!--.*?project gutenberg.*?-->", "", s)."""
+    out: List[str] = []
+    pos = 0
+    while True:
+        i = s.find("<!--", pos)
+        if i < 0:
+            break
+        pg = _PG_RE.search(s, i + 4)
+        if pg is None:
+            break
+        k = s.find("-->", pg.end())
+        if k < 0:
+            break
+        out.append(s[pos:i])
+        pos = k + 3
+    if not out:
+        return s
+    out.append(s[pos:])
+    return "".join(out)
+
+
+def _strip_pg_blocks(s: str) -> str:
+    """Equivalent of re.sub(r"(?is)<(div|p|span|section|footer)[^>]*>.*?project gutenberg.*?</\1>", "", s)."""
+    out: List[str] = []
+    pos = 0
+    scan = 0
+    pg = _NextMatch(_PG_RE, s)
+    closers = {tag: _NextMatch(pat, s) for tag, pat in _BLOCK_CLOSE_RES.items()}
+    while True:
+        m = _BLOCK_OPEN_RE.search(s, scan)
+        if m is None:
+            break
+        t = s.find(">", m.end())
+        if t < 0:
+            break
+        j = pg.find(t + 1)
+        if j is None:
+            break
+        k = closers[m.group(1).lower()].find(j.end())
+        if k is None:
+            scan = m.start() + 1
+            continue
+        out.append(s[pos:m.start()])
+        pos = scan = k.end()
+    if not out:
+        return s
+    out.append(s[pos:])
+    return "".join(out)
+
+
+def _strip_pg_banner(s: str, marker: "re.Pattern[str]") -> str:
+    """Equivalent of re.sub(r"(?is)\*{3}\s*<marker>.*?project gutenberg.*?\*{3}", "", s)."""
+    out: List[str] = []
+    pos = 0
+    scan = 0
+    while True:
+        m = marker.search(s, scan)
+        if m is None:
+            break
+        scan = m.start() + 1
+        w = m.start()
+        while w > pos and s[w - 1].isspace():
+            w -= 1
+        if w - 3 < pos or s[w - 3:w] != "***":
+            continue
+        pg = _PG_RE.search(s, m.end())
+        if pg is None:
+            break
+        k = s.find("***", pg.end())
+        if k < 0:
+            break
+        out.append(s[pos:w - 3])
+        pos = scan = k + 3
+    if not out:
+        return s
+    out.append(s[pos:])
+    return "".join(out)
 
 
 def strip_headers_footers_html(html: str) -> str:
     s = html.replace("\r\n", "\n").replace("\r", "\n")
-    s = re.sub(r"(?is)<!--.*?project gutenberg.*?-->", "", s)
-    s = re.sub(
-        r"(?is)<(div|p|span|section|footer)[^>]*>.*?project gutenberg.*?</\1>", "", s
-    )
-    s = re.sub(r"(?is)\*{3}\s*start of.*?project gutenberg.*?\*{3}", "", s)
-    s = re.sub(r"(?is)\*{3}\s*end of.*?project gutenberg.*?\*{3}", "", s)
-    s = re.sub(r'(?is)href="https?://[^"]*gutenberg[^"]*"', 'href="#"', s)
-    s = re.sub(r"(?is)project\s+gutenberg", "", s)
-    s = re.sub(r"(?is)gutenberg\-tm", "", s)
-    s = re.sub(r"(?is)gutenberg\.org", "", s)
+    if _GUTENBERG_RE.search(s) is None:
+        return s.strip()
+    if _PG_RE.search(s) is not None:
+        s = _strip_pg_comments(s)
+        s = _strip_pg_blocks(s)
+        s = _strip_pg_banner(s, _START_OF_RE)
+        s = _strip_pg_banner(s, _END_OF_RE)
+    s = _PG_HREF_RE.sub('href="#"', s)
+    for pat in _PG_TERM_RES:
+        s = pat.sub("", s)
     return s.strip()
 
 
+TEXT_EXTS = (".xhtml", ".html", ".htm", ".xml", ".opf", ".ncx", ".txt", ".css")
+
+
+def _decode_text(data: bytes) -> Optional[str]:
+    for enc in ("utf-8", "windows-1252", "latin-1"):
+        try:
+            return data.decode(enc)
+        except UnicodeDecodeError:
+            continue
+    return None
+
+
+def clean_member(name: str, data: bytes) -> bytes:
+    """Remove Gutenberg references from one archive member (text files only)."""
+    if not name.lower().endswith(TEXT_EXTS):
+        return data
+    # Nothing to remove: the member is kept as it is and copied without recompressing
+    if b"gutenberg" not in data.lower():
+        return data
+    txt = _decode_text(data)
+    if txt is None:
+        return data
+    cleaned = strip_headers_footers_html(txt)
+    if _GUTENBERG_RE.search(cleaned) is not None:
+        for pat in TRADEMARK_RES:
+            cleaned = pat.sub("", cleaned)
+    return cleaned.encode("utf-8")
+
+
 def clean_epub_bytes(epub_bytes: bytes) -> bytes:
     """Remove Gutenberg references from EPUB internals."""
-    in_mem = io.BytesIO(epub_bytes)
-    zin = zipfile.ZipFile(in_mem, "r")
-    out_mem = io.BytesIO()
-    zout = zipfile.ZipFile(out_mem, "w", compression=zipfile.ZIP_DEFLATED)
+    return rewrite_epub(epub_bytes, clean=True)[0]
 
-    text_exts = (".xhtml", ".html", ".htm", ".xml", ".opf", ".ncx", ".txt", ".css")
-    for info in zin.infolist():
-        data = zin.read(info.filename)
-        fn_lower = info.filename.lower()
-        if fn_lower.endswith(text_exts):
-            txt = None
-            for enc in ("utf-8", "windows-1252", "latin-1"):
-                try:
-                    txt = data.decode(enc)
-                    break
-                except UnicodeDecodeError:
-                    continue
-            if txt is None:
-                zout.writestr(info, data)
-                continue
-            cleaned = strip_headers_footers_html(txt)
-            for pat in TRADEMARK_TERMS:
-                cleaned = re.sub(pat, "", cleaned, flags=re.IGNORECASE)
-            zout.writestr(info, cleaned.encode("utf-8"))
-        else:
-            zout.writestr(info, data)
 
-    zin.close()
-    zout.close()
-    return out_mem.getvalue()
+# ---------------------------- Image optimisation ----------------------------
 
 
-# ---------------------------- OPF metadata (same as original) ----------------------------
+def _encode_image(img: "Image.Image", fmt: str, quality: int) -> bytes:
+    buf = io.BytesIO()
+    if fmt == "JPEG":
+        img.save(buf, "JPEG", quality=quality, optimize=True, progressive=True)
+    else:
+        img.save(buf, "PNG", optimize=True)
+    return buf.getvalue()
+
+
+def optimize_image(data: bytes, max_dim: int, quality: int, allow_jpeg: bool) -> Tuple[str, bytes]:
+    """
+    Downscale and re-encode one JPEG or PNG; runs in the image process pool.
+
+    Images are scaled to at most `max_dim` px on their longest side and JPEGs
+    are re-encoded at `quality`.  A heavy, fully opaque truecolour PNG becomes
+    a JPEG when `allow_jpeg` is set and that at least halves it (line art and
+    palette images stay PNG).  Returns (format, bytes) with format "JPEG" or
+    "PNG", or ("", data) when nothing smaller was produced.
+    """
+    try:
+        img = Image.open(io.BytesIO(data))
+        fmt = img.format
+        if fmt not in ("JPEG", "PNG") or getattr(img, "is_animated", False):
+            return "", data
+        img.load()
+    except Exception:
+        return "", data
+
+    resized = max(img.size) > max_dim
+    if resized:
+        img.thumbnail((max_dim, max_dim), Image.LANCZOS)
+    if fmt == "JPEG":
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")  # e.g. CMYK scans
+        best = ("JPEG", _encode_image(img, "JPEG", quality))
+    else:
+        best = ("PNG", _encode_image(img, "PNG", quality) if resized else data)
+        opaque = img.mode in ("RGB", "L") or (
+            img.mode in ("RGBA", "LA") and img.getchannel("A").getextrema()[0] == 255
+        )
+        if allow_jpeg and opaque and len(data) >= PNG_TO_JPEG_MIN_BYTES:
+            jpeg = _encode_image(img.convert("RGB" if "RGB" in img.mode else "L"), "JPEG", quality)
+            if len(jpeg) <= len(best[1]) * PNG_TO_JPEG_RATIO:
+                best = ("JPEG", jpeg)
+    if len(best[1]) >= len(data):
+        return "", data
+    return best
+
+
+class ImageOptimizer:
+    """
+    Process pool shrinking the images of EPUBs as they are rewritten.
+
+    rewrite_epub_file() submits a book's images as it reads them and keeps at
+    most two per worker in flight, so a heavily illustrated book never has
+    all of its scans in memory at once.  Workers are spawned (not forked) so
+    the pool is safe to use from the pipeline's threads.  With `inline` there
+    is no pool and submit() optimises the image before returning; the
+    transform processes use this, as they already run one per core.
+    """
+
+    def __init__(
+        self,
+        max_dim: int = DEFAULT_IMAGE_MAX_DIM,
+        quality: int = DEFAULT_JPEG_QUALITY,
+        workers: Optional[int] = None,
+        inline: bool = False,
+    ):
+        self.max_dim = max_dim
+        self.quality = quality
+        self.workers = 1 if inline else max(1, workers or os.cpu_count() or 1)
+        self._pool = None if inline else ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    def submit(self, data: bytes, allow_jpeg: bool) -> "Future[Tuple[str, bytes]]":
+        if self._pool is None:
+            fut: "Future[Tuple[str, bytes]]" = Future()
+            fut.set_result(optimize_image(data, self.max_dim, self.quality, allow_jpeg))
+            return fut
+        return self._pool.submit(optimize_image, data, self.max_dim, self.quality, allow_jpeg)
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+
+
+def rename_references(text: str, renames: Dict[str, str]) -> str:
+    """Point references to renamed files (matched by whole basename) at their new names."""
+    pattern = re.compile(r"(?<![\w.-])(" + "|".join(re.escape(old) for old in renames) + r")(?![\w.-])")
+    return pattern.sub(lambda m: renames[m.group(1)], text)
+
+
+# ---------------------------- OPF metadata & EPUB rewrite ----------------------------
 
 
 def find_opf_path(zipf: zipfile.ZipFile) -> Optional[str]:
@@ -314,7 +1337,10 @@ def find_opf_path(zipf: zipfile.ZipFile) -> Optional[str]:
 
 
 def parse_opf(zipf: zipfile.ZipFile, opf_path: str) -> Tuple[etree._ElementTree, etree._Element]:
-    data = zipf.read(opf_path)
+    return parse_opf_bytes(zipf.read(opf_path))
+
+
+def parse_opf_bytes(data: bytes) -> Tuple[etree._ElementTree, etree._Element]:
     parser = etree.XMLParser(remove_blank_text=False, recover=True)
     tree = etree.fromstring(data, parser=parser)
     md = tree.find(".//opf:metadata", namespaces=NSMAP)
@@ -324,6 +1350,17 @@ def parse_opf(zipf: zipfile.ZipFile, opf_path: str) -> Tuple[etree._ElementTree,
     return etree.ElementTree(tree), md
 
 
+def minimal_opf() -> Tuple[etree._ElementTree, etree._Element]:
+    pkg = etree.Element(
+        "{%s}package" % NSMAP["opf"], nsmap={"opf": NSMAP["opf"], "dc": NSMAP["dc"]}
+    )
+    pkg.set("unique-identifier", "BookId")
+    md = etree.SubElement(pkg, "{%s}metadata" % NSMAP["opf"])
+    etree.SubElement(pkg, "{%s}manifest" % NSMAP["opf"])
+    etree.SubElement(pkg, "{%s}spine" % NSMAP["opf"])
+    return etree.ElementTree(pkg), md
+
+
 def ensure_dc(md: etree._Element, tag: str, text: str) -> etree._Element:
     el = md.find(f"dc:{tag}", namespaces=NSMAP)
     if el is None:
@@ -366,24 +1403,67 @@ def read_series_from_opf(md: etree._Element) -> Optional[str]:
     return None
 
 
-def embed_kavita_metadata(
-    epub_bytes: bytes,
+def apply_kavita_metadata(
+    md: etree._Element,
     title: str,
     authors: List[str],
     language: str,
     subjects: List[str],
     collection_name: Optional[str],
     collection_position: Optional[int],
-) -> Tuple[bytes, Optional[str]]:
-    """Embed Kavita metadata into EPUB."""
-    zin = zipfile.ZipFile(io.BytesIO(epub_bytes), "r")
-    opf_path = find_opf_path(zin)
+) -> Optional[str]:
+    """Edit OPF <metadata> in place for Kavita; returns the detected series name."""
+    ensure_dc(md, "title", title)
+    existing_creators = [(el.text or "").strip() for el in md.findall("dc:creator", namespaces=NSMAP)]
+    for a in authors:
+        if a and a not in existing_creators:
+            el = etree.SubElement(md, "{%s}creator" % NSMAP["dc"])
+            el.text = a
+    if language:
+        ensure_dc(md, "language", language)
 
-    out_mem = io.BytesIO()
-    zout = zipfile.ZipFile(out_mem, "w", compression=zipfile.ZIP_DEFLATED)
+    add_subjects(md, subjects)
+
+    if collection_name:
+        add_collection_tags(md, collection_name, collection_position)
+
+    return read_series_from_opf(md)
+
+
+def rewrite_epub_file(
+    src: BinaryIO,
+    dst: BinaryIO,
+    clean: bool = False,
+    edit_metadata: Optional[Callable[[etree._Element], Optional[str]]] = None,
+    timings: Optional[Dict[str, float]] = None,
+    images: Optional[ImageOptimizer] = None,
+    stats: Optional[Dict[str, int]] = None,
+) -> Optional[str]:
+    """
+    Rewrite the EPUB in `src` into `dst` in a single pass.
+
+    Text members are cleaned when `clean` is set, and when `edit_metadata` is
+    given the OPF is parsed, handed to it and serialized last (a minimal
+    container/OPF is created if the book has none).  Every other member, and any
+    text member the cleaner leaves unchanged, is copied as its original
+    compressed bytes, so only one text member is ever held in memory.  Both
+    arguments must be seekable binary files.  Returns whatever `edit_metadata`
+    returned.  Seconds spent cleaning and editing the OPF are added to the
+    "clean" and "embed" entries of `timings` when it is given.
+
+    With `images`, JPEG/PNG members are first shrunk in its process pool (the
+    "images" timing).  A PNG that became a JPEG is renamed to .jpg, references
+    to it in text members are updated and its OPF manifest media-type is
+    fixed; PNGs are only converted when the book has an OPF and the new name
+    is free and unambiguous.  Bytes saved are added to
+    `stats["image_bytes_saved"]`.
+    """
+    zin = zipfile.ZipFile(src, "r")
+    zout = zipfile.ZipFile(dst, "w", compression=zipfile.ZIP_DEFLATED)
 
+    opf_path = find_opf_path(zin) if (edit_metadata or images) else None
     created_minimal = False
-    if opf_path is None:
+    if edit_metadata and opf_path is None:
         created_minimal = True
         opf_path = "OEBPS/content.opf"
         container_xml = f"""<?xml version="1.0"?>
@@ -396,60 +1476,204 @@ def embed_kavita_metadata(
         if "mimetype" not in zin.namelist():
             zout.writestr("mimetype", b"application/epub+zip")
 
+    clean_s = embed_s = images_s = 0.0
+    optimized: Dict[str, Tuple[str, bytes]] = {}  # member -> (new name, data)
+    renames: Dict[str, str] = {}  # old basename -> new basename
+    if images is not None:
+        started = time.perf_counter()
+        names = set(zin.namelist())
+        basenames: Dict[str, int] = {}
+        for name in names:
+            base = name.rsplit("/", 1)[-1]
+            basenames[base] = basenames.get(base, 0) + 1
+        pending: deque = deque()
+
+        def _collect(name: str, fut: "Future[Tuple[str, bytes]]") -> None:
+            fmt, data = fut.result()
+            if not fmt:
+                return
+            new_name = name
+            if fmt == "JPEG" and name.lower().endswith(".png"):
+                new_name = name[:-4] + ".jpg"
+                renames[name.rsplit("/", 1)[-1]] = new_name.rsplit("/", 1)[-1]
+            optimized[name] = (new_name, data)
+            if stats is not None:
+                stats["image_bytes_saved"] = stats.get("image_bytes_saved", 0) + zin.getinfo(name).file_size - len(data)
+
+        for info in zin.infolist():
+            name = info.filename
+            if not name.lower().endswith(IMAGE_EXTS) or info.file_size < IMAGE_MIN_BYTES:
+                continue
+            base = name.rsplit("/", 1)[-1]
+            jpg_name = name[:-4] + ".jpg"
+            allow_jpeg = (
+                opf_path in names
+                and name.lower().endswith(".png")
+                and basenames[base] == 1
+                and jpg_name not in names
+                and jpg_name.rsplit("/", 1)[-1] not in basenames
+            )
+            pending.append((name, images.submit(zin.read(name), allow_jpeg)))
+            if len(pending) >= 2 * images.workers:
+                _collect(*pending.popleft())
+        while pending:
+            _collect(*pending.popleft())
+        images_s += time.perf_counter() - started
+
+    opf_data: Optional[bytes] = None
     for info in zin.infolist():
         name = info.filename
-        if name == opf_path or (created_minimal and name == "META-INF/container.xml"):
+        if created_minimal and name == "META-INF/container.xml":
             continue
-        zout.writestr(info, zin.read(name))
-
-    if not created_minimal:
-        tree, md = parse_opf(zin, opf_path)
-    else:
-        pkg = etree.Element(
-            "{%s}package" % NSMAP["opf"], nsmap={"opf": NSMAP["opf"], "dc": NSMAP["dc"]}
-        )
-        pkg.set("unique-identifier", "BookId")
-        md = etree.SubElement(pkg, "{%s}metadata" % NSMAP["opf"])
-        etree.SubElement(pkg, "{%s}manifest" % NSMAP["opf"])
-        etree.SubElement(pkg, "{%s}spine" % NSMAP["opf"])
-        tree = etree.ElementTree(pkg)
+        if name in optimized:
+            new_name, data = optimized[name]
+            out_info = zipfile.ZipInfo(new_name, date_time=info.date_time)
+            out_info.compress_type = info.compress_type
+            out_info.external_attr = info.external_attr
+            zout.writestr(out_info, data)
+            continue
+        is_opf = opf_path is not None and name == opf_path
+        is_text = name.lower().endswith(TEXT_EXTS)
+        if not is_opf and not ((clean or renames) and is_text):
+            copy_member_raw(zin, zout, info)
+            continue
+        raw = zin.read(name)
+        data = raw
+        if clean:
+            started = time.perf_counter()
+            data = clean_member(name, raw)
+            clean_s += time.perf_counter() - started
+        if renames and is_text:
+            started = time.perf_counter()
+            txt = _decode_text(data)
+            if txt is not None:
+                renamed = rename_references(txt, renames)
+                if renamed != txt:
+                    data = renamed.encode("utf-8")
+            images_s += time.perf_counter() - started
+        if is_opf:
+            opf_data = data
+        elif data == raw:
+            copy_member_raw(zin, zout, info)
+        else:
+            zout.writestr(info, data)
 
-    ensure_dc(md, "title", title)
-    existing_creators = [(el.text or "").strip() for el in md.findall("dc:creator", namespaces=NSMAP)]
-    for a in authors:
-        if a and a not in existing_creators:
-            el = etree.SubElement(md, "{%s}creator" % NSMAP["dc"])
-            el.text = a
-    if language:
-        ensure_dc(md, "language", language)
+    result = None
+    if edit_metadata or (renames and opf_data is not None):
+        started = time.perf_counter()
+        if created_minimal or opf_data is None:
+            tree, md = minimal_opf()
+        else:
+            tree, md = parse_opf_bytes(opf_data)
+        if renames:
+            # The hrefs were renamed with the other text; fix their media types
+            jpegs = set(renames.values())
+            for item in tree.getroot().iterfind(".//opf:manifest/opf:item", namespaces=NSMAP):
+                if item.get("href", "").rsplit("/", 1)[-1] in jpegs:
+                    item.set("media-type", "image/jpeg")
+        if edit_metadata:
+            result = edit_metadata(md)
+        opf_bytes = etree.tostring(tree.getroot(), xml_declaration=True, encoding="utf-8")
+        embed_s += time.perf_counter() - started
+        zout.writestr(opf_path, opf_bytes)
+    elif opf_data is not None:
+        zout.writestr(zin.getinfo(opf_path), opf_data)
 
-    add_subjects(md, subjects)
+    zin.close()
+    zout.close()
+    if timings is not None:
+        if clean:
+            timings["clean"] = timings.get("clean", 0.0) + clean_s
+        if images is not None:
+            timings["images"] = timings.get("images", 0.0) + images_s
+        if edit_metadata:
+            timings["embed"] = timings.get("embed", 0.0) + embed_s
+    return result
 
-    if collection_name:
-        add_collection_tags(md, collection_name, collection_position)
 
-    series_name = read_series_from_opf(md)
+def rewrite_epub(
+    epub_bytes: bytes,
+    clean: bool = False,
+    edit_metadata: Optional[Callable[[etree._Element], Optional[str]]] = None,
+) -> Tuple[bytes, Optional[str]]:
+    """In-memory form of rewrite_epub_file(); returns (new_bytes, edit_metadata result)."""
+    out_mem = io.BytesIO()
+    result = rewrite_epub_file(io.BytesIO(epub_bytes), out_mem, clean, edit_metadata)
+    return out_mem.getvalue(), result
 
-    opf_bytes = etree.tostring(tree.getroot(), xml_declaration=True, encoding="utf-8")
-    zout.writestr(opf_path, opf_bytes)
 
-    zin.close()
-    zout.close()
-    return out_mem.getvalue(), series_name
+def embed_kavita_metadata(
+    epub_bytes: bytes,
+    title: str,
+    authors: List[str],
+    language: str,
+    subjects: List[str],
+    collection_name: Optional[str],
+    collection_position: Optional[int],
+    clean: bool = False,
+) -> Tuple[bytes, Optional[str]]:
+    """Embed Kavita metadata into EPUB (optionally cleaning it in the same pass)."""
+    return rewrite_epub(
+        epub_bytes,
+        clean=clean,
+        edit_metadata=partial(
+            apply_kavita_metadata,
+            title=title,
+            authors=authors,
+            language=language,
+            subjects=subjects,
+            collection_name=collection_name,
+            collection_position=collection_position,
+        ),
+    )
 
 
 # ---------------------------- Download ----------------------------
 
 
-def download(url: str, sleep_s: float) -> bytes:
+def download(
+    url: str,
+    spool_bytes: int = DEFAULT_MAX_MEMORY_MB << 20,
+    timings: Optional[Dict[str, float]] = None,
+    spool_dir: Optional[Path] = None,
+) -> BinaryIO:
+    """
+    Stream `url` into a spooled temporary file, positioned at the start.
+
+    Each attempt first takes a token from `rate_limiter`.  The body stays in
+    memory up to `spool_bytes` and spills to disk beyond that; the caller owns
+    (and should close) the returned file.  With `spool_dir` the body goes
+    straight to a named temp file there instead, so another process can open
+    it by path; it is deleted when closed.  The transfer time (retries
+    included, rate-limit waits not) is stored as `timings["download"]`, even
+    when the download fails.
+    """
+    waited = [0.0]
+
     def _fetch():
-        r = session.get(url, timeout=REQUEST_TIMEOUT * 2)
-        r.raise_for_status()
-        return r.content
+        waited[0] += rate_limiter.acquire(url)
+        if spool_dir is None:
+            buf = tempfile.SpooledTemporaryFile(max_size=spool_bytes)
+        else:
+            buf = tempfile.NamedTemporaryFile(dir=spool_dir, prefix=".", suffix=DOWNLOAD_SUFFIX)
+        try:
+            with session.get(url, timeout=REQUEST_TIMEOUT * 2, stream=True) as r:
+                r.raise_for_status()
+                for chunk in r.iter_content(chunk_size=64 * 1024):
+                    buf.write(chunk)
+            buf.flush()
+        except BaseException:
+            buf.close()
+            raise
+        buf.seek(0)
+        return buf
     
-    data = retry_with_backoff(_fetch)
-    time.sleep(sleep_s)
-    return data
+    started = time.perf_counter()
+    try:
+        return retry_with_backoff(_fetch)
+    finally:
+        if timings is not None:
+            timings["download"] = time.perf_counter() - started - waited[0]
 
 
 def rewrite_to_mirror(url: str, mirror_base: str) -> str:
@@ -473,6 +1697,871 @@ def rewrite_to_mirror(url: str, mirror_base: str) -> str:
     return url
 
 
+def variant_url(base: str, book_id: int, variant: str) -> str:
+    """Cache URL of one EPUB variant ("images" or "noimages") on a mirror."""
+    suffix = "-images" if variant == "images" else ""
+    return f"{base.rstrip('/')}/cache/epub/{book_id}/pg{book_id}{suffix}.epub"
+
+
+def mirror_variants(base: str, book_id: int, variant: str = "") -> List[str]:
+    """
+    Cache URLs of a book on one mirror: the -images EPUB, then the plain one.
+
+    A book planned as "noimages" only tries the plain EPUB, so falling back
+    can never make it larger than the storage budget allowed for.
+    """
+    if variant == "noimages":
+        return [variant_url(base, book_id, "noimages")]
+    return [variant_url(base, book_id, v) for v in VARIANTS]
+
+
+def url_variant(url: str) -> str:
+    """The EPUB variant a mirror cache URL points at, or "" for other URLs."""
+    if "/cache/epub/" not in url:
+        return ""
+    return "images" if url.endswith("-images.epub") else "noimages"
+
+
+def head_size(url: str) -> Optional[int]:
+    """Size of `url` from a HEAD request: 0 if it does not exist, None if unknown."""
+
+    def _head() -> Optional[int]:
+        rate_limiter.acquire(url)
+        r = session.head(url, timeout=REQUEST_TIMEOUT, allow_redirects=True)
+        if r.status_code in (404, 410):
+            return 0
+        r.raise_for_status()
+        length = r.headers.get("Content-Length", "")
+        return int(length) if length.isdigit() else None
+
+    try:
+        return retry_with_backoff(_head)
+    except requests.RequestException:
+        return None
+
+
+class MirrorPool:
+    """
+    EPUB mirrors ranked by a moving average of their download throughput.
+
+    probe() reads up to MIRROR_PROBE_BYTES of a sample book from every mirror
+    at startup; afterwards each completed download updates its mirror's
+    average.  A mirror that fails (connection error, timeout, 5xx) is ranked
+    last for MIRROR_COOLDOWN seconds.  Safe to share between worker threads.
+    """
+
+    def __init__(self, bases: List[str]):
+        self.bases = [b.rstrip("/") for b in bases]
+        self._lock = threading.Lock()
+        self.throughput: Dict[str, Optional[float]] = {b: None for b in self.bases}  # bytes/s
+        self.latency: Dict[str, Optional[float]] = {b: None for b in self.bases}  # seconds
+        self.downloads: Dict[str, int] = {b: 0 for b in self.bases}
+        self.failures: Dict[str, int] = {b: 0 for b in self.bases}
+        self._benched_until: Dict[str, float] = {b: 0.0 for b in self.bases}
+
+    def record(self, base: str, nbytes: int, seconds: float) -> None:
+        if base not in self.throughput or seconds <= 0:
+            return
+        sample = nbytes / seconds
+        with self._lock:
+            prev = self.throughput[base]
+            self.throughput[base] = sample if prev is None else (
+                MIRROR_EWMA_ALPHA * sample + (1 - MIRROR_EWMA_ALPHA) * prev
+            )
+            self.downloads[base] += 1
+            self._benched_until[base] = 0.0
+
+    def fail(self, base: str) -> None:
+        if base not in self.failures:
+            return
+        with self._lock:
+            self.failures[base] += 1
+            self._benched_until[base] = time.monotonic() + MIRROR_COOLDOWN
+
+    def ranked(self) -> List[str]:
+        """Healthy mirrors fastest first, then benched ones; unmeasured keep --mirror order."""
+        now = time.monotonic()
+        with self._lock:
+            return sorted(
+                self.bases,
+                key=lambda b: (
+                    self._benched_until[b] > now,
+                    -(self.throughput[b] or 0.0),
+                    self.bases.index(b),
+                ),
+            )
+
+    def candidates(self, job: "BookJob") -> List[Tuple[Optional[str], str]]:
+        """(mirror, url) pairs to try in order for a job's EPUB."""
+        if job.gid is None or not any(job.dl_url.startswith(f"{b}/cache/epub/") for b in self.bases):
+            return [(None, job.dl_url)]  # not a mirror cache URL; nothing to fail over to
+        return [(base, url) for base in self.ranked() for url in mirror_variants(base, job.gid, job.variant)]
+
+    def probe(self, book_id: int, timeout: float = 10.0) -> None:
+        """Measure latency and throughput of every mirror concurrently."""
+
+        def _probe(base: str) -> None:
+            for url in mirror_variants(base, book_id):
+                rate_limiter.acquire(url)
+                started = time.perf_counter()
+                try:
+                    with session.get(url, timeout=timeout, stream=True) as r:
+                        self.latency[base] = time.perf_counter() - started
+                        if r.status_code == 404:
+                            continue
+                        r.raise_for_status()
+                        got = 0
+                        for chunk in r.iter_content(chunk_size=64 * 1024):
+                            got += len(chunk)
+                            if got >= MIRROR_PROBE_BYTES:
+                                break
+                    self.record(base, got, time.perf_counter() - started)
+                except requests.RequestException as e:
+                    log(f"  Mirror {base} failed its probe: {e}")
+                    self.fail(base)
+                return
+
+        log(f"Probing {len(self.bases)} mirrors...")
+        with ThreadPoolExecutor(max_workers=len(self.bases), thread_name_prefix="probe") as pool:
+            list(pool.map(_probe, self.bases))
+        self.log_stats()
+
+    def log_stats(self) -> None:
+        for base in self.ranked():
+            tp = self.throughput[base]
+            lat = self.latency[base]
+            log(
+                f"  {base}: "
+                + (f"{lat * 1000:.0f} ms, " if lat is not None else "")
+                + (f"{tp / (1 << 20):.2f} MB/s" if tp is not None else "no throughput sample")
+                + (f", {self.downloads[base]} download(s)" if self.downloads[base] else "")
+                + (f", {self.failures[base]} failure(s)" if self.failures[base] else "")
+            )
+
+
+def download_with_failover(
+    job: "BookJob",
+    mirrors: MirrorPool,
+    host_slots: "HostSlots",
+    spool_bytes: int,
+    timings: Dict[str, float],
+    spool_dir: Optional[Path] = None,
+) -> Tuple[BinaryIO, str]:
+    """
+    Download a job's EPUB from the best mirror, failing over per request.
+
+    A 4xx moves on to the book's next URL on the same mirror (-images, then
+    plain); a connection error, timeout or 5xx benches that mirror and moves on
+    to the next one.  Returns the open file (see download() for `spool_dir`)
+    and the URL that served it.
+    """
+    errors: List[str] = []
+    dead = set()
+    timings["download"] = 0.0  # failed attempts count towards the download stage
+    for base, url in mirrors.candidates(job):
+        if base in dead:
+            continue
+        attempt: Dict[str, float] = {}
+        log(f"    [{job.subject} {job.position}/{job.total}] GET {url}")
+        try:
+            with host_slots.slot(url):
+                raw = download(url, spool_bytes=spool_bytes, timings=attempt, spool_dir=spool_dir)
+        except requests.RequestException as e:
+            timings["download"] += attempt.get("download", 0.0)
+            errors.append(str(e))
+            log(f"      failed: {e}")
+            if base is not None and not is_client_error(e):
+                mirrors.fail(base)
+                dead.add(base)
+            continue
+        if base is not None:
+            mirrors.record(base, raw.seek(0, io.SEEK_END), attempt["download"])
+            raw.seek(0)
+        timings["download"] += attempt["download"]
+        return raw, url
+    raise requests.RequestException("; ".join(errors) or f"No download URL for {job.dl_url}")
+
+
+# ---------------------------- Download pipeline ----------------------------
+
+
+class HostSlots:
+    """Caps the number of in-flight requests per host across worker threads."""
+
+    def __init__(self, max_per_host: int):
+        self.max_per_host = max(1, max_per_host)
+        self._lock = threading.Lock()
+        self._slots: Dict[str, threading.BoundedSemaphore] = {}
+
+    @contextmanager
+    def slot(self, url: str):
+        host = urlparse(url).netloc.lower()
+        with self._lock:
+            sem = self._slots.get(host)
+            if sem is None:
+                sem = threading.BoundedSemaphore(self.max_per_host)
+                self._slots[host] = sem
+        with sem:
+            yield
+
+
+@dataclass
+class BookJob:
+    subject: str
+    position: int
+    total: int
+    gid: Optional[int]
+    title: str
+    authors: List[str]
+    language: str
+    rights: str
+    subjects: List[str]
+    dl_url: str
+    query_s: float = 0.0  # the subject's query time, split evenly over its books
+    epub_sizes: Dict[str, int] = field(default_factory=dict)  # variant -> bytes, from the catalog
+    variant: str = ""  # planned by --budget-gb; "" tries -images, then plain
+    variant_reason: str = ""
+    over_budget: bool = False
+
+
+@dataclass
+class BookResult:
+    job: BookJob
+    status: str = "OK"
+    notes: List[str] = field(default_factory=list)
+    series_folder: str = ""
+    final_path: Optional[Path] = None
+    source_size: int = 0
+    source_sha256: str = ""
+    output_size: int = 0
+    image_bytes_saved: int = 0
+    timings: Dict[str, float] = field(default_factory=dict)
+    url: str = ""  # the mirror URL that actually served the book
+
+
+class DownloadJournal:
+    """
+    Persistent per-book download state in `_reports/download_journal.sqlite3`.
+
+    Rows are keyed by Gutenberg ID and committed as each book finishes, so a
+    rerun can skip books that are already in the library and retry only the
+    failed ones.  Safe to share between the pipeline threads.
+    """
+
+    FILENAME = "download_journal.sqlite3"
+
+    def __init__(self, reports_dir: Path):
+        self.path = reports_dir / self.FILENAME
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS books (
+                gutenberg_id INTEGER PRIMARY KEY,
+                source_url TEXT NOT NULL,
+                file TEXT,
+                size INTEGER,
+                sha256 TEXT,
+                status TEXT NOT NULL,
+                error TEXT,
+                updated_at TEXT NOT NULL
+            )"""
+        )
+        self._db.commit()
+
+    def completed(self, gid: Optional[int], out_dir: Path) -> Optional[Path]:
+        """Library path of a finished book, or None if it must be (re)fetched."""
+        if gid is None:
+            return None
+        with self._lock:
+            row = self._db.execute(
+                "SELECT file FROM books WHERE gutenberg_id = ? AND status = 'done'", (gid,)
+            ).fetchone()
+        if row is None or not row[0]:
+            return None
+        path = out_dir / row[0]
+        return path if path.is_file() else None
+
+    def record(self, res: "BookResult", out_dir: Path) -> None:
+        if res.job.gid is None or res.status == "SKIPPED":
+            return
+        done = res.status == "OK"
+        with self._lock:
+            self._db.execute(
+                """INSERT OR REPLACE INTO books
+                   (gutenberg_id, source_url, file, size, sha256, status, error, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                (
+                    res.job.gid,
+                    res.url or res.job.dl_url,
+                    str(res.final_path.relative_to(out_dir)) if done and res.final_path else None,
+                    res.source_size or None,
+                    res.source_sha256 or None,
+                    "done" if done else "failed",
+                    "; ".join(res.notes) or None,
+                    time.strftime("%Y-%m-%dT%H:%M:%S"),
+                ),
+            )
+            self._db.commit()
+
+    def merge(self, other: Path) -> int:
+        """Copy every row of another journal into this one; returns the row count."""
+        with self._lock:
+            self._db.execute("ATTACH DATABASE ? AS other", (str(other),))
+            try:
+                cur = self._db.execute("INSERT OR REPLACE INTO books SELECT * FROM other.books")
+                self._db.commit()
+            finally:
+                self._db.execute("DETACH DATABASE other")
+        return cur.rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+def file_sha256(fp: BinaryIO) -> Tuple[int, str]:
+    """(size, sha256 hex) of a seekable file's contents; rewinds it afterwards."""
+    h = hashlib.sha256()
+    size = 0
+    fp.seek(0)
+    for chunk in iter(lambda: fp.read(1 << 20), b""):
+        h.update(chunk)
+        size += len(chunk)
+    fp.seek(0)
+    return size, h.hexdigest()
+
+
+def make_job(
+    subject: str,
+    position: int,
+    total: int,
+    b: dict,
+    languages: str,
+    mirror: str,
+    query_s: float = 0.0,
+    topic: bool = True,
+) -> BookJob:
+    """A download job for Gutendex book `b`; a `topic` subject is also added to its dc:subjects."""
+    title = (b.get("title") or "").strip().replace("\n", " ")
+    subjects_list = b.get("subjects") or []
+    subjects_list = [s if isinstance(s, str) else str(s) for s in subjects_list]
+    if topic and subject not in subjects_list:
+        subjects_list = [subject] + subjects_list
+
+    epub_url = b["formats"].get("application/epub+zip")
+    return BookJob(
+        subject=subject,
+        position=position,
+        total=total,
+        gid=b.get("id"),
+        title=title,
+        authors=[a.get("name", "") for a in b.get("authors", []) if a.get("name")],
+        language=(b.get("languages") or [languages])[0],
+        rights=b.get("rights") or "",
+        subjects=list(dict.fromkeys(subjects_list)),
+        dl_url=rewrite_to_mirror(epub_url, mirror),
+        query_s=query_s,
+        epub_sizes=dict(b.get("epub_sizes") or {}),
+    )
+
+
+def process_book(
+    job: BookJob,
+    raw: BinaryIO,
+    out_dir: Path,
+    no_collections: bool,
+    images: Optional[ImageOptimizer] = None,
+) -> BookResult:
+    """
+    CPU stage: clean, shrink images (with `images`), embed metadata and write
+    one downloaded EPUB.
+
+    Everything except cleaning, images and the OPF edit (hashing, zip
+    assembly, the move into the series folder) is timed as "write".
+    """
+    started = time.perf_counter()
+    timings: Dict[str, float] = {}
+    stats: Dict[str, int] = {}
+    source_size, source_sha256 = file_sha256(raw)
+    collection_name = None if no_collections else job.subject
+    collection_position = None if no_collections else job.position
+    edit = partial(
+        apply_kavita_metadata,
+        title=job.title,
+        authors=job.authors,
+        language=job.language,
+        subjects=job.subjects,
+        collection_name=collection_name,
+        collection_position=collection_position,
+    )
+
+    # The series folder is only known once the OPF has been read, so write to a
+    # temp file on the same filesystem and move it into place afterwards.
+    tmp = tempfile.NamedTemporaryFile(dir=out_dir, prefix=".", suffix=".epub.part", delete=False)
+    try:
+        with tmp:
+            series_name = rewrite_epub_file(
+                raw, tmp, clean=True, edit_metadata=edit, timings=timings, images=images, stats=stats
+            )
+        os.chmod(tmp.name, 0o644)  # NamedTemporaryFile creates 0600; Kavita must be able to read it
+
+        series_name_used = series_folder_from_meta(job.title, series_name)
+        series_dir = out_dir / series_name_used
+        series_dir.mkdir(parents=True, exist_ok=True)
+
+        file_slug = slugify(f"{job.title} - Gutenberg{job.gid}.epub")
+        final_path = series_dir / file_slug
+        os.replace(tmp.name, final_path)
+    except BaseException:
+        if os.path.exists(tmp.name):
+            os.unlink(tmp.name)
+        raise
+    timings["write"] = time.perf_counter() - started - sum(timings.values())
+    return BookResult(
+        job=job,
+        series_folder=series_name_used,
+        final_path=final_path,
+        source_size=source_size,
+        source_sha256=source_sha256,
+        output_size=final_path.stat().st_size,
+        image_bytes_saved=stats.get("image_bytes_saved", 0),
+        timings=timings,
+    )
+
+
+def transform_book(
+    job: BookJob,
+    src: str,
+    out_dir: Path,
+    no_collections: bool,
+    image_opts: Optional[Tuple[int, int]],
+) -> BookResult:
+    """TransformPool entry point: process_book() on the EPUB downloaded to `src`."""
+    images = ImageOptimizer(*image_opts, inline=True) if image_opts else None
+    with open(src, "rb") as raw:
+        return process_book(job, raw, out_dir, no_collections, images)
+
+
+class TransformPool:
+    """
+    Process pool running process_book() for the download threads.
+
+    Cleaning, image optimisation and the OPF edit are pure-Python and lxml
+    work, so on one thread they use a single core no matter how many books are
+    downloading.  Each download is written to a named temp file and only its
+    path is sent to a worker; the BookResult comes back.  With `image_opts`
+    (max_dim, quality) the workers also optimise images, inline.  Workers are
+    spawned (not forked) so the pool is safe to use from the fetch threads.
+    """
+
+    def __init__(self, workers: Optional[int] = None, image_opts: Optional[Tuple[int, int]] = None):
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.image_opts = image_opts
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    def process(self, job: BookJob, src: str, out_dir: Path, no_collections: bool) -> BookResult:
+        """Transform one downloaded EPUB in the pool, blocking until it is written."""
+        return self._pool.submit(transform_book, job, src, out_dir, no_collections, self.image_opts).result()
+
+    def close(self) -> None:
+        self._pool.shutdown()
+
+
+def run_pipeline(
+    jobs: List[BookJob],
+    out_dir: Path,
+    no_collections: bool,
+    workers: int,
+    max_per_host: int,
+    max_memory_mb: int = DEFAULT_MAX_MEMORY_MB,
+    journal: Optional[DownloadJournal] = None,
+    mirrors: Optional[MirrorPool] = None,
+    images: Optional[ImageOptimizer] = None,
+    transform: Optional[TransformPool] = None,
+    resume: bool = True,
+) -> Iterator[BookResult]:
+    """
+    Download and process every job, yielding results in job order.
+
+    With one worker everything runs inline.  Otherwise a pool of fetch threads
+    (capped per host) feeds a single processing thread; each fetch thread waits
+    for its book to be written before taking the next one, so at most `workers`
+    downloads are buffered at once, each holding at most `max_memory_mb` in
+    memory before spilling to a temp file.  With a `journal`, every outcome is
+    recorded as soon as it is known, and (unless `resume` is off) books it lists
+    as done and still on disk are skipped without any network I/O.  Mirror cache URLs are fetched
+    through `mirrors`, which picks the mirror and fails over per request.
+    With `images`, the processing thread hands each book's images to that
+    process pool.  With `transform`, books are processed in that process pool
+    instead of the processing thread: each download goes to a temp file in
+    `out_dir` and is handed over by path (`images` is then not used).
+    """
+    host_slots = HostSlots(max_per_host)
+    mirrors = mirrors or MirrorPool([])
+    spool_bytes = max(1, max_memory_mb) << 20
+    spool_dir = out_dir if transform is not None else None
+
+    def _fetch_and_process(job: BookJob, stage: Optional[ThreadPoolExecutor]) -> BookResult:
+        fetch_timings: Dict[str, float] = {}
+        try:
+            raw, url = download_with_failover(job, mirrors, host_slots, spool_bytes, fetch_timings, spool_dir)
+            with raw:
+                if transform is not None:
+                    res = transform.process(job, raw.name, out_dir, no_collections)
+                elif stage is None:
+                    res = process_book(job, raw, out_dir, no_collections, images)
+                else:
+                    res = stage.submit(process_book, job, raw, out_dir, no_collections, images).result()
+            res.timings.update(fetch_timings)
+            res.url = url
+            return res
+        except Exception as e:
+            return BookResult(job=job, status="ERROR", notes=[str(e)], timings=fetch_timings)
+
+    def _one(job: BookJob, stage: Optional[ThreadPoolExecutor]) -> BookResult:
+        if job.over_budget:
+            return BookResult(job=job, status="OVER_BUDGET", notes=[job.variant_reason])
+        existing = journal.completed(job.gid, out_dir) if journal and resume else None
+        if existing is not None:
+            return BookResult(
+                job=job,
+                status="SKIPPED",
+                notes=["already downloaded"],
+                series_folder=existing.parent.name,
+                final_path=existing,
+            )
+        res = _fetch_and_process(job, stage)
+        if journal:
+            journal.record(res, out_dir)
+        return res
+
+    if workers <= 1:
+        for job in jobs:
+            yield _one(job, None)
+        return
+
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="process") as stage, \
+            ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fetch") as fetchers:
+        yield from fetchers.map(lambda job: _one(job, stage), jobs)
+
+
+def classify_error(error_msg: str) -> str:
+    if "404" in error_msg:
+        return "404 Not Found"
+    if "Connection" in error_msg or "connection" in error_msg:
+        return "Connection Error"
+    if "Timeout" in error_msg or "timeout" in error_msg:
+        return "Timeout"
+    return "Other Error"
+
+
+# ---------------------------- Storage budget ----------------------------
+
+
+def format_mb(nbytes: float) -> str:
+    return f"{nbytes / (1 << 20):,.2f} MB"
+
+
+class VariantSizes:
+    """
+    EPUB variant sizes found by HEAD requests, in `_reports/variant_sizes.sqlite3`.
+
+    Gutenberg rarely regenerates a book's files, so sizes are kept until
+    --refresh-catalog; a size of 0 records that the variant does not exist.
+    """
+
+    FILENAME = "variant_sizes.sqlite3"
+
+    def __init__(self, reports_dir: Path, refresh: bool = False):
+        self.refresh = refresh
+        self._db = sqlite3.connect(str(reports_dir / self.FILENAME))
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS sizes (
+                gutenberg_id INTEGER NOT NULL,
+                variant TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                checked_at TEXT NOT NULL,
+                PRIMARY KEY (gutenberg_id, variant)
+            )"""
+        )
+        self._db.commit()
+
+    def get(self, gid: int) -> Dict[str, int]:
+        if self.refresh:
+            return {}
+        return dict(self._db.execute("SELECT variant, size FROM sizes WHERE gutenberg_id = ?", (gid,)))
+
+    def put(self, gid: int, variant: str, size: int) -> None:
+        self._db.execute(
+            "INSERT OR REPLACE INTO sizes (gutenberg_id, variant, size, checked_at) VALUES (?, ?, ?, ?)",
+            (gid, variant, size, time.strftime("%Y-%m-%dT%H:%M:%S")),
+        )
+
+    def commit(self) -> None:
+        self._db.commit()
+
+    def close(self) -> None:
+        self._db.commit()
+        self._db.close()
+
+
+def fill_variant_sizes(jobs: List[BookJob], cache: VariantSizes, mirror_base: str, workers: int) -> None:
+    """
+    Fill in each job's `epub_sizes` for both variants.
+
+    Catalog sizes (the offline RDF catalog has them) are used as they are;
+    the rest come from the size cache or, failing that, concurrent HEAD
+    requests to `mirror_base`, paced by `rate_limiter` like downloads.
+    """
+    missing: List[Tuple[BookJob, str]] = []
+    for job in jobs:
+        if job.gid is None:
+            continue
+        if len(job.epub_sizes) < len(VARIANTS):
+            job.epub_sizes = {**cache.get(job.gid), **job.epub_sizes}
+        missing += [(job, v) for v in VARIANTS if v not in job.epub_sizes]
+    if not missing:
+        return
+
+    log(f"Checking sizes of {len(missing)} EPUB variant(s) with HEAD requests...")
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="head") as pool:
+        futures = {
+            pool.submit(head_size, variant_url(mirror_base, job.gid, variant)): (job, variant)
+            for job, variant in missing
+        }
+        for done, fut in enumerate(as_completed(futures), 1):
+            job, variant = futures[fut]
+            size = fut.result()
+            if size is None:
+                continue  # unknown this time; estimated by plan_variants()
+            job.epub_sizes[variant] = size
+            cache.put(job.gid, variant, size)
+            if done % 500 == 0:
+                cache.commit()
+                log(f"  {done}/{len(missing)} checked")
+    cache.commit()
+
+
+def library_bytes(out_dir: Path, shard: Optional[Tuple[int, int]] = None) -> int:
+    """Bytes of the EPUBs already in the library (only this shard's books when sharded)."""
+    total = 0
+    for path in out_dir.rglob("*.epub"):
+        if shard is not None:
+            m = LIBRARY_FILE_RE.search(path.name)
+            if not m or not in_shard(int(m.group(1)), shard):
+                continue
+        total += path.stat().st_size
+    return total
+
+
+def plan_variants(jobs: List[BookJob], budget_bytes: int) -> Tuple[int, int, int]:
+    """
+    Pick each job's EPUB variant so the new downloads fit in `budget_bytes`.
+
+    Jobs are in priority order (subject order, then popularity).  First every
+    book is admitted at its smaller variant, in order, skipping (and marking
+    `over_budget`) any that no longer fit.  The bytes left over then upgrade
+    books to the images edition, again in priority order, whenever the extra
+    size still fits.  Unknown sizes are estimated from the average of the
+    known ones.  A book for which neither variant has a usable size (both
+    probes found nothing or failed) is still tried, but is charged the larger
+    average (or UNKNOWN_EPUB_BYTES) and says so in its reason.  Each job gets
+    `variant` and a human-readable `variant_reason`.  Returns (planned bytes,
+    images count, dropped count).
+    """
+    known: Dict[str, List[int]] = {v: [] for v in VARIANTS}
+    for job in jobs:
+        for v in VARIANTS:
+            if job.epub_sizes.get(v):
+                known[v].append(job.epub_sizes[v])
+    average = {v: (sum(sizes) // len(sizes) if sizes else 0) for v, sizes in known.items()}
+
+    def _size(job: BookJob, variant: str) -> Optional[int]:
+        size = job.epub_sizes.get(variant)
+        if size is None:
+            return average[variant] or average["images"] or average["noimages"] or None
+        return size or None  # 0: the variant does not exist
+
+    def _probes(job: BookJob) -> str:
+        return ", ".join(
+            f"{v}: {'not found' if job.epub_sizes.get(v) == 0 else 'no size'}" for v in VARIANTS
+        )
+
+    unknown_estimate = max(average.values()) or UNKNOWN_EPUB_BYTES
+    left = budget_bytes
+    admitted: List[Tuple[BookJob, Optional[int], Optional[int]]] = []
+    dropped = 0
+    for job in jobs:
+        images, text = _size(job, "images"), _size(job, "noimages")
+        smallest = min(size for size in (images, text) if size) if (images or text) else unknown_estimate
+        if smallest > left:
+            job.over_budget = True
+            job.variant_reason = f"over budget: needs {format_mb(smallest)}, {format_mb(max(left, 0))} left"
+            if not images and not text:
+                job.variant_reason += f" (size probes failed: {_probes(job)}; estimated)"
+            dropped += 1
+            continue
+        left -= smallest
+        admitted.append((job, images, text))
+
+    upgraded = 0
+    for job, images, text in admitted:
+        if not images and not text:
+            job.variant_reason = (
+                f"size probes failed ({_probes(job)}); tried as usual, {format_mb(unknown_estimate)} budgeted"
+            )
+        elif not text:
+            job.variant = "images"
+            job.variant_reason = "images: no text-only edition"
+            upgraded += 1
+        elif not images:
+            job.variant = "noimages"
+            job.variant_reason = "noimages: no images edition"
+        elif images <= text:
+            job.variant = "images"
+            job.variant_reason = "images: no larger than text-only"
+            upgraded += 1
+        elif images - text <= left:
+            left -= images - text
+            job.variant = "images"
+            job.variant_reason = f"images: fits budget (+{format_mb(images - text)})"
+            upgraded += 1
+        else:
+            job.variant = "noimages"
+            job.variant_reason = (
+                f"noimages: images edition is {format_mb(images - text)} larger, {format_mb(left)} left"
+            )
+        if job.variant and job.gid is not None and "/cache/epub/" in job.dl_url:
+            job.dl_url = variant_url(job.dl_url.split("/cache/epub/")[0], job.gid, job.variant)
+    return budget_bytes - left, upgraded, dropped
+
+
+# ---------------------------- Sharding ----------------------------
+
+
+SHARD_MANIFEST = "shard.json"
+
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    """Parse `--shard i/N` (1-based) into (i, N)."""
+    try:
+        i, n = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected i/N, e.g. 1/4, got {value!r}")
+    if not 1 <= i <= n:
+        raise argparse.ArgumentTypeError(f"shard index must be between 1 and {n}, got {i}")
+    return i, n
+
+
+def shard_dir_name(shard: Tuple[int, int]) -> str:
+    return f"shard-{shard[0]}-of-{shard[1]}"
+
+
+def in_shard(gid: Optional[int], shard: Optional[Tuple[int, int]]) -> bool:
+    """Shard i of N owns the Gutenberg IDs with id % N == i - 1."""
+    if shard is None:
+        return True
+    i, n = shard
+    return (gid or 0) % n == i - 1
+
+
+def _read_report(path: Path) -> Iterator[Dict[str, str]]:
+    with path.open(newline="", encoding="utf-8") as f:
+        yield from csv.DictReader(f)
+
+
+def merge_shard_reports(out_dir: Path, opds: bool = True) -> int:
+    """
+    Merge the per-shard reports under `_reports/shard-*` into `_reports/`.
+
+    Every shard selects the same books and numbers collections before keeping
+    only its own IDs, so a merged collection lists each shard's books at the
+    positions they were written with.  The manifests record a digest of that
+    selection; shards that disagree (e.g. run against different catalog
+    snapshots) are refused rather than merged into inconsistent collections.
+    Each shard's rows are already in selection order, so the CSVs are merged
+    as streams.  Per-shard download journals are folded into the main one so
+    an unsharded rerun skips everything already fetched.  With `opds`, the
+    static OPDS catalog is then updated from the merged reports.
+
+    Returns 0 on success, 1 if shards are missing, 2 if nothing can be merged.
+    """
+    reports = out_dir / "_reports"
+    manifests = []
+    for path in sorted(reports.glob(f"shard-*-of-*/{SHARD_MANIFEST}")):
+        manifest = json.loads(path.read_text(encoding="utf-8"))
+        manifest["dir"] = path.parent
+        manifests.append(manifest)
+    if not manifests:
+        log(f"✗ No shard reports found in {reports}")
+        return 2
+
+    counts = {m["shards"] for m in manifests}
+    digests = {m["selection_sha256"] for m in manifests}
+    if len(counts) > 1 or len(digests) > 1:
+        log("✗ Shard reports come from different runs or catalog snapshots; refusing to merge:")
+        for m in manifests:
+            log(f"  {m['dir'].name}: {m['selected']} books selected, selection {m['selection_sha256'][:12]}")
+        return 2
+    n = counts.pop()
+    present = {m["shard"] for m in manifests}
+    missing = [i for i in range(1, n + 1) if i not in present]
+    if missing:
+        log(f"⚠ Missing shard(s) {', '.join(f'{i}/{n}' for i in missing)}; merging the {len(present)} present")
+
+    order = {subject: i for i, subject in enumerate(manifests[0]["subjects"])}
+
+    def merge(name: str, subject_col: str) -> Tuple[int, Dict[str, int]]:
+        streams = []
+        fieldnames: Optional[List[str]] = None
+        for m in manifests:
+            path = m["dir"] / name
+            if not path.is_file():
+                log(f"⚠ {m['dir'].name} has no {name} (still running or interrupted?)")
+                continue
+            with path.open(newline="", encoding="utf-8") as f:
+                fieldnames = fieldnames or next(csv.reader(f), None)
+            streams.append(_read_report(path))
+        if not streams or not fieldnames:
+            return 0, {}
+        rows = 0
+        statuses: Dict[str, int] = {}
+
+        def _key(row: Dict[str, str]) -> Tuple[int, int]:
+            return order.get(row[subject_col], len(order)), int(row["position"])
+
+        with ReportWriter(reports / name, fieldnames) as writer:
+            for row in heapq.merge(*streams, key=_key):
+                writer.write(row)
+                rows += 1
+                if "status" in row:
+                    statuses[row["status"]] = statuses.get(row["status"], 0) + 1
+        return rows, statuses
+
+    report_rows, statuses = merge("kavita_epub_report.csv", "subject")
+    collection_rows, _ = merge("collections.csv", "collection")
+
+    journal = DownloadJournal(reports)
+    journal_rows = 0
+    for m in manifests:
+        path = m["dir"] / DownloadJournal.FILENAME
+        if path.is_file():
+            journal_rows += journal.merge(path)
+    journal.close()
+
+    log(f"Merged {len(present)}/{n} shard(s) into {reports}:")
+    log(f"  kavita_epub_report.csv: {report_rows} row(s)"
+        + (f" ({', '.join(f'{k}: {v}' for k, v in sorted(statuses.items()))})" if statuses else ""))
+    log(f"  collections.csv:        {collection_rows} row(s)")
+    log(f"  {DownloadJournal.FILENAME}: {journal_rows} book(s)")
+    if opds:
+        import opds_catalog  # sibling script; only loaded when the catalog is wanted
+        opds_catalog.update_and_log(out_dir)
+    return 1 if missing else 0
+
+
 # ---------------------------- Main logic ----------------------------
 
 
@@ -489,212 +2578,363 @@ def run(
     no_collections: bool,
     discover_subjects: bool,
     debug: bool = False,
+    workers: int = DEFAULT_WORKERS,
+    max_per_host: int = DEFAULT_MAX_PER_HOST,
+    max_memory_mb: int = DEFAULT_MAX_MEMORY_MB,
+    resume: bool = True,
+    cache_ttl_hours: float = DEFAULT_CACHE_TTL_HOURS,
+    cache_max_mb: int = DEFAULT_CACHE_MAX_MB,
+    refresh_catalog: bool = False,
+    discover_workers: int = DEFAULT_DISCOVER_WORKERS,
+    catalog: Optional[Path] = None,
+    rate: Optional[float] = None,
+    burst: int = DEFAULT_BURST,
+    shard: Optional[Tuple[int, int]] = None,
+    budget_gb: float = 0.0,
+    ids_file: Optional[Path] = None,
+    ids_collection: str = "",
+    optimize_images: bool = False,
+    image_max_dim: int = DEFAULT_IMAGE_MAX_DIM,
+    jpeg_quality: int = DEFAULT_JPEG_QUALITY,
+    image_workers: Optional[int] = None,
+    transform_workers: Optional[int] = None,
+    opds: bool = True,
 ) -> int:
     """
     Run the download process.
+
+    With `shard=(i, N)` every book is still selected and numbered, but only
+    those with Gutenberg ID % N == i - 1 are downloaded; reports go to
+    `_reports/shard-i-of-N/` for merge_shard_reports().  With `budget_gb`,
+    each book's images or text-only EPUB is chosen by plan_variants() so the
+    library stays within that many GB.  `ids_file` selects the books listed
+    in it (in file order, as the `ids_collection` collection) instead.
+    `optimize_images` shrinks each book's images in an ImageOptimizer pool.
+    With several `workers`, books are cleaned and written in a TransformPool
+    of `transform_workers` processes (default one per CPU, at most `workers`;
+    0 keeps them on one thread of this process).  With `opds`, the static
+    OPDS catalog under `opds/` is brought up to date at the end (sharded
+    runs leave that to merge_shard_reports()).
     Returns: 0 on success, 1 if some downloads failed, 2 if all downloads failed.
     """
 
-    # Test Gutendex connection first
-    if not test_gutendex_connection(gutendex_api):
+    global response_cache, rate_limiter
+    dirs = ensure_dirs(out_dir, shard)
+    if shard is not None:
+        log(f"Shard {shard[0]}/{shard[1]}: books with Gutenberg ID % {shard[1]} == {shard[0] - 1}")
+    if rate is None:
+        rate = 1.0 / sleep_s if sleep_s > 0 else 0.0
+    rate_limiter = RateLimiter(rate, burst)
+    mirror_pool = MirrorPool([m.strip() for m in mirror.split(",") if m.strip()] or [MIRROR_BASE])
+    offline = OfflineCatalog(catalog, dirs["reports"]) if catalog else None
+
+    # Test Gutendex connection first, uncached (not needed with an offline catalog)
+    if offline is not None:
+        log(f"✓ Offline catalog: {offline.count():,} books available")
+    elif not test_gutendex_connection(gutendex_api):
         return 2
 
-    ensure_dirs(out_dir)
-    
-    # Determine subjects
-    if discover_subjects:
-        log("Discovering subjects from your Gutendex instance...")
-        all_subjects = get_all_subjects(gutendex_api, languages, min_books=count_per_genre)
-        subjects = [s[0] for s in all_subjects[:genres_top]]
-        log(f"Top {len(subjects)} subjects by popularity:")
-        for i, (name, count) in enumerate(all_subjects[:genres_top], 1):
-            log(f"  {i}. {name} ({count} books)")
-    elif mode == "popular":
-        log(f"Downloading top {count_per_genre} most popular books...")
-        subjects = ["Popular"]
-        if debug:
-            log("Debug mode enabled - will show first book's data structure")
-    elif genres_list:
-        subjects = genres_list
-    else:
-        # Fallback subjects
-        subjects = [
-            "Science fiction",
-            "Short stories",
-            "Adventure stories",
-            "Historical fiction",
-            "Horror tales",
-        ][:genres_top]
-
-    report_rows: List[Dict[str, str]] = []
-    collections_rows: List[Dict[str, str]] = []
-    seen_global = set()
-    
-    # Track success/failure statistics
-    total_attempted = 0
-    total_success = 0
-    total_failed = 0
-    error_summary: Dict[str, int] = {}
-
-    for gi, subject in enumerate(subjects, 1):
-        log(f"[{gi}/{len(subjects)}] Subject: {subject}")
-        
-        if mode == "popular" and subject == "Popular":
-            # Get most popular books regardless of subject
-            picked = get_popular_books(gutendex_api, languages, count_per_genre, debug=debug)
-            for b in picked:
-                gid = b.get("id")
-                if gid:
-                    seen_global.add(gid)
+    if offline is None and cache_ttl_hours > 0:
+        # Created after the connection check so a warm cache cannot mask a dead Gutendex
+        response_cache = ResponseCache(
+            dirs["reports"],
+            ttl_s=cache_ttl_hours * 3600,
+            max_bytes=cache_max_mb << 20,
+            refresh=refresh_catalog,
+        )
+    cache_stats = None
+    try:
+        # Determine subjects
+        ids: Optional[List[int]] = None
+        if ids_file is not None:
+            ids = read_ids_file(ids_file)
+            subjects = [ids_collection or ids_file.stem.replace("_", " ").replace("-", " ").strip()]
+            log(f"Downloading {len(ids)} books listed in {ids_file} as collection '{subjects[0]}'")
+        elif discover_subjects:
+            if offline is not None:
+                log("Discovering subjects from the offline catalog...")
+                all_subjects = offline.get_all_subjects(languages, min_books=count_per_genre)
+            else:
+                log("Discovering subjects from your Gutendex instance...")
+                subject_index = SubjectIndex(dirs["reports"])
+                all_subjects = get_all_subjects(
+                    gutendex_api,
+                    languages,
+                    min_books=count_per_genre,
+                    index=subject_index,
+                    workers=discover_workers,
+                    max_age_s=0 if refresh_catalog else max(cache_ttl_hours, 0) * 3600,
+                )
+                subject_index.close()
+            subjects = [s[0] for s in all_subjects[:genres_top]]
+            log(f"Top {len(subjects)} subjects by popularity:")
+            for i, (name, count) in enumerate(all_subjects[:genres_top], 1):
+                log(f"  {i}. {name} ({count} books)")
+        elif mode == "all":
+            log(f"Downloading every EPUB in languages: {languages}...")
+            subjects = ["All"]
+        elif mode == "popular":
+            log(f"Downloading top {count_per_genre} most popular books...")
+            subjects = ["Popular"]
+            if debug:
+                log("Debug mode enabled - will show first book's data structure")
+        elif genres_list:
+            subjects = genres_list
         else:
-            # Get books by subject
-            picked: List[dict] = []
-            page = 1
+            # Fallback subjects
+            subjects = [
+                "Science fiction",
+                "Short stories",
+                "Adventure stories",
+                "Historical fiction",
+                "Horror tales",
+            ][:genres_top]
+
+        seen_global = set()
+        jobs: List[BookJob] = []
+        topic_subjects = ids is None and mode in ("genres", "discover")  # real subjects, not "Popular"/"All"
+        selected = 0
+        selection = hashlib.sha256()  # what every shard must agree on for the merge
+    
+        # Track success/failure statistics
+        total_attempted = 0
+        total_success = 0
+        total_failed = 0
+        error_summary: Dict[str, int] = {}
+
+        for gi, subject in enumerate(subjects, 1):
+            log(f"[{gi}/{len(subjects)}] Subject: {subject}")
+            query_started = time.perf_counter()
+
+            if ids is not None:
+                if offline is not None:
+                    picked = offline.get_books_by_ids(ids)
+                else:
+                    picked = get_books_by_ids(gutendex_api, ids, workers=discover_workers)
+                restricted = [str(b.get("id")) for b in picked if b.get("copyright")]
+                if restricted:
+                    log(f"  Skipping {len(restricted)} book(s) still under copyright: {', '.join(restricted)}")
+                    picked = [b for b in picked if not b.get("copyright")]
+            elif mode == "all" and subject == "All":
+                # Streamed: only this shard's books are kept
+                if offline is not None:
+                    picked = offline.iter_books(languages)
+                else:
+                    picked = iter_all_books(gutendex_api, languages)
+            elif mode == "popular" and subject == "Popular":
+                # Get most popular books regardless of subject
+                if offline is not None:
+                    picked = offline.get_popular_books(languages, count_per_genre, debug=debug)
+                else:
+                    picked = get_popular_books(gutendex_api, languages, count_per_genre, debug=debug)
+                for b in picked:
+                    gid = b.get("id")
+                    if gid:
+                        seen_global.add(gid)
+            else:
+                # Get books by subject
+                picked: List[dict] = []
+                page = 1
             
-            while len(picked) < count_per_genre:
-                try:
-                    data = topic_query_epub(gutendex_api, topic=subject, languages=languages, page=page)
-                    results = data.get("results", [])
-                    if not results:
-                        break
-                    for b in results:
-                        if len(picked) >= count_per_genre:
+                while len(picked) < count_per_genre:
+                    try:
+                        if offline is not None:
+                            data = offline.topic_query_epub(subject, languages, page)
+                        else:
+                            data = topic_query_epub(gutendex_api, topic=subject, languages=languages, page=page)
+                        results = data.get("results", [])
+                        if not results:
                             break
-                        gid = b.get("id")
-                        if gid in seen_global:
-                            continue
-                        fmts = b.get("formats", {})
-                        epub_url = fmts.get("application/epub+zip")
-                        if not epub_url:
-                            continue
-                        picked.append(b)
-                        seen_global.add(gid)
-                    if not data.get("next"):
+                        for b in results:
+                            if len(picked) >= count_per_genre:
+                                break
+                            gid = b.get("id")
+                            if gid in seen_global:
+                                continue
+                            fmts = b.get("formats", {})
+                            epub_url = fmts.get("application/epub+zip")
+                            if not epub_url:
+                                continue
+                            picked.append(b)
+                            seen_global.add(gid)
+                        if not data.get("next"):
+                            break
+                        page += 1
+                    except Exception as e:
+                        log(f"  ERROR: Failed to query Gutendex for subject '{subject}', page {page}: {e}")
+                        log(f"  Continuing with {len(picked)} books found so far...")
                         break
-                    page += 1
-                except Exception as e:
-                    log(f"  ERROR: Failed to query Gutendex for subject '{subject}', page {page}: {e}")
-                    log(f"  Continuing with {len(picked)} books found so far...")
-                    break
-
-        log(f"  Selected {len(picked)} EPUBs")
-
-        for idx, b in enumerate(picked, 1):
-            total_attempted += 1
-            gid = b.get("id")
-            title = (b.get("title") or "").strip().replace("\n", " ")
-            authors = [a.get("name", "") for a in b.get("authors", []) if a.get("name")]
-            language = (b.get("languages") or [languages])[0]
-            rights = b.get("rights") or ""
-            is_pd_usa = (b.get("copyright") is False) or ("Public domain in the USA" in rights)
-            subjects_list = b.get("subjects") or []
-            subjects_list = [s if isinstance(s, str) else str(s) for s in subjects_list]
-            if subject not in subjects_list and subject != "Popular":
-                subjects_list = [subject] + subjects_list
-
-            epub_url = b["formats"].get("application/epub+zip")
-            dl_url = rewrite_to_mirror(epub_url, mirror)
-
-            status = "OK"
-            notes: List[str] = []
-            series_name_used: str = ""
-            
-            try:
-                log(f"    [{idx}/{len(picked)}] GET {dl_url}")
-                raw = download(dl_url, sleep_s=sleep_s)
-                cleaned = clean_epub_bytes(raw)
-
-                collection_name = None if no_collections else subject
-                collection_position = None if no_collections else idx
-                embedded, series_name = embed_kavita_metadata(
-                    cleaned,
-                    title=title,
-                    authors=authors,
-                    language=language,
-                    subjects=list(dict.fromkeys(subjects_list)),
-                    collection_name=collection_name,
-                    collection_position=collection_position,
-                )
 
-                series_name_used = series_folder_from_meta(title, series_name)
-                series_dir = out_dir / series_name_used
-                series_dir.mkdir(parents=True, exist_ok=True)
-
-                file_slug = slugify(f"{title} - Gutenberg{gid}.epub")
-                final_path = series_dir / file_slug
-                final_path.write_bytes(embedded)
-                
-                total_success += 1
-
-                if collection_name:
-                    collections_rows.append({
-                        "collection": collection_name,
-                        "position": str(collection_position or ""),
-                        "series_folder": series_name_used,
-                        "file": str(final_path.relative_to(out_dir)),
-                        "title": title,
-                        "authors": "; ".join(authors) if authors else "Unknown",
-                        "gutenberg_id": str(gid),
+            # Positions are assigned before sharding so every shard numbers the
+            # collection the same way
+            subject_jobs: List[BookJob] = []
+            position = 0
+            for b in picked:
+                if not b.get("formats", {}).get("application/epub+zip"):
+                    continue
+                position += 1
+                selection.update(f"{subject}\t{position}\t{b.get('id')}\n".encode("utf-8"))
+                if in_shard(b.get("id"), shard):
+                    subject_jobs.append(make_job(
+                        subject, position, 0, b, languages, mirror_pool.bases[0], topic=topic_subjects
+                    ))
+            selected += position
+            if shard is not None:
+                log(f"  Selected {position} EPUBs, {len(subject_jobs)} in this shard")
+            else:
+                log(f"  Selected {position} EPUBs")
+            query_s = (time.perf_counter() - query_started) / max(len(subject_jobs), 1)
+            for job in subject_jobs:
+                job.total = position
+                job.query_s = query_s
+            jobs.extend(subject_jobs)
+
+        if shard is not None:
+            manifest = {
+                "shard": shard[0],
+                "shards": shard[1],
+                "mode": "ids" if ids is not None else mode,
+                "languages": languages,
+                "subjects": subjects,
+                "selected": selected,
+                "jobs": len(jobs),
+                "selection_sha256": selection.hexdigest(),
+            }
+            (dirs["reports"] / SHARD_MANIFEST).write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+
+        # --no-resume only skips the lookup; every book is still recorded for later runs and the catalog
+        journal = DownloadJournal(dirs["reports"])
+        if len(mirror_pool.bases) > 1:
+            sample_gid = next((job.gid for job in jobs if job.gid is not None), None)
+            if sample_gid is not None:
+                mirror_pool.probe(sample_gid)
+        if budget_gb > 0:
+            budget_bytes = int(budget_gb * (1 << 30))
+            if shard is not None:
+                budget_bytes //= shard[1]  # each shard fits its own books into an equal share
+            used = library_bytes(out_dir, shard)
+            pending = [job for job in jobs if not (resume and journal.completed(job.gid, out_dir))]
+            sizes = VariantSizes(dirs["reports"], refresh=refresh_catalog)
+            fill_variant_sizes(pending, sizes, mirror_pool.ranked()[0], max_per_host)
+            sizes.close()
+            planned, with_images, dropped = plan_variants(pending, budget_bytes - used)
+            log(f"Storage budget {format_mb(budget_bytes)}: {format_mb(used)} already in the library, "
+                f"{format_mb(planned)} planned for {len(pending) - dropped} book(s) "
+                f"({with_images} with images, {dropped} over budget)")
+        if workers > 1:
+            log(f"Downloading {len(jobs)} EPUBs with {workers} workers ({max_per_host} per host)")
+        out_reports = dirs["reports"]
+        report_cols = ["subject", "position", "gutenberg_id", "title", "authors", "download_url",
+                       "variant", "variant_reason", "series_folder", "rights", "subjects", "status", "notes"]
+        report_cols += [f"{stage}_s" for stage in STAGES] + ["bytes_in", "bytes_out", "image_bytes_saved"]
+        collections_cols = ["collection", "position", "series_folder", "file", "title", "authors", "gutenberg_id"]
+
+        # Rows are streamed to the CSVs as books finish; only the per-stage
+        # timings are kept for the summary percentiles.
+        stage_values = {stage: array.array("d") for stage in STAGES}
+        processed_bytes = 0
+        image_bytes_saved = 0
+        transform = None
+        if workers > 1 and transform_workers != 0:
+            transform = TransformPool(
+                min(transform_workers or os.cpu_count() or 1, workers),
+                (image_max_dim, jpeg_quality) if optimize_images else None,
+            )
+            log(f"Transforming EPUBs in {transform.workers} process(es)")
+        images = None
+        if optimize_images and transform is None:
+            images = ImageOptimizer(image_max_dim, jpeg_quality, image_workers)
+        if optimize_images:
+            where = f"{images.workers} process(es)" if images is not None else "in the transform processes"
+            log(f"Optimising images: max {image_max_dim}px, JPEG quality {jpeg_quality}, {where}")
+        total_skipped = 0
+        total_over_budget = 0
+        pipeline_started = time.perf_counter()
+        try:
+            with ReportWriter(out_reports / "kavita_epub_report.csv", report_cols) as report, \
+                    ReportWriter(out_reports / "collections.csv", collections_cols) as collections:
+                for res in run_pipeline(
+                    jobs, out_dir, no_collections, workers, max_per_host, max_memory_mb, journal, mirror_pool, images,
+                    transform, resume,
+                ):
+                    job = res.job
+                    timings = dict(res.timings, query=job.query_s)
+                    if res.status == "SKIPPED":
+                        total_skipped += 1
+                    elif res.status == "OVER_BUDGET":
+                        total_over_budget += 1
+                    else:
+                        total_attempted += 1
+                    if res.status in ("OK", "SKIPPED"):
+                        if res.status == "OK":
+                            total_success += 1
+                            processed_bytes += res.source_size
+                            image_bytes_saved += res.image_bytes_saved
+                            for stage, seconds in timings.items():
+                                stage_values[stage].append(seconds)
+                        if not no_collections:
+                            collections.write({
+                                "collection": job.subject,
+                                "position": str(job.position),
+                                "series_folder": res.series_folder,
+                                "file": str(res.final_path.relative_to(out_dir)),
+                                "title": job.title,
+                                "authors": "; ".join(job.authors) if job.authors else "Unknown",
+                                "gutenberg_id": str(job.gid),
+                            })
+                    elif res.status != "OVER_BUDGET":
+                        total_failed += 1
+                        error_type = classify_error("; ".join(res.notes))
+                        error_summary[error_type] = error_summary.get(error_type, 0) + 1
+
+                    report.write({
+                        "subject": job.subject,
+                        "position": str(job.position),
+                        "gutenberg_id": str(job.gid),
+                        "title": job.title,
+                        "authors": "; ".join(job.authors) if job.authors else "Unknown",
+                        "download_url": res.url or job.dl_url,
+                        "variant": url_variant(res.url) if res.url else job.variant,
+                        "variant_reason": job.variant_reason,
+                        "series_folder": res.series_folder or series_folder_from_meta(job.title, None),
+                        "rights": job.rights,
+                        "subjects": "; ".join(job.subjects),
+                        "status": res.status,
+                        "notes": "; ".join(res.notes),
+                        **{f"{stage}_s": f"{timings[stage]:.3f}" if stage in timings else "" for stage in STAGES},
+                        "bytes_in": str(res.source_size) if res.source_size else "",
+                        "bytes_out": str(res.output_size) if res.output_size else "",
+                        "image_bytes_saved": str(res.image_bytes_saved) if res.image_bytes_saved else "",
                     })
-
-            except Exception as e:
-                total_failed += 1
-                status = "ERROR"
-                error_msg = str(e)
-                notes.append(error_msg)
-                
-                # Track error types
-                if "404" in error_msg:
-                    error_summary["404 Not Found"] = error_summary.get("404 Not Found", 0) + 1
-                elif "Connection" in error_msg or "connection" in error_msg:
-                    error_summary["Connection Error"] = error_summary.get("Connection Error", 0) + 1
-                elif "Timeout" in error_msg or "timeout" in error_msg:
-                    error_summary["Timeout"] = error_summary.get("Timeout", 0) + 1
-                else:
-                    error_summary["Other Error"] = error_summary.get("Other Error", 0) + 1
-
-            report_rows.append({
-                "subject": subject,
-                "gutenberg_id": str(gid),
-                "title": title,
-                "authors": "; ".join(authors) if authors else "Unknown",
-                "download_url": dl_url,
-                "series_folder": series_name_used or series_folder_from_meta(title, None),
-                "rights": rights,
-                "status": status,
-                "notes": "; ".join(notes),
-            })
-
-    # Write reports
-    out_reports = out_dir / "_reports"
-    out_reports.mkdir(parents=True, exist_ok=True)
-
-    with (out_reports / "kavita_epub_report.csv").open("w", newline="", encoding="utf-8") as f:
-        cols = ["subject", "gutenberg_id", "title", "authors", "download_url",
-                "series_folder", "rights", "status", "notes"]
-        w = csv.DictWriter(f, fieldnames=cols)
-        w.writeheader()
-        w.writerows(report_rows)
-
-    with (out_reports / "collections.csv").open("w", newline="", encoding="utf-8") as f:
-        cols = ["collection", "position", "series_folder", "file", "title", "authors", "gutenberg_id"]
-        w = csv.DictWriter(f, fieldnames=cols)
-        w.writeheader()
-        w.writerows(collections_rows)
+        finally:
+            journal.close()
+            if images is not None:
+                images.close()
+            if transform is not None:
+                transform.close()
+    finally:
+        if response_cache is not None:
+            cache_stats = (response_cache.hits, response_cache.misses)
+            response_cache.close()
+            response_cache = None
+    pipeline_s = time.perf_counter() - pipeline_started
 
     readme = f"""# Kavita-ready EPUB dump (Self-Hosted Gutendex)
 
 - Library root: `{out_dir}`
-- Gutendex API: {gutendex_api}
-- Mode: {mode}
+- {f"Offline catalog: {catalog}" if offline is not None else f"Gutendex API: {gutendex_api}"}
+- Mode: {f"ids ({ids_file})" if ids is not None else mode}{f" (shard {shard[0]}/{shard[1]})" if shard is not None else ""}
 - Each **Series** is a folder
 - Embedded OPF metadata includes title, creators, language, subjects, and collections
 - Reports in `_reports/`:
   - `kavita_epub_report.csv`: Per-title status
   - `collections.csv`: Collection mapping
+  - `download_journal.sqlite3`: Per-book download state used to resume reruns
 
 ## Download Statistics
 - Total attempted: {total_attempted}
+- Skipped (already downloaded): {total_skipped}
+- Over storage budget: {total_over_budget}
 - Successful: {total_success}
 - Failed: {total_failed}
 - Success rate: {(total_success / total_attempted * 100) if total_attempted > 0 else 0:.1f}%
@@ -706,6 +2946,10 @@ def run(
     log("=" * 60)
     log(f"Download Summary:")
     log(f"  Total attempted: {total_attempted}")
+    if total_skipped:
+        log(f"  Skipped:         {total_skipped} (already downloaded)")
+    if total_over_budget:
+        log(f"  Over budget:     {total_over_budget} (not downloaded)")
     log(f"  Successful:      {total_success}")
     log(f"  Failed:          {total_failed}")
     
@@ -719,11 +2963,28 @@ def run(
         else:
             log(f"  Success rate:    {success_rate:.1f}% ✗")
     
+    log_stage_summary(log, STAGES, stage_values, books=total_success, total_bytes=processed_bytes, elapsed_s=pipeline_s)
+    if optimize_images:
+        log(f"Image optimisation saved {format_mb(image_bytes_saved)}"
+            + (f" ({image_bytes_saved / processed_bytes * 100:.1f}% of downloaded)" if processed_bytes else ""))
+
     if error_summary:
         log(f"\nError breakdown:")
         for error_type, count in sorted(error_summary.items(), key=lambda x: x[1], reverse=True):
             log(f"  {error_type}: {count}")
     
+    if len(mirror_pool.bases) > 1:
+        log("Mirrors (best first):")
+        mirror_pool.log_stats()
+
+    if cache_stats is not None:
+        log(f"Gutendex cache: {cache_stats[0]} hit(s), {cache_stats[1]} miss(es)")
+    if offline is not None:
+        offline.close()
+    if opds and shard is None:
+        import opds_catalog  # sibling script; only loaded when the catalog is wanted
+        opds_catalog.update_and_log(out_dir)
+
     log("=" * 60)
     log(f"\nLibrary root: {out_dir}")
     log(f"Reports in: {out_reports}")
@@ -756,9 +3017,9 @@ def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
     ap.add_argument(
         "--mode",
         type=str,
-        choices=["genres", "popular", "discover"],
+        choices=["genres", "popular", "discover", "all"],
         default="genres",
-        help="Download mode: genres (by subject), popular (most downloaded), or discover (auto-find genres)"
+        help="Download mode: genres (by subject), popular (most downloaded), discover (auto-find genres), or all (every EPUB, by Gutenberg ID)"
     )
     ap.add_argument(
         "--languages",
@@ -770,13 +3031,136 @@ def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
         "--mirror",
         type=str,
         default=MIRROR_BASE,
-        help=f"EPUB download mirror (default: {MIRROR_BASE})"
+        help=f"EPUB download mirror, or a comma-separated list to probe and fail over between (default: {MIRROR_BASE})"
     )
     ap.add_argument(
         "--sleep",
         type=float,
         default=1.0,
-        help="Seconds between EPUB downloads (default: 1.0)"
+        help="Minimum seconds between EPUB requests to the same mirror host, i.e. --rate 1/SLEEP (default: 1.0)"
+    )
+    ap.add_argument(
+        "--rate",
+        type=float,
+        default=None,
+        help="EPUB requests per second per mirror host; 0 means unlimited (default: 1/--sleep)"
+    )
+    ap.add_argument(
+        "--burst",
+        type=int,
+        default=DEFAULT_BURST,
+        help=f"Requests a mirror host may receive back-to-back before --rate applies (default: {DEFAULT_BURST})"
+    )
+    ap.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help=f"Concurrent EPUB downloads (default: {DEFAULT_WORKERS}, i.e. sequential)"
+    )
+    ap.add_argument(
+        "--max-per-host",
+        type=int,
+        default=DEFAULT_MAX_PER_HOST,
+        help=f"Max in-flight downloads per mirror host (default: {DEFAULT_MAX_PER_HOST})"
+    )
+    ap.add_argument(
+        "--max-memory-mb",
+        type=int,
+        default=DEFAULT_MAX_MEMORY_MB,
+        help=f"Per-worker memory ceiling for a downloaded EPUB before it spills to disk (default: {DEFAULT_MAX_MEMORY_MB})"
+    )
+    ap.add_argument(
+        "--no-resume",
+        action="store_true",
+        help="Re-download books the download journal already lists as done; the journal is still updated"
+    )
+    ap.add_argument(
+        "--cache-ttl-hours",
+        type=float,
+        default=DEFAULT_CACHE_TTL_HOURS,
+        help=f"Reuse cached Gutendex responses younger than this; 0 disables the cache (default: {DEFAULT_CACHE_TTL_HOURS:g})"
+    )
+    ap.add_argument(
+        "--cache-max-mb",
+        type=int,
+        default=DEFAULT_CACHE_MAX_MB,
+        help=f"Size cap for the Gutendex response cache, least recently used evicted first (default: {DEFAULT_CACHE_MAX_MB})"
+    )
+    ap.add_argument(
+        "--refresh-catalog",
+        action="store_true",
+        help="Ignore cached Gutendex responses this run (fresh responses are still cached)"
+    )
+    ap.add_argument(
+        "--discover-workers",
+        type=int,
+        default=DEFAULT_DISCOVER_WORKERS,
+        help=f"Concurrent Gutendex page fetches in discover mode (default: {DEFAULT_DISCOVER_WORKERS})"
+    )
+    ap.add_argument(
+        "--catalog",
+        type=str,
+        default="",
+        help="Select books from a local Project Gutenberg catalog (pg_catalog.csv, rdf-files.tar.bz2/.tar.zip or an extracted cache/epub dir) instead of Gutendex"
+    )
+    ap.add_argument(
+        "--ids-file",
+        type=str,
+        default="",
+        help="Download the Gutenberg IDs (or ebook URLs) listed in this file, one collection in file order; overrides --mode"
+    )
+    ap.add_argument(
+        "--ids-collection",
+        type=str,
+        default="",
+        help="Collection name for --ids-file (default: the file name)"
+    )
+    ap.add_argument(
+        "--optimize-images",
+        action="store_true",
+        help="Downscale and re-encode large EPUB images (requires Pillow)"
+    )
+    ap.add_argument(
+        "--image-max-dim",
+        type=int,
+        default=DEFAULT_IMAGE_MAX_DIM,
+        help=f"With --optimize-images, longest image side in pixels (default: {DEFAULT_IMAGE_MAX_DIM})"
+    )
+    ap.add_argument(
+        "--jpeg-quality",
+        type=int,
+        default=DEFAULT_JPEG_QUALITY,
+        help=f"With --optimize-images, JPEG quality 1-95 (default: {DEFAULT_JPEG_QUALITY})"
+    )
+    ap.add_argument(
+        "--image-workers",
+        type=int,
+        default=None,
+        help="With --optimize-images, image processes when EPUBs are transformed in this process (default: one per CPU)"
+    )
+    ap.add_argument(
+        "--transform-workers",
+        type=int,
+        default=None,
+        help="With --workers > 1, processes that clean, embed and write the downloaded EPUBs; 0 uses one thread of this process (default: one per CPU, at most --workers)"
+    )
+    ap.add_argument(
+        "--budget-gb",
+        type=float,
+        default=0.0,
+        help="Total library size limit in GB; picks the images or text-only EPUB per book to fit (default: 0, no limit)"
+    )
+    ap.add_argument(
+        "--shard",
+        type=parse_shard,
+        default=None,
+        metavar="I/N",
+        help="Download only shard I of N (books with Gutenberg ID %% N == I-1); reports go to _reports/shard-I-of-N/"
+    )
+    ap.add_argument(
+        "--merge-shards",
+        action="store_true",
+        help="Merge the per-shard reports and journals under --out into _reports/ and exit"
     )
     ap.add_argument(
         "--count-per-genre",
@@ -801,6 +3185,11 @@ def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
         action="store_true",
         help="Skip collection metadata"
     )
+    ap.add_argument(
+        "--no-opds",
+        action="store_true",
+        help="Don't update the static OPDS catalog in <out>/opds/ after the run"
+    )
     ap.add_argument(
         "--debug",
         action="store_true",
@@ -819,6 +3208,21 @@ def main(argv: Optional[Sequence[str]] = None) -> int:
         if args.genres.strip()
         else None
     )
+    if args.merge_shards:
+        return merge_shard_reports(out_dir, opds=not args.no_opds)
+
+    if args.optimize_images and Image is None:
+        log("✗ --optimize-images needs Pillow: pip install Pillow")
+        return 2
+
+    ids_file = Path(args.ids_file).expanduser() if args.ids_file else None
+    if ids_file is not None and not ids_file.is_file():
+        log(f"✗ IDs file not found: {ids_file}")
+        return 2
+    catalog = Path(args.catalog).expanduser() if args.catalog else None
+    if catalog is not None and not catalog.exists():
+        log(f"✗ Offline catalog not found: {catalog}")
+        return 2
     
     return run(
         gutendex_api=args.gutendex_url,
@@ -827,12 +3231,33 @@ def main(argv: Optional[Sequence[str]] = None) -> int:
         languages=args.languages,
         mirror=args.mirror,
         sleep_s=args.sleep,
+        rate=args.rate,
+        burst=args.burst,
         count_per_genre=args.count_per_genre,
         genres_top=args.genres_top,
         genres_list=genres_list,
         no_collections=args.no_collections,
         discover_subjects=(args.mode == "discover"),
         debug=args.debug,
+        workers=args.workers,
+        max_per_host=args.max_per_host,
+        max_memory_mb=args.max_memory_mb,
+        resume=not args.no_resume,
+        cache_ttl_hours=args.cache_ttl_hours,
+        cache_max_mb=args.cache_max_mb,
+        refresh_catalog=args.refresh_catalog,
+        discover_workers=args.discover_workers,
+        catalog=catalog,
+        shard=args.shard,
+        budget_gb=args.budget_gb,
+        ids_file=ids_file,
+        ids_collection=args.ids_collection,
+        optimize_images=args.optimize_images,
+        image_max_dim=args.image_max_dim,
+        jpeg_quality=args.jpeg_quality,
+        image_workers=args.image_workers,
+        transform_workers=args.transform_workers,
+        opds=not args.no_opds,
     )
 
 
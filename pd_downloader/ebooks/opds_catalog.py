@@ -0,0 +1,672 @@
+#!/usr/bin/env python3
+"""
+Static OPDS Catalog Builder
+Writes a paginated OPDS catalog of a library built by the ebook downloaders,
+grouped by series folder, subject and collection, so any reading app can
+browse it from a static web server (nginx, uhttpd) without Kavita.
+The downloaders run it at the end of every run; see GUTENBERG_README.md.
+"""
+
+import argparse
+import csv
+import json
+import os
+import posixpath
+import re
+import sqlite3
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Set, Tuple
+from urllib.parse import quote
+
+import xml.etree.ElementTree as ET
+
+# ---------------------------- Config ----------------------------
+
+CATALOG_DIR = "opds"  # under the library root, next to the series folders
+DEFAULT_PAGE_SIZE = 50  # entries per feed page
+
+ATOM_NS = "http://www.w3.org/2005/Atom"
+OPDS_NS = "http://opds-spec.org/2010/catalog"
+NAV_TYPE = "application/atom+xml;profile=opds-catalog;kind=navigation"
+ACQ_TYPE = "application/atom+xml;profile=opds-catalog;kind=acquisition"
+ACQUISITION_REL = "http://opds-spec.org/acquisition"
+EPUB_MIME = "application/epub+zip"
+
+# Where each downloader records what it saved
+GUTENDEX_JOURNAL = "download_journal.sqlite3"
+GUTENDEX_REPORT = "kavita_epub_report.csv"
+GUTENDEX_COLLECTIONS = "collections.csv"
+SE_INDEX = "se_library_index.sqlite3"
+SE_REPORT = "se_library_report.csv"
+SE_COLLECTION = "Standard Ebooks"
+
+# (directory, navigation title) of each grouping
+GROUPS = (("series", "By Series"), ("subjects", "By Subject"), ("collections", "By Collection"))
+
+ET.register_namespace("", ATOM_NS)
+ET.register_namespace("opds", OPDS_NS)
+
+
+# ---------------------------- Helpers ----------------------------
+
+
+def log(msg: str) -> None:
+    print(f"[opds-catalog] {msg}", flush=True)
+
+
+def feed_slug(name: str) -> str:
+    s = re.sub(r"[^\w.-]+", "_", name.strip().lower()).strip("._")
+    return s[:80] or "untitled"
+
+
+def iso_mtime(seconds: float) -> str:
+    return datetime.fromtimestamp(int(seconds), timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _read_csv(path: Path) -> Iterator[Dict[str, str]]:
+    if not path.is_file():
+        return
+    with path.open(newline="", encoding="utf-8") as f:
+        yield from csv.DictReader(f)
+
+
+def _split(value: str, sep: str) -> List[str]:
+    return [part.strip() for part in (value or "").split(sep) if part.strip()]
+
+
+# ---------------------------- Book store ----------------------------
+
+
+class CatalogStore:
+    """
+    Metadata of every book in the catalog, in `_reports/opds_catalog.sqlite3`.
+
+    Each downloader's report only covers its latest run, so the catalog keeps
+    its own copy keyed by the book's path under the library root.  Rows are
+    upserted from the reports and dropped once the journal/index no longer
+    lists the file; subjects and collections accumulate across runs, as the
+    EPUBs themselves only ever gain them.  Each row also keeps the entry as
+    it was last rendered, and the store the catalog's settings and feed
+    slugs, so a rerun only re-renders the feeds whose books changed.
+    """
+
+    FILENAME = "opds_catalog.sqlite3"
+
+    def __init__(self, reports_dir: Path):
+        self.path = reports_dir / self.FILENAME
+        self._db = sqlite3.connect(str(self.path))
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS books (
+                file TEXT PRIMARY KEY,
+                book_id TEXT NOT NULL,
+                title TEXT NOT NULL,
+                authors TEXT NOT NULL,
+                subjects TEXT NOT NULL,
+                collections TEXT NOT NULL,
+                rendered TEXT NOT NULL DEFAULT ''
+            )"""
+        )
+        if "rendered" not in [r[1] for r in self._db.execute("PRAGMA table_info(books)")]:
+            self._db.execute("ALTER TABLE books ADD COLUMN rendered TEXT NOT NULL DEFAULT ''")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS settings (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            )"""
+        )
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS slugs (
+                grp TEXT NOT NULL,
+                name TEXT NOT NULL,
+                slug TEXT NOT NULL,
+                PRIMARY KEY (grp, name)
+            )"""
+        )
+        self._db.commit()
+
+    def upsert(
+        self,
+        file: str,
+        book_id: str,
+        title: str,
+        authors: List[str],
+        subjects: List[str],
+        collections: Dict[str, Optional[int]],
+    ) -> None:
+        row = self._db.execute(
+            "SELECT subjects, collections FROM books WHERE file = ?", (file,)
+        ).fetchone()
+        if row is not None:
+            subjects = list(dict.fromkeys(json.loads(row[0]) + subjects))
+            collections = {**json.loads(row[1]), **collections}
+        self._db.execute(
+            """INSERT INTO books (file, book_id, title, authors, subjects, collections) VALUES (?, ?, ?, ?, ?, ?)
+               ON CONFLICT (file) DO UPDATE SET book_id = excluded.book_id, title = excluded.title,
+                   authors = excluded.authors, subjects = excluded.subjects, collections = excluded.collections""",
+            (file, book_id, title, json.dumps(authors), json.dumps(subjects), json.dumps(collections)),
+        )
+
+    def files(self) -> Set[str]:
+        return {row[0] for row in self._db.execute("SELECT file FROM books")}
+
+    def remove(self, files: Set[str]) -> None:
+        self._db.executemany("DELETE FROM books WHERE file = ?", [(f,) for f in files])
+
+    def books(self) -> List[Dict]:
+        """Every book; "rendered" is its entry as last written to the catalog ("" if never)."""
+        out = []
+        for file, book_id, title, authors, subjects, collections, rendered in self._db.execute(
+            "SELECT file, book_id, title, authors, subjects, collections, rendered FROM books"
+        ):
+            out.append({
+                "file": file,
+                "id": book_id,
+                "title": title,
+                "authors": json.loads(authors),
+                "subjects": json.loads(subjects),
+                "collections": json.loads(collections),
+                "rendered": rendered,
+            })
+        return out
+
+    def mark_rendered(self, states: Dict[str, str]) -> None:
+        self._db.executemany("UPDATE books SET rendered = ? WHERE file = ?", [(v, k) for k, v in states.items()])
+
+    def setting(self, key: str) -> Optional[str]:
+        row = self._db.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def save_setting(self, key: str, value: str) -> None:
+        self._db.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, value))
+
+    def slugs(self, group: str) -> Dict[str, str]:
+        return dict(self._db.execute("SELECT name, slug FROM slugs WHERE grp = ?", (group,)))
+
+    def save_slugs(self, group: str, slugs: Dict[str, str]) -> None:
+        self._db.execute("DELETE FROM slugs WHERE grp = ?", (group,))
+        self._db.executemany(
+            "INSERT INTO slugs (grp, name, slug) VALUES (?, ?, ?)", [(group, k, v) for k, v in slugs.items()]
+        )
+
+    def close(self) -> None:
+        self._db.commit()
+        self._db.close()
+
+
+def sync_gutendex(store: CatalogStore, reports: Path) -> Optional[Set[str]]:
+    """Upsert the Gutendex downloader's reported books; returns the files its journal lists as done."""
+    journal = reports / GUTENDEX_JOURNAL
+    if not journal.is_file():
+        return None
+    db = sqlite3.connect(str(journal))
+    try:
+        done = {
+            str(gid): file
+            for gid, file in db.execute(
+                "SELECT gutenberg_id, file FROM books WHERE status = 'done' AND file IS NOT NULL"
+            )
+        }
+    finally:
+        db.close()
+
+    collections: Dict[str, Dict[str, Optional[int]]] = {}
+    for row in _read_csv(reports / GUTENDEX_COLLECTIONS):
+        position = int(row["position"]) if row.get("position", "").isdigit() else None
+        collections.setdefault(row["file"], {})[row["collection"]] = position
+    for row in _read_csv(reports / GUTENDEX_REPORT):
+        file = done.get(row.get("gutenberg_id", ""))
+        if file is None or row.get("status") not in ("OK", "SKIPPED"):
+            continue
+        store.upsert(
+            file,
+            f"https://www.gutenberg.org/ebooks/{row['gutenberg_id']}",
+            row.get("title") or Path(file).stem,
+            [a for a in _split(row.get("authors", ""), ";") if a != "Unknown"],
+            _split(row.get("subjects", ""), ";") or _split(row.get("subject", ""), ";"),
+            collections.get(file, {}),
+        )
+    return set(done.values())
+
+
+def sync_standard_ebooks(store: CatalogStore, reports: Path) -> Optional[Set[str]]:
+    """Upsert the Standard Ebooks downloader's reported books; returns the files its index lists."""
+    index = reports / SE_INDEX
+    if not index.is_file():
+        return None
+    db = sqlite3.connect(str(index))
+    try:
+        saved = dict(db.execute("SELECT entry_id, file FROM books"))
+    finally:
+        db.close()
+
+    for row in _read_csv(reports / SE_REPORT):
+        file = saved.get(row.get("id", ""))
+        if file is None or row.get("status") not in ("OK", "SKIPPED"):
+            continue
+        store.upsert(
+            file,
+            row["id"],
+            row.get("title") or Path(file).stem,
+            [a for a in _split(row.get("authors", ""), ",") if a != "Unknown"],
+            _split(row.get("categories", ""), ";"),
+            {SE_COLLECTION: None},
+        )
+    return set(saved.values())
+
+
+# ---------------------------- Feed rendering ----------------------------
+
+
+def _el(parent: ET.Element, tag: str, text: Optional[str] = None, **attrs: str) -> ET.Element:
+    el = ET.SubElement(parent, f"{{{ATOM_NS}}}{tag}", {k: v for k, v in attrs.items() if v is not None})
+    if text is not None:
+        el.text = text
+    return el
+
+
+def _href(feed_path: str, target: str) -> str:
+    """URL of `target` relative to the feed at `feed_path` (both relative to the catalog dir)."""
+    return quote(posixpath.relpath(target, posixpath.dirname(feed_path) or "."))
+
+
+def _feed(
+    path: str,
+    feed_id: str,
+    title: str,
+    updated: str,
+    kind: str,
+    up: Optional[str],
+    page: int = 1,
+    pages: int = 1,
+) -> ET.Element:
+    """A feed element for `path` with its self/start/up and pagination links."""
+    feed = ET.Element(f"{{{ATOM_NS}}}feed")
+    _el(feed, "id", feed_id if page == 1 else f"{feed_id}:page:{page}")
+    _el(feed, "title", title)
+    _el(feed, "updated", updated)
+    _el(feed, "link", rel="self", href=_href(path, path), type=kind)
+    _el(feed, "link", rel="start", href=_href(path, "index.xml"), type=NAV_TYPE)
+    if up:
+        _el(feed, "link", rel="up", href=_href(path, up), type=NAV_TYPE)
+    if pages > 1:
+        stem = path.rsplit("-", 1)[0]
+        _el(feed, "link", rel="first", href=_href(path, f"{stem}-1.xml"), type=kind)
+        if page > 1:
+            _el(feed, "link", rel="previous", href=_href(path, f"{stem}-{page - 1}.xml"), type=kind)
+        if page < pages:
+            _el(feed, "link", rel="next", href=_href(path, f"{stem}-{page + 1}.xml"), type=kind)
+        _el(feed, "link", rel="last", href=_href(path, f"{stem}-{pages}.xml"), type=kind)
+    return feed
+
+
+def _book_entry(feed: ET.Element, feed_path: str, book: Dict) -> None:
+    entry = _el(feed, "entry")
+    _el(entry, "title", book["title"])
+    _el(entry, "id", book["id"])
+    _el(entry, "updated", book["updated"])
+    for name in book["authors"]:
+        _el(_el(entry, "author"), "name", name)
+    for subject in book["subjects"]:
+        _el(entry, "category", term=subject, label=subject)
+    _el(entry, "content", f"Series: {book['series']}", type="text")
+    _el(
+        entry,
+        "link",
+        rel=ACQUISITION_REL,
+        type=EPUB_MIME,
+        # Book files are relative to the library root, the catalog dir's parent
+        href=_href(feed_path, "../" + book["file"]),
+        length=str(book["size"]),
+    )
+
+
+def _nav_entry(feed: ET.Element, feed_path: str, title: str, target: str, entry_id: str, updated: str, count: int) -> None:
+    entry = _el(feed, "entry")
+    _el(entry, "title", title)
+    _el(entry, "id", entry_id)
+    _el(entry, "updated", updated)
+    _el(entry, "content", f"{count} book(s)", type="text")
+    _el(entry, "link", rel="subsection", href=_href(feed_path, target), type=ACQ_TYPE)
+
+
+def _paginate(items: Sequence, page_size: int) -> List[Sequence]:
+    return [items[i:i + page_size] for i in range(0, len(items), page_size)] or [items[:0]]
+
+
+def _page_count(items: int, page_size: int) -> int:
+    return max(1, -(-items // page_size))
+
+
+def _members(book: Dict) -> Dict[str, Dict[str, Optional[int]]]:
+    """The group members (and collection positions) a book is listed under, per grouping."""
+    return {
+        "series": {book["series"]: None},
+        "subjects": dict.fromkeys(book["subjects"]),
+        "collections": book["collections"],
+    }
+
+
+def _entry_state(book: Dict) -> str:
+    """Everything a book's catalog entries and feed placement depend on, as stable JSON."""
+    return json.dumps(
+        {k: book[k] for k in ("id", "title", "authors", "subjects", "collections", "series", "file", "updated", "size")},
+        sort_keys=True,
+    )
+
+
+def _order_key(book: Dict) -> Tuple[str, str]:
+    return book["title"].lower(), book["file"]
+
+
+def _member_key(position: Optional[int], book: Dict) -> Tuple:
+    # Collections keep their reading order; books without a position follow by title
+    return (position is None, position or 0) + _order_key(book)
+
+
+def _stale_pages(keys: List[Tuple], old_keys: List[Tuple], changed: Set[int], page_size: int) -> Optional[Set[int]]:
+    """
+    Pages of a feed to re-render, from the sort keys of its entries now and
+    when last rendered and the indexes of entries that changed; None for all.
+    """
+    pages = _page_count(len(keys), page_size)
+    if pages != _page_count(len(old_keys), page_size):
+        return None  # every page links to the last one
+    # Pages before the first moved entry only change if one of their own entries did
+    moved = next((i for i, (new, old) in enumerate(zip(keys, old_keys)) if new != old), None)
+    if moved is None and len(keys) != len(old_keys):
+        moved = min(len(keys), len(old_keys))
+    stale = set(range(moved // page_size + 1, pages + 1)) if moved is not None else set()
+    return stale | {i // page_size + 1 for i in changed}
+
+
+def _write_if_changed(path: Path, data: bytes) -> bool:
+    try:
+        if path.read_bytes() == data:
+            return False
+    except FileNotFoundError:
+        path.parent.mkdir(parents=True, exist_ok=True)
+    part = path.with_name(path.name + ".part")
+    part.write_bytes(data)
+    os.replace(part, path)
+    return True
+
+
+@dataclass
+class CatalogChanges:
+    """What changed since the catalog was last rendered."""
+    files: Set[str]                      # books added, changed or removed
+    members: Dict[str, Set[str]]         # grouping -> members those books were or are listed under
+    old_order: List[Tuple[str, str]]     # _order_key() of the books as last rendered, sorted
+    old_members: Dict[str, Dict[str, List[Tuple]]]  # grouping -> member -> sorted _member_key()s, as last rendered
+    old_slugs: Dict[str, Dict[str, str]]  # grouping -> member -> feed slug as last rendered
+
+
+def render_catalog(
+    catalog: Path, books: List[Dict], title: str, page_size: int, changes: Optional[CatalogChanges] = None
+) -> Tuple[int, Set[str], Dict[str, Dict[str, str]]]:
+    """
+    Write the catalog's feeds under `catalog`, each as soon as it is rendered
+    and only if its bytes changed.
+
+    Without `changes` every feed is rendered.  With it, only the feeds the
+    changes can reach are: pages of the `all` feed and of the members they
+    name from the first one whose books moved, plus pages holding a changed
+    book (every page if the page count changed); feeds of members whose slug
+    moved; and the navigation feeds and index.xml, which only hold one entry
+    per member.  Returns (feeds written,
+    path of every feed of the catalog, member -> slug per grouping).
+    """
+    base_id = f"urn:prepper-pi:opds:{feed_slug(title)}"
+    newest = max((b["updated"] for b in books), default=iso_mtime(0))
+    paths: Set[str] = set()
+    written = 0
+
+    def _emit(path: str, feed: ET.Element) -> None:
+        nonlocal written
+        written += _write_if_changed(catalog / path, ET.tostring(feed, encoding="utf-8", xml_declaration=True))
+
+    def _acquisition(
+        stem: str, feed_id: str, feed_title: str, items: List[Dict], up: str, render: Optional[Set[int]] = None
+    ) -> str:
+        """Paths of a paginated acquisition feed; renders the pages in `render` (all if None)."""
+        pages = _paginate(items, page_size)
+        for n, page_books in enumerate(pages, 1):
+            path = f"{stem}-{n}.xml"
+            paths.add(path)
+            if render is not None and n not in render:
+                continue
+            updated = max((b["updated"] for b in page_books), default=newest)
+            feed = _feed(path, feed_id, feed_title, updated, ACQ_TYPE, up, n, len(pages))
+            for book in page_books:
+                _book_entry(feed, path, book)
+            _emit(path, feed)
+        return f"{stem}-1.xml"
+
+    def _changed(items: List[Dict]) -> Set[int]:
+        return {i for i, b in enumerate(items) if b["file"] in changes.files}
+
+    by_title = sorted(books, key=_order_key)
+    render_all: Optional[Set[int]] = None
+    if changes is not None:
+        render_all = _stale_pages([_order_key(b) for b in by_title], changes.old_order, _changed(by_title), page_size)
+    root = _feed("index.xml", base_id, title, newest, NAV_TYPE, None)
+    all_path = _acquisition("all", f"{base_id}:all", "All Books", by_title, "index.xml", render_all)
+    _nav_entry(root, "index.xml", "All Books", all_path, f"{base_id}:all", newest, len(books))
+
+    all_slugs: Dict[str, Dict[str, str]] = {}
+    for group, group_title in GROUPS:
+        members: Dict[str, List[Tuple[Optional[int], Dict]]] = {}
+        for book in by_title:
+            for name, position in _members(book)[group].items():
+                members.setdefault(name, []).append((position, book))
+
+        # One acquisition feed per group member, then a paginated navigation feed over them
+        nav_items = []
+        slugs: Dict[str, str] = {}
+        used: Set[str] = set()
+        for name in sorted(members, key=str.lower):
+            slug = feed_slug(name)
+            n = 2
+            while slug in used:
+                slug, n = f"{feed_slug(name)}-{n}", n + 1
+            used.add(slug)
+            slugs[name] = slug
+            ordered = sorted(members[name], key=lambda pb: _member_key(*pb))
+            items = [b for _, b in ordered]
+            render: Optional[Set[int]] = None
+            if changes is not None and changes.old_slugs.get(group, {}).get(name) == slug:
+                if name in changes.members[group]:
+                    render = _stale_pages(
+                        [_member_key(*pb) for pb in ordered], changes.old_members[group].get(name, []),
+                        _changed(items), page_size,
+                    )
+                else:
+                    render = set()
+            first = _acquisition(f"{group}/{slug}", f"{base_id}:{group}:{slug}", name, items, f"{group}-1.xml", render)
+            nav_items.append((name, first, slug, max(b["updated"] for b in items), len(items)))
+        all_slugs[group] = slugs
+
+        pages = _paginate(nav_items, page_size)
+        for n, page_items in enumerate(pages, 1):
+            path = f"{group}-{n}.xml"
+            paths.add(path)
+            updated = max((item[3] for item in page_items), default=newest)
+            feed = _feed(path, f"{base_id}:{group}", group_title, updated, NAV_TYPE, "index.xml", n, len(pages))
+            for name, first, slug, item_updated, count in page_items:
+                _nav_entry(feed, path, name, first, f"{base_id}:{group}:{slug}", item_updated, count)
+            _emit(path, feed)
+        entry = _el(root, "entry")
+        _el(entry, "title", group_title)
+        _el(entry, "id", f"{base_id}:{group}")
+        _el(entry, "updated", newest)
+        _el(entry, "content", f"{len(nav_items)} group(s)", type="text")
+        _el(entry, "link", rel="subsection", href=f"{group}-1.xml", type=NAV_TYPE)
+
+    paths.add("index.xml")
+    _emit("index.xml", root)
+    return written, paths, all_slugs
+
+
+# ---------------------------- Catalog update ----------------------------
+
+
+def update_catalog(
+    library_root: Path, title: Optional[str] = None, page_size: int = DEFAULT_PAGE_SIZE
+) -> Tuple[int, int, int]:
+    """
+    Refresh the catalog store from the downloaders' journals and reports, then
+    bring `<library_root>/opds/` up to date.
+
+    Books whose entry differs from the one last rendered (new, changed, moved
+    or gone, judged by metadata and file time/size) decide which feeds are
+    re-rendered; with none, no feed is touched.  A new title or page size, or
+    a missing index.xml, renders everything.  Feeds are deterministic (each
+    feed's <updated> is its newest book's file time), and only files whose
+    content changed are rewritten, so a web server's caching validators stay
+    valid.  Returns (books, feeds written, feeds removed).
+    """
+    reports = library_root / "_reports"
+    reports.mkdir(parents=True, exist_ok=True)
+    catalog = library_root / CATALOG_DIR
+    title = title or library_root.name
+    store = CatalogStore(reports)
+    try:
+        listed: Set[str] = set()
+        for files in (sync_gutendex(store, reports), sync_standard_ebooks(store, reports)):
+            listed |= files or set()
+        # Books saved before their downloader wrote reports still get an entry
+        for file in listed - store.files():
+            store.upsert(file, f"urn:prepper-pi:file:{quote(file)}", Path(file).stem, [], [], {})
+
+        settings = json.dumps({"title": title, "page_size": page_size})
+        full = store.setting("catalog") != settings or not (catalog / "index.xml").is_file()
+        books: List[Dict] = []
+        states: Dict[str, str] = {}
+        gone: Set[str] = set()
+        changes = CatalogChanges(set(), {group: set() for group, _ in GROUPS}, [], {}, {})
+        as_rendered: List[Dict] = []  # each book as its entries were last rendered
+
+        def _touch(book: Dict) -> None:
+            changes.files.add(book["file"])
+            for group, names in _members(book).items():
+                changes.members[group].update(names)
+
+        for book in store.books():
+            rendered = book.pop("rendered")
+            try:
+                st = (library_root / book["file"]).stat()
+            except FileNotFoundError:
+                st = None
+            if book["file"] not in listed or st is None:
+                gone.add(book["file"])
+                if rendered:
+                    old = json.loads(rendered)
+                    as_rendered.append(old)
+                    _touch(old)
+                continue
+            book["updated"] = iso_mtime(st.st_mtime)
+            book["size"] = st.st_size
+            book["series"] = Path(book["file"]).parent.name
+            books.append(book)
+            state = _entry_state(book)
+            if state == rendered:
+                as_rendered.append(book)
+                continue
+            states[book["file"]] = state
+            _touch(book)
+            if rendered:
+                old = json.loads(rendered)
+                as_rendered.append(old)
+                _touch(old)
+
+        if changes.files and not full:
+            # Entry order of the `all` feed and of the touched members' feeds as last rendered
+            changes.old_order = sorted(_order_key(b) for b in as_rendered)
+            changes.old_members = {group: {name: [] for name in names} for group, names in changes.members.items()}
+            for old in as_rendered:
+                for group, names in _members(old).items():
+                    for name, position in names.items():
+                        if name in changes.old_members[group]:
+                            changes.old_members[group][name].append(_member_key(position, old))
+            for old_members in changes.old_members.values():
+                for keys in old_members.values():
+                    keys.sort()
+            changes.old_slugs = {group: store.slugs(group) for group, _ in GROUPS}
+        del as_rendered
+
+        written = removed = 0
+        if full or changes.files:
+            written, paths, slugs = render_catalog(catalog, books, title, page_size, None if full else changes)
+            for path in sorted(catalog.rglob("*.xml"), reverse=True):
+                if path.relative_to(catalog).as_posix() not in paths:
+                    path.unlink()
+                    removed += 1
+            for path in sorted(catalog.rglob("*"), reverse=True):
+                if path.is_dir() and not any(path.iterdir()):
+                    path.rmdir()
+            # Recorded only once the feeds are on disk, so an interrupted update is redone
+            store.mark_rendered({book["file"]: _entry_state(book) for book in books} if full else states)
+            for group, group_slugs in slugs.items():
+                store.save_slugs(group, group_slugs)
+            store.save_setting("catalog", settings)
+        store.remove(gone)
+    finally:
+        store.close()
+    return len(books), written, removed
+
+
+def update_and_log(library_root: Path, title: Optional[str] = None, page_size: int = DEFAULT_PAGE_SIZE) -> None:
+    """update_catalog() for the downloaders: logs the result, and never fails their run."""
+    started = time.perf_counter()
+    try:
+        books, written, removed = update_catalog(library_root, title, page_size)
+    except Exception as e:
+        log(f"⚠ OPDS catalog not updated: {e}")
+        return
+    log(f"OPDS catalog: {books} book(s), {written} feed(s) written, {removed} removed "
+        f"in {time.perf_counter() - started:.1f}s -> {library_root / CATALOG_DIR / 'index.xml'}")
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    ap = argparse.ArgumentParser(
+        description="Write a static OPDS catalog of a library built by the ebook downloaders"
+    )
+    ap.add_argument(
+        "--out",
+        required=True,
+        help="Library root given to the downloader as --out"
+    )
+    ap.add_argument(
+        "--title",
+        default="",
+        help="Catalog title (default: the library folder name)"
+    )
+    ap.add_argument(
+        "--page-size",
+        type=int,
+        default=DEFAULT_PAGE_SIZE,
+        help=f"Entries per feed page (default: {DEFAULT_PAGE_SIZE})"
+    )
+    return ap.parse_args(argv)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = parse_args(argv)
+    library_root = Path(args.out).resolve()
+    if not library_root.is_dir():
+        log(f"✗ Library not found: {library_root}")
+        return 2
+    if args.page_size < 1:
+        log("✗ --page-size must be at least 1")
+        return 2
+    books, written, removed = update_catalog(library_root, args.title or None, args.page_size)
+    log(f"{books} book(s), {written} feed(s) written, {removed} removed -> {library_root / CATALOG_DIR / 'index.xml'}")
+    return 0
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
@@ -6,22 +6,50 @@ See README.md for usage instructions and requirements.
 """
 
 import argparse
+import array
 import csv
 import io
+import itertools
+import multiprocessing
 import os
 import re
+import shutil
+import sqlite3
+import tempfile
+import threading
 import time
 import zipfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, List, Optional, Sequence, Tuple
+from typing import BinaryIO, Dict, Iterator, List, Optional, Sequence, Tuple
 from urllib.parse import urljoin, urlparse
 
 import xml.etree.ElementTree as ET
 import requests
 
+from download_common import DEFAULT_BURST, RateLimiter, ReportWriter, copy_member_raw, log_stage_summary
+
 DEFAULT_OPDS_URL = "https://standardebooks.org/feeds/opds"
 DEFAULT_UA = "SE-Library-Kavita-Full/1.0 (+no-email)"
 EPUB_MIME = "application/epub+zip"
+ATOM_NS = "http://www.w3.org/2005/Atom"
+
+# Feed pages are parsed as they arrive, this many bytes at a time
+FEED_CHUNK = 64 * 1024
+
+# 429/503 answers waited out per request (--rate/--burst, or 1/--sleep, pace the rest)
+MAX_RETRIES = 3
+
+# Per-book stages timed in the report and the end-of-run summary
+STAGES = ("query", "download", "embed", "write")
+
+# Concurrent EPUB downloads (--workers); --rate/--burst still pace every request
+DEFAULT_WORKERS = 3
+
+# Downloads are handed to the transform processes by path
+DOWNLOAD_SUFFIX = ".epub.download"
 
 
 def log(msg: str) -> None:
@@ -35,6 +63,25 @@ def slugify(s: str) -> str:
     return s or "Untitled"
 
 
+def limited_get(
+    sess: requests.Session, limiter: RateLimiter, url: str, **kwargs
+) -> Tuple[requests.Response, float]:
+    """
+    GET `url` within the host's budget, waiting out up to MAX_RETRIES
+    429/503 answers.  Returns (response, seconds spent waiting for the limiter).
+    """
+    waited = limiter.acquire(url)
+    r = sess.get(url, **kwargs)
+    for _ in range(MAX_RETRIES):
+        if limiter.defer(r) is None:
+            break
+        log(f"  HTTP {r.status_code} from {urlparse(url).netloc}; retrying after Retry-After")
+        r.close()
+        waited += limiter.acquire(url)
+        r = sess.get(url, **kwargs)
+    return r, waited
+
+
 def build_session(
     api_key: str, headers: List[str], cookies: List[str]
 ) -> requests.Session:
@@ -56,52 +103,172 @@ def build_session(
     return sess
 
 
-def fetch_feed(sess: requests.Session, url: str, sleep_s: float) -> ET.Element:
-    r = sess.get(url, timeout=45)
-    r.raise_for_status()
-    time.sleep(sleep_s / 2.0)
-    return ET.fromstring(r.content)
-
+class FeedStream:
+    """
+    One OPDS feed page, parsed while it downloads.
+
+    A background thread copies the response body into an unnamed temp file
+    as fast as the network delivers it, so the connection is not left idle
+    while the caller downloads books between entries.  Iterating feeds that
+    file to an XMLPullParser and yields each <entry> as soon as it is
+    complete; parsed entries are dropped from the tree, so memory stays at
+    about one entry whatever the size of the page.  `next_link` is set once
+    the feed's rel="next" link has been parsed (at the latest when iteration
+    ends), and `read_s` is the time iteration spent waiting and parsing.
+    """
 
-def find_next_link(feed_root: ET.Element) -> Optional[str]:
-    for link in feed_root.findall("{http://www.w3.org/2005/Atom}link"):
-        if link.get("rel") == "next" and link.get("href"):
-            return link.get("href")
-    return None
+    def __init__(self, response: requests.Response):
+        self.next_link: Optional[str] = None
+        self.read_s = 0.0
+        self._response = response
+        self._buf = tempfile.TemporaryFile()
+        self._cond = threading.Condition()
+        self._size = 0
+        self._done = False
+        self._closed = False
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._spool, name="feed", daemon=True)
+        self._thread.start()
+
+    def _spool(self) -> None:
+        try:
+            for chunk in self._response.iter_content(chunk_size=FEED_CHUNK):
+                with self._cond:
+                    if self._closed:
+                        return
+                    self._buf.seek(self._size)
+                    self._buf.write(chunk)
+                    self._size += len(chunk)
+                    self._cond.notify()
+        except BaseException as e:
+            self._error = e
+        finally:
+            with self._cond:
+                self._done = True
+                self._cond.notify()
+
+    def _chunks(self) -> Iterator[bytes]:
+        pos = 0
+        while True:
+            with self._cond:
+                while pos >= self._size and not self._done:
+                    self._cond.wait()
+                if pos >= self._size:
+                    if self._error is not None:
+                        raise self._error
+                    return
+                self._buf.seek(pos)
+                data = self._buf.read(min(self._size - pos, FEED_CHUNK))
+            pos += len(data)
+            yield data
+
+    def __iter__(self) -> Iterator[Dict]:
+        parser = ET.XMLPullParser(events=("start", "end"))
+        root = None
+        depth = 0
+        started = time.perf_counter()
+        for data in itertools.chain(self._chunks(), [b""]):
+            if data:
+                parser.feed(data)
+            else:
+                parser.close()
+            for event, el in parser.read_events():
+                if event == "start":
+                    depth += 1
+                    if root is None:
+                        root = el
+                    continue
+                depth -= 1
+                if depth != 1:
+                    continue
+                if el.tag == f"{{{ATOM_NS}}}link":
+                    if el.get("rel") == "next" and el.get("href") and self.next_link is None:
+                        self.next_link = el.get("href")
+                elif el.tag == f"{{{ATOM_NS}}}entry":
+                    entry = parse_entry(el)
+                    root.remove(el)
+                    self.read_s += time.perf_counter() - started
+                    yield entry
+                    started = time.perf_counter()
+        self.read_s += time.perf_counter() - started
+
+    def close(self) -> None:
+        """Stop downloading (if the caller stopped early) and drop the spooled page."""
+        with self._cond:
+            self._closed = True
+            self._buf.close()
+        self._response.close()
+
+    def __enter__(self) -> "FeedStream":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def fetch_feed(
+    sess: requests.Session, url: str, limiter: RateLimiter, etag: str = "", last_modified: str = ""
+) -> Tuple[Optional[FeedStream], str, str]:
+    """
+    Start fetching one feed page, as a conditional GET when validators from
+    an earlier fetch are given.  Returns (feed, etag, last_modified); feed is
+    None when the server answers 304 Not Modified.
+    """
+    cond = {}
+    if etag:
+        cond["If-None-Match"] = etag
+    if last_modified:
+        cond["If-Modified-Since"] = last_modified
+    r, _ = limited_get(sess, limiter, url, timeout=45, headers=cond, stream=True)
+    if r.status_code == 304:
+        r.close()
+        return None, etag, last_modified
+    try:
+        r.raise_for_status()
+    except requests.HTTPError:
+        r.close()
+        raise
+    return FeedStream(r), r.headers.get("ETag", ""), r.headers.get("Last-Modified", "")
 
 
-def parse_entries(feed_root: ET.Element) -> List[Dict]:
-    ns = {"atom": "http://www.w3.org/2005/Atom"}
-    out = []
-    for entry in feed_root.findall("atom:entry", ns):
-        title = (entry.findtext("atom:title", default="", namespaces=ns) or "").strip()
-        id_url = (entry.findtext("atom:id", default="", namespaces=ns) or "").strip()
-        authors = [
-            a.findtext("atom:name", default="", namespaces=ns) or ""
-            for a in entry.findall("atom:author", ns)
-        ]
-        cats = [
-            (c.get("label") or c.get("term") or "").strip()
-            for c in entry.findall("atom:category", ns)
-        ]
-        # Links: pick epub
-        epub_href = None
-        for ln in entry.findall("atom:link", ns):
-            typ = (ln.get("type") or "").lower()
-            href = ln.get("href") or ""
-            if EPUB_MIME in typ and href:
-                epub_href = href
-                break
-        out.append(
-            {
-                "title": title,
-                "id": id_url,
-                "authors": [a for a in authors if a],
-                "categories": [c for c in cats if c],
-                "epub": epub_href,
-            }
-        )
-    return out
+def parse_updated(value: str) -> Optional[datetime]:
+    """An Atom <updated> timestamp as an aware datetime (UTC if no offset), or None."""
+    try:
+        dt = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def parse_entry(entry: ET.Element) -> Dict:
+    ns = {"atom": ATOM_NS}
+    title = (entry.findtext("atom:title", default="", namespaces=ns) or "").strip()
+    id_url = (entry.findtext("atom:id", default="", namespaces=ns) or "").strip()
+    updated = (entry.findtext("atom:updated", default="", namespaces=ns) or "").strip()
+    authors = [
+        a.findtext("atom:name", default="", namespaces=ns) or ""
+        for a in entry.findall("atom:author", ns)
+    ]
+    cats = [
+        (c.get("label") or c.get("term") or "").strip()
+        for c in entry.findall("atom:category", ns)
+    ]
+    # Links: pick epub
+    epub_href = None
+    for ln in entry.findall("atom:link", ns):
+        typ = (ln.get("type") or "").lower()
+        href = ln.get("href") or ""
+        if EPUB_MIME in typ and href:
+            epub_href = href
+            break
+    return {
+        "title": title,
+        "id": id_url,
+        "updated": updated,
+        "authors": [a for a in authors if a],
+        "categories": [c for c in cats if c],
+        "epub": epub_href,
+    }
 
 
 # ---------- EPUB/OPF helpers ----------
@@ -182,76 +349,306 @@ def read_series_name(md: ET.Element) -> Optional[str]:
     return None
 
 
+def edit_opf(zin: zipfile.ZipFile, subjects: List[str]) -> Tuple[Optional[str], Optional[bytes], Optional[str]]:
+    """
+    Merge OPDS subjects into the OPF <dc:subject>s and add the "Standard
+    Ebooks" collection if missing.  Only the OPF is read.  Returns (OPF path,
+    new OPF bytes, series name detected); the path is None when the book has
+    no OPF, and the bytes are None when it could not be parsed (it is then
+    copied as it is).
+    """
+    opf_path = find_opf_path(zin)
+    if not opf_path or opf_path not in zin.NameToInfo:
+        return None, None, None
+    try:
+        opf = ET.fromstring(zin.read(opf_path))
+        md = ensure_metadata(opf)
+        # Collect subjects
+        add_dc_subjects(md, subjects)
+        # Add library collection tag for Kavita-wide grouping
+        if not has_se_collection(md):
+            add_se_collection(md)
+        # Read series (for folder naming)
+        series_name = read_series_name(md)
+        return opf_path, ET.tostring(opf, xml_declaration=True, encoding="utf-8"), series_name
+    except Exception:
+        return opf_path, None, None
+
+
+def write_epub(zin: zipfile.ZipFile, dst: BinaryIO, opf_path: Optional[str], opf_bytes: Optional[bytes]) -> None:
+    """
+    Write the EPUB in `zin` to `dst` with the OPF replaced by `opf_bytes`.
+
+    Every other member is copied as its original compressed bytes and the OPF
+    is written last, so only the OPF is ever held in memory.
+    """
+    with zipfile.ZipFile(dst, "w", compression=zipfile.ZIP_DEFLATED) as zout:
+        for info in zin.infolist():
+            if info.filename == opf_path and opf_bytes is not None:
+                continue
+            copy_member_raw(zin, zout, info)
+        if opf_path is not None and opf_bytes is not None:
+            zout.writestr(opf_path, opf_bytes)
+
+
 def embed_kavita_metadata(
     epub_bytes: bytes, subjects: List[str]
 ) -> Tuple[bytes, Optional[str]]:
     """
-    Merge OPDS subjects into OPF <dc:subject>, add "Standard Ebooks" collection
-    if missing, and return (new_epub_bytes, series_name_detected).
+    In-memory edit_opf() + write_epub(): return (new_epub_bytes, series_name_detected).
     """
-    zin = zipfile.ZipFile(io.BytesIO(epub_bytes), "r")
-    opf_path = find_opf_path(zin)
+    with zipfile.ZipFile(io.BytesIO(epub_bytes), "r") as zin:
+        opf_path, opf_bytes, series_name = edit_opf(zin, subjects)
+        if opf_path is None:
+            # No OPF found; return the EPUB unchanged
+            return epub_bytes, None
+        out_mem = io.BytesIO()
+        write_epub(zin, out_mem, opf_path, opf_bytes)
+    return out_mem.getvalue(), series_name
 
-    out_mem = io.BytesIO()
-    zout = zipfile.ZipFile(out_mem, "w", compression=zipfile.ZIP_DEFLATED)
 
-    # Copy all files; we will overwrite the OPF later
-    for info in zin.infolist():
-        data = zin.read(info.filename)
-        if info.filename == opf_path:
-            continue
-        zout.writestr(info, data)
+# ---------- Local library index ----------
 
-    series_name = None
 
-    if opf_path:
-        try:
-            opf = ET.fromstring(zin.read(opf_path))
-            md = ensure_metadata(opf)
-            # Collect subjects
-            add_dc_subjects(md, subjects)
-            # Add library collection tag for Kavita-wide grouping
-            if not has_se_collection(md):
-                add_se_collection(md)
-            # Read series (for folder naming)
-            series_name = read_series_name(md)
-            # Serialize OPF back
-            opf_bytes = ET.tostring(opf, xml_declaration=True, encoding="utf-8")
-            zout.writestr(opf_path, opf_bytes)
-        except Exception:
-            # If OPF parse fails, just copy original OPF
-            zout.writestr(opf_path, zin.read(opf_path))
-    else:
-        # No OPF found; write the EPUB unchanged
-        pass
+class LibraryIndex:
+    """
+    Books saved by earlier runs, in `_reports/se_library_index.sqlite3`.
+
+    Rows are keyed by OPDS entry id and hold the entry's <updated> timestamp
+    and the file it was saved to, so a rerun can skip unchanged books before
+    any network I/O and replace only those Standard Ebooks has updated.  For
+    --sync it also keeps, per feed (URL plus subject filter), the newest
+    <updated> timestamp of the last complete sync and the ETag/Last-Modified
+    of the pages that sync read.
+
+    A new index is seeded from `se_library_report.csv` when one is present, so
+    the first rerun on a library saved before the index existed does not fetch
+    every book again.  Reports without an `updated` column leave it empty; such
+    a book is kept as it is and takes the feed's timestamp when next seen.
+    """
 
-    zin.close()
-    zout.close()
-    return out_mem.getvalue(), series_name
+    FILENAME = "se_library_index.sqlite3"
+
+    def __init__(self, reports_dir: Path, library_root: Path):
+        self.path = reports_dir / self.FILENAME
+        self.library_root = library_root
+        self._db = sqlite3.connect(str(self.path))
+        self.created = self._db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'books'"
+        ).fetchone() is None
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS books (
+                entry_id TEXT PRIMARY KEY,
+                updated TEXT NOT NULL,
+                file TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                saved_at TEXT NOT NULL
+            )"""
+        )
+        columns = [r[1] for r in self._db.execute("PRAGMA table_info(feed_pages)")]
+        if columns and "feed" not in columns:
+            # Validators used to be keyed by page URL alone; they are only a cache
+            self._db.execute("DROP TABLE feed_pages")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS feed_pages (
+                feed TEXT NOT NULL,
+                url TEXT NOT NULL,
+                etag TEXT NOT NULL,
+                last_modified TEXT NOT NULL,
+                PRIMARY KEY (feed, url)
+            )"""
+        )
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS syncs (
+                feed TEXT PRIMARY KEY,
+                synced_until TEXT NOT NULL,
+                synced_at TEXT NOT NULL
+            )"""
+        )
+        self._db.commit()
+
+    def lookup(self, entry_id: str) -> Tuple[Optional[str], Optional[Path]]:
+        """(updated, path) recorded for an entry; path is None if the file is gone."""
+        row = self._db.execute(
+            "SELECT updated, file FROM books WHERE entry_id = ?", (entry_id,)
+        ).fetchone()
+        if row is None:
+            return None, None
+        path = self.library_root / row[1]
+        return row[0], path if path.is_file() else None
+
+    def record(self, entry_id: str, updated: str, path: Path) -> Optional[Path]:
+        """Remember where an entry was saved; returns the file it replaces, if any."""
+        _, previous = self.lookup(entry_id)
+        self._db.execute(
+            "INSERT OR REPLACE INTO books (entry_id, updated, file, size, saved_at) VALUES (?, ?, ?, ?, ?)",
+            (
+                entry_id,
+                updated,
+                str(path.relative_to(self.library_root)),
+                path.stat().st_size,
+                time.strftime("%Y-%m-%dT%H:%M:%S"),
+            ),
+        )
+        self._db.commit()
+        return previous if previous is not None and previous != path else None
+
+    def seed_from_report(self, report_csv: Path) -> int:
+        """Record the books a previous run's report lists as saved; returns how many."""
+        root = self.library_root.resolve()
+        rows = []
+        with report_csv.open(newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                saved = (row.get("saved_path") or "").strip()
+                if not row.get("id") or not saved or row.get("status") not in ("OK", "SKIPPED"):
+                    continue
+                path = Path(saved).resolve()
+                if not path.is_file() or not path.is_relative_to(root):
+                    continue
+                rows.append((
+                    row["id"],
+                    row.get("updated") or "",
+                    str(path.relative_to(root)),
+                    path.stat().st_size,
+                    time.strftime("%Y-%m-%dT%H:%M:%S"),
+                ))
+        self._db.executemany(
+            "INSERT OR IGNORE INTO books (entry_id, updated, file, size, saved_at) VALUES (?, ?, ?, ?, ?)", rows
+        )
+        self._db.commit()
+        return len(rows)
+
+    def page_validators(self, feed: str, url: str) -> Tuple[str, str]:
+        """(etag, last_modified) stored for a page of the feed, empty if unknown."""
+        row = self._db.execute(
+            "SELECT etag, last_modified FROM feed_pages WHERE feed = ? AND url = ?", (feed, url)
+        ).fetchone()
+        return (row[0], row[1]) if row else ("", "")
+
+    def synced_until(self, feed: str) -> Optional[datetime]:
+        """Newest <updated> timestamp covered by the feed's last complete sync."""
+        row = self._db.execute("SELECT synced_until FROM syncs WHERE feed = ?", (feed,)).fetchone()
+        return parse_updated(row[0]) if row else None
+
+    def save_sync(self, feed: str, until: Optional[datetime], pages: Dict[str, Tuple[str, str]]) -> None:
+        """Commit a complete sync: its sync point (if any) and the validators of the pages it read."""
+        if until is not None:
+            self._db.execute(
+                "INSERT OR REPLACE INTO syncs (feed, synced_until, synced_at) VALUES (?, ?, ?)",
+                (feed, until.isoformat(), time.strftime("%Y-%m-%dT%H:%M:%S")),
+            )
+        self._db.executemany(
+            "INSERT OR REPLACE INTO feed_pages (feed, url, etag, last_modified) VALUES (?, ?, ?, ?)",
+            [(feed, url, etag, last_modified) for url, (etag, last_modified) in pages.items()],
+        )
+        self._db.commit()
+
+    def close(self) -> None:
+        self._db.close()
 
 
 # ---------- Main download loop ----------
 
 
-def save_epub(
-    epub_bytes: bytes,
-    library_root: Path,
-    title: str,
-    series: Optional[str],
-    se_id_hint: str,
-    overwrite: bool,
-) -> Path:
+def epub_path(library_root: Path, title: str, series: Optional[str], se_id_hint: str) -> Path:
+    """Where a book goes in Kavita layout: <series or title>/<title> - SE<id>.epub."""
     series_folder = slugify(series or title)
-    dest_dir = library_root / series_folder
-    dest_dir.mkdir(parents=True, exist_ok=True)
     fname = slugify(f"{title} - SE{se_id_hint or ''}.epub")
     if not fname.lower().endswith(".epub"):
         fname += ".epub"
-    path = dest_dir / fname
-    if path.exists() and not overwrite:
-        return path
-    path.write_bytes(epub_bytes)
-    return path
+    return library_root / series_folder / fname
+
+
+def transform_epub(
+    src: str,
+    library_root: Path,
+    title: str,
+    subjects: List[str],
+    se_id_hint: str,
+    overwrite: bool,
+) -> Tuple[Path, Dict[str, float]]:
+    """
+    CPU stage for the EPUB downloaded to `src`: embed metadata and save it in
+    Kavita layout.  Runs in the transform process pool, which is only sent the
+    path.
+
+    Only the OPF is read up front; it names the series folder, so a book that
+    is already there (and not to be overwritten) is kept without rewriting
+    anything.  Otherwise the archive is rewritten file to file into a temp
+    file next to the destination and moved into place.  Returns (saved path,
+    "embed" and "write" timings).
+    """
+    timings: Dict[str, float] = {}
+    started = time.perf_counter()
+    with zipfile.ZipFile(src, "r") as zin:
+        opf_path, opf_bytes, series = edit_opf(zin, subjects)
+        path = epub_path(library_root, title, series, se_id_hint)
+        if path.exists() and not overwrite:
+            timings["embed"] = time.perf_counter() - started
+            timings["write"] = 0.0
+            return path, timings
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = tempfile.NamedTemporaryFile(dir=path.parent, prefix=".", suffix=".epub.part", delete=False)
+        try:
+            with tmp:
+                if opf_path is None:
+                    # No OPF found; save the EPUB unchanged
+                    with open(src, "rb") as f:
+                        shutil.copyfileobj(f, tmp, 1 << 20)
+                else:
+                    write_epub(zin, tmp, opf_path, opf_bytes)
+            timings["embed"] = time.perf_counter() - started
+
+            started = time.perf_counter()
+            os.chmod(tmp.name, 0o644)  # NamedTemporaryFile creates 0600; Kavita must be able to read it
+            os.replace(tmp.name, path)
+        except BaseException:
+            if os.path.exists(tmp.name):
+                os.unlink(tmp.name)
+            raise
+    timings["write"] = time.perf_counter() - started
+    return path, timings
+
+
+def fetch_book(
+    sess: requests.Session,
+    limiter: RateLimiter,
+    url: str,
+    library_root: Path,
+    title: str,
+    subjects: List[str],
+    se_id_hint: str,
+    overwrite: bool,
+    pool: Optional[ProcessPoolExecutor],
+) -> Tuple[Path, Dict[str, float], int]:
+    """
+    Download one EPUB and transform it; runs on a fetch thread.
+
+    The body is streamed to a temp file in `library_root` and its path handed
+    to transform_epub() in `pool` (or on this thread without one).  Returns
+    (saved path, stage timings, bytes downloaded).
+    """
+    timings: Dict[str, float] = {}
+    with tempfile.NamedTemporaryFile(dir=library_root, prefix=".", suffix=DOWNLOAD_SUFFIX) as tmp:
+        log(f"  GET {url}")
+        started = time.perf_counter()
+        r, waited = limited_get(sess, limiter, url, timeout=60, stream=True)
+        with r:
+            r.raise_for_status()
+            for chunk in r.iter_content(chunk_size=64 * 1024):
+                tmp.write(chunk)
+        tmp.flush()
+        timings["download"] = time.perf_counter() - started - waited
+        bytes_in = tmp.tell()
+
+        # Embed Kavita-friendly metadata (subjects + SE collection) and save in Kavita layout
+        args = (tmp.name, library_root, title, subjects, se_id_hint, overwrite)
+        if pool is not None:
+            final_path, stage_timings = pool.submit(transform_epub, *args).result()
+        else:
+            final_path, stage_timings = transform_epub(*args)
+    timings.update(stage_timings)
+    return final_path, timings, bytes_in
 
 
 def run(
@@ -263,115 +660,261 @@ def run(
     subjects: List[str],
     sleep_s: float,
     overwrite: bool,
+    rate: Optional[float] = None,
+    burst: int = DEFAULT_BURST,
+    transform_workers: Optional[int] = None,
+    sync: bool = False,
+    workers: int = DEFAULT_WORKERS,
+    opds: bool = True,
 ) -> None:
+    """
+    Walk the OPDS feed and download every matching EPUB.
+
+    Each feed page is parsed by a FeedStream while it downloads, and its
+    entries are handed to `workers` fetch threads as they are parsed; the
+    next page is prefetched on its own thread as soon as its link is known.
+    All requests share the session and the per-host RateLimiter.  A fetch
+    thread writes its download to a temp file and hands the path to a pool
+    of `transform_workers` processes (default one per CPU; 0 transforms on
+    the fetch thread), which embed the metadata and save the book.  At most
+    two books per fetch thread are queued, and report rows keep feed order.
+
+    Unless `overwrite` is set, books the LibraryIndex lists with the same
+    <updated> timestamp (and still on disk) are skipped without any network
+    I/O; updated ones are downloaded again and replace the old file.
+
+    With `sync`, feed pages are fetched conditionally with the validators
+    from the last sync, and reading stops at the first entry no newer than
+    the last complete sync (or at a 304), which assumes the feed lists the
+    newest updates first.  The sync point only advances when every download
+    succeeded.  With `opds`, the static OPDS catalog under `opds/` is brought
+    up to date at the end.
+    """
 
     sess = build_session(api_key, headers, cookies)
+    if rate is None:
+        rate = 1.0 / sleep_s if sleep_s > 0 else 0.0
+    limiter = RateLimiter(rate, burst)
     out_dir.mkdir(parents=True, exist_ok=True)
 
-    report_rows: List[Dict[str, str]] = []
+    rep_dir = out_dir / "_reports"
+    rep_dir.mkdir(parents=True, exist_ok=True)
+    report_csv = rep_dir / "se_library_report.csv"
+    cols = [
+        "title",
+        "authors",
+        "id",
+        "updated",
+        "download_url",
+        "categories",
+        "saved_path",
+        "status",
+        "notes",
+    ]
+    cols += [f"{stage}_s" for stage in STAGES] + ["bytes_in", "bytes_out"]
+
+    # Rows are streamed to the report as each feed page finishes; only the
+    # per-stage timings are kept for the summary percentiles.
+    stage_values = {stage: array.array("d") for stage in STAGES}
+    saved_bytes = 0
     seen_ids = set()
     fetched = 0
+    skipped = 0
+    index = LibraryIndex(rep_dir, out_dir)
+    if index.created and report_csv.is_file():
+        seeded = index.seed_from_report(report_csv)
+        if seeded:
+            log(f"Library index seeded with {seeded} book(s) from {report_csv.name}")
     page_url = opds_url
 
-    while True:
-        log(f"Feed page: {page_url}")
-        root = fetch_feed(sess, page_url, sleep_s=sleep_s)
-        entries = parse_entries(root)
-
-        for e in entries:
-            # Optional subject filter
-            if subjects:
-                cats_lc = " | ".join([c.lower() for c in e["categories"]])
-                if not any(sub.lower() in cats_lc for sub in subjects):
-                    continue
-            if not e["epub"]:
-                continue
-            if e["id"] in seen_ids:
-                continue
-            seen_ids.add(e["id"])
-
-            dl_url = urljoin(page_url, e["epub"])
-            title = e["title"] or "Untitled"
-            author_str = ", ".join(e["authors"]) if e["authors"] else "Unknown"
-            se_id_hint = ""
+    # A sync point only covers the subjects it was taken with
+    sync_feed = opds_url + (" subjects=" + ",".join(sorted(s.lower() for s in subjects)) if subjects else "")
+    synced_until = index.synced_until(sync_feed) if sync else None
+    newest = synced_until
+    failed = 0
+    # Page validators are only stored together with the sync point of a complete run
+    page_validators: Dict[str, Tuple[str, str]] = {}
+    if sync:
+        log(f"Sync: entries updated after {synced_until.isoformat()}" if synced_until
+            else "Sync: no earlier sync of this feed, reading all of it")
+    run_started = time.perf_counter()
+
+    workers = max(1, workers)
+    pool = None
+    if transform_workers != 0:
+        transform_workers = max(1, transform_workers or os.cpu_count() or 1)
+        pool = ProcessPoolExecutor(max_workers=transform_workers, mp_context=multiprocessing.get_context("spawn"))
+    log(f"Downloading with {workers} worker(s), transforming in "
+        + (f"{transform_workers} process(es)" if pool is not None else "the fetch threads"))
+    fetchers = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fetch")
+    feeds = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+    pending: deque = deque()  # (row, timings, future), in feed order
+
+    def _finish(row: Dict[str, str], timings: Dict[str, float], fut: Future) -> None:
+        try:
+            final_path, book_timings, bytes_in = fut.result()
+            timings.update(book_timings)
+            bytes_out = final_path.stat().st_size
+            row["saved_path"] = str(final_path)
+            row["bytes_in"] = str(bytes_in) if bytes_in else ""
+            row["bytes_out"] = str(bytes_out) if bytes_out else ""
+            replaced = index.record(row["id"], row["updated"], final_path)
+            if replaced is not None:
+                # The update moved the book (e.g. a new series); drop the old copy
+                replaced.unlink()
+        except requests.HTTPError as he:
+            row["status"] = "HTTPERROR"
+            row["notes"] = str(he)
+        except Exception as ex:
+            row["status"] = "ERROR"
+            row["notes"] = str(ex)
+
+    def _fetch_page(url: str) -> "Future[Tuple[Optional[FeedStream], str, str]]":
+        etag, last_modified = index.page_validators(sync_feed, url) if synced_until else ("", "")
+        return feeds.submit(fetch_feed, sess, url, limiter, etag, last_modified)
+
+    feed: Optional[FeedStream] = None
+    next_feed: Optional[Future] = None  # the prefetched next page
+    try:
+        with ReportWriter(report_csv, cols) as report:
+            next_feed = _fetch_page(page_url)
+            while True:
+                log(f"Feed page: {page_url}")
+                started = time.perf_counter()
+                feed, etag, last_modified = next_feed.result()
+                next_feed = None
+                if feed is None:
+                    log("  Not modified since the last sync")
+                    break
+                query_s = time.perf_counter() - started
+                page_rows: List[Tuple[Dict[str, str], Dict[str, float]]] = []
+                reached_synced = False
+
+                # Entries are downloaded as they are parsed, while the rest of the page arrives
+                for e in feed:
+                    if next_feed is None and feed.next_link:
+                        next_feed = _fetch_page(urljoin(page_url, feed.next_link))
+                    if sync:
+                        updated = parse_updated(e["updated"])
+                        if updated is not None:
+                            if synced_until is not None and updated <= synced_until:
+                                reached_synced = True
+                                break
+                            newest = max(newest, updated) if newest else updated
+                    # Optional subject filter
+                    if subjects:
+                        cats_lc = " | ".join([c.lower() for c in e["categories"]])
+                        if not any(sub.lower() in cats_lc for sub in subjects):
+                            continue
+                    if not e["epub"]:
+                        continue
+                    if e["id"] in seen_ids:
+                        continue
+                    seen_ids.add(e["id"])
+
+                    dl_url = urljoin(page_url, e["epub"])
+                    title = e["title"] or "Untitled"
+                    author_str = ", ".join(e["authors"]) if e["authors"] else "Unknown"
+                    se_id_hint = ""
+                    try:
+                        p = urlparse(e["id"])
+                        se_id_hint = p.path.strip("/").split("/")[-1].replace("/", "_")
+                    except Exception:
+                        pass
+
+                    row = {
+                        "title": title,
+                        "authors": author_str,
+                        "id": e["id"],
+                        "updated": e["updated"],
+                        "download_url": dl_url,
+                        "categories": "; ".join(e["categories"]),
+                        "saved_path": "",
+                        "status": "OK",
+                        "notes": "",
+                        "bytes_in": "",
+                        "bytes_out": "",
+                    }
+                    timings: Dict[str, float] = {}
+                    page_rows.append((row, timings))
+
+                    known_updated, known_path = index.lookup(e["id"])
+                    if known_path is not None and not overwrite and known_updated in (e["updated"], ""):
+                        if not known_updated:
+                            # Seeded from a report without timestamps: the saved copy is current from now on
+                            index.record(e["id"], e["updated"], known_path)
+                        row["status"] = "SKIPPED"
+                        row["notes"] = "unchanged since last download"
+                        row["saved_path"] = str(known_path)
+                        row["bytes_out"] = str(known_path.stat().st_size)
+                        continue
+                    # An updated book replaces the copy saved by an earlier run
+                    replace = overwrite or known_path is not None
+
+                    fut = fetchers.submit(
+                        fetch_book, sess, limiter, dl_url, out_dir, title, e["categories"], se_id_hint, replace, pool
+                    )
+                    pending.append((row, timings, fut))
+                    if len(pending) >= 2 * workers:
+                        _finish(*pending.popleft())
+
+                feed.close()
+                query_s += feed.read_s
+                while pending:
+                    _finish(*pending.popleft())
+
+                # The feed page fetch is split evenly over the books taken from it
+                for row, timings in page_rows:
+                    if row["status"] == "OK":
+                        fetched += 1
+                        saved_bytes += int(row["bytes_in"] or 0)
+                    elif row["status"] == "SKIPPED":
+                        skipped += 1
+                    else:
+                        failed += 1
+                    timings["query"] = query_s / len(page_rows)
+                    for stage in STAGES:
+                        row[f"{stage}_s"] = f"{timings[stage]:.3f}" if stage in timings else ""
+                        if row["status"] == "OK" and stage in timings:
+                            stage_values[stage].append(timings[stage])
+                    report.write(row)
+
+                if sync:
+                    page_validators[page_url] = (etag, last_modified)
+                if reached_synced:
+                    log("  Reached entries from the last sync; stopping")
+                    break
+                if not feed.next_link:
+                    break
+                page_url = urljoin(page_url, feed.next_link)
+                if next_feed is None:
+                    next_feed = _fetch_page(page_url)
+        if sync and not failed:
+            index.save_sync(sync_feed, newest, page_validators)
+        elif sync and failed:
+            log(f"Sync point not advanced: {failed} download(s) failed and will be retried next sync")
+    finally:
+        if feed is not None:
+            feed.close()
+        if next_feed is not None:
+            # Stopped before reaching the prefetched page
             try:
-                p = urlparse(e["id"])
-                se_id_hint = p.path.strip("/").split("/")[-1].replace("/", "_")
+                stale = next_feed.result()[0]
+                if stale is not None:
+                    stale.close()
             except Exception:
                 pass
+        fetchers.shutdown(cancel_futures=True)
+        feeds.shutdown()
+        if pool is not None:
+            pool.shutdown()
+        index.close()
 
-            status = "OK"
-            notes = []
-            saved_path = ""
-
-            try:
-                log(f"  GET {dl_url}")
-                r = sess.get(dl_url, timeout=60)
-                r.raise_for_status()
-                raw_epub = r.content
-
-                # Embed Kavita-friendly metadata (subjects + SE collection)
-                mod_epub, series = embed_kavita_metadata(raw_epub, e["categories"])
-
-                # Save in Kavita layout
-                final_path = save_epub(
-                    mod_epub,
-                    out_dir,
-                    title=title,
-                    series=series,
-                    se_id_hint=se_id_hint,
-                    overwrite=overwrite,
-                )
-                saved_path = str(final_path)
-                fetched += 1
-                time.sleep(sleep_s)
-
-            except requests.HTTPError as he:
-                status = "HTTPERROR"
-                notes.append(str(he))
-            except Exception as ex:
-                status = "ERROR"
-                notes.append(str(ex))
-
-            report_rows.append(
-                {
-                    "title": title,
-                    "authors": author_str,
-                    "id": e["id"],
-                    "download_url": dl_url,
-                    "categories": "; ".join(e["categories"]),
-                    "saved_path": saved_path,
-                    "status": status,
-                    "notes": "; ".join(notes),
-                }
-            )
-
-        next_url = find_next_link(root)
-        if not next_url:
-            break
-        page_url = urljoin(page_url, next_url)
-
-    # Write report
-    rep_dir = out_dir / "_reports"
-    rep_dir.mkdir(parents=True, exist_ok=True)
-    report_csv = rep_dir / "se_library_report.csv"
-    with report_csv.open("w", newline="", encoding="utf-8") as f:
-        cols = [
-            "title",
-            "authors",
-            "id",
-            "download_url",
-            "categories",
-            "saved_path",
-            "status",
-            "notes",
-        ]
-        w = csv.DictWriter(f, fieldnames=cols)
-        w.writeheader()
-        for row in report_rows:
-            w.writerow(row)
-
-    log(f"Done. Saved {fetched} item(s). Report: {report_csv}")
+    log_stage_summary(log, STAGES, stage_values, fetched, saved_bytes, time.perf_counter() - run_started)
+    if opds:
+        import opds_catalog  # sibling script; only loaded when the catalog is wanted
+        opds_catalog.update_and_log(out_dir)
+    log(f"Done. Saved {fetched} item(s), skipped {skipped} unchanged. Report: {report_csv}")
 
 
 def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
@@ -395,7 +938,19 @@ def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
         "--sleep",
         type=float,
         default=1.5,
-        help="Seconds to sleep between requests (default: 1.5)",
+        help="Minimum seconds between requests to the same host, i.e. --rate 1/SLEEP (default: 1.5)",
+    )
+    ap.add_argument(
+        "--rate",
+        type=float,
+        default=None,
+        help="Requests per second per host; 0 means unlimited (default: 1/--sleep)",
+    )
+    ap.add_argument(
+        "--burst",
+        type=int,
+        default=DEFAULT_BURST,
+        help=f"Requests a host may receive back-to-back before --rate applies (default: {DEFAULT_BURST})",
     )
     ap.add_argument(
         "--subjects",
@@ -417,7 +972,29 @@ def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
     ap.add_argument(
         "--overwrite",
         action="store_true",
-        help="Overwrite existing files if present (default: skip existing).",
+        help="Download and overwrite every book, even those unchanged since the last run (default: skip them).",
+    )
+    ap.add_argument(
+        "--sync",
+        action="store_true",
+        help="Only fetch entries updated since the last --sync of this feed, using conditional requests and stopping at the first already-synced entry (the feed must list newest first)",
+    )
+    ap.add_argument(
+        "--no-opds",
+        action="store_true",
+        help="Don't update the static OPDS catalog in <out>/opds/ after the run.",
+    )
+    ap.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help=f"Concurrent EPUB downloads; --rate/--burst still pace every request (default: {DEFAULT_WORKERS})",
+    )
+    ap.add_argument(
+        "--transform-workers",
+        type=int,
+        default=None,
+        help="Processes that embed metadata and save the downloaded EPUBs while the next ones download; 0 does it on the fetch threads (default: one per CPU)",
     )
     return ap.parse_args(argv)
 
@@ -435,6 +1012,12 @@ def main(argv: Optional[Sequence[str]] = None) -> None:
         subjects=subjects,
         sleep_s=args.sleep,
         overwrite=args.overwrite,
+        rate=args.rate,
+        burst=args.burst,
+        transform_workers=args.transform_workers,
+        sync=args.sync,
+        workers=args.workers,
+        opds=not args.no_opds,
     )
 
 
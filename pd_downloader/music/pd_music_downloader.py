@@ -72,9 +72,11 @@ import re
 import shutil
 import sys
 import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from dataclasses import dataclass, asdict
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
 
 try:
     import requests
@@ -90,11 +92,24 @@ try:
 except Exception:
     mutagen = None  # tagging optional
 
+# The request limiter is shared with the ebook downloaders
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "ebooks"))
+from download_common import DEFAULT_BURST, RateLimiter
+
 SAFE_BUCKETS = {"pd", "cc0"}
 IA_ADVANCED_URL = "https://archive.org/advancedsearch.php"
 IA_METADATA_URL = "https://archive.org/metadata/{identifier}"
 COMMONS_API     = "https://commons.wikimedia.org/w/api.php"
 
+# Per-host request budget (--rate/--burst)
+DEFAULT_RATE = 2.5  # requests/second per host
+MAX_RETRIES = 3
+
+# IA pipeline (--workers/--meta-workers); every request still goes through the limiter
+DEFAULT_WORKERS = 4        # concurrent file downloads
+DEFAULT_META_WORKERS = 4   # concurrent metadata lookups
+IA_SEARCH_ROWS = 50        # search results per page
+
 # ---------------- Utilities ----------------
 
 def slugify(text, maxlen: int = 80) -> str:
@@ -126,6 +141,21 @@ def save_index_row(index_path: Path, row: List[str], header: Optional[List[str]]
             w.writerow(header)
         w.writerow(row)
 
+# Replaced in main() with the --rate/--burst budget
+limiter = RateLimiter(DEFAULT_RATE)
+
+def http_get(url: str, **kwargs):
+    """requests.get() within the host's budget, waiting out up to MAX_RETRIES 429/503 answers."""
+    limiter.acquire(url)
+    r = requests.get(url, **kwargs)
+    for _ in range(MAX_RETRIES):
+        if limiter.defer(r) is None:
+            break
+        r.close()
+        limiter.acquire(url)
+        r = requests.get(url, **kwargs)
+    return r
+
 def human_era_filter(era: str) -> Tuple[Optional[int], Optional[int]]:
     """
     Parse a simple era descriptor -> (start_year, end_year), inclusive.
@@ -220,7 +250,7 @@ def ia_search(query: str, rows: int, page: int = 1) -> dict:
         "page": page,
         "output": "json"
     }
-    r = requests.get(IA_ADVANCED_URL, params=params, timeout=30)
+    r = http_get(IA_ADVANCED_URL, params=params, timeout=30)
     r.raise_for_status()
     return r.json()
 
@@ -246,11 +276,42 @@ def pick_file(files: List[dict], identifier: str, preferred: str, fallback_to_mp
                 return f
     return None
 
-def ia_download_item(identifier: str, out_dir: Path, index_path: Path, preferred_format: str, fallback_to_mp3: bool, skip_if_missing_format: bool) -> int:
-    meta_resp = requests.get(IA_METADATA_URL.format(identifier=identifier), timeout=30)
-    if meta_resp.status_code != 200:
-        return 0
-    meta = meta_resp.json()
+@dataclass
+class IaItem:
+    """An IA search hit that passed the license and format checks, ready to download."""
+    identifier: str
+    info: dict
+    chosen: dict
+    file_url: str
+    item_dir: Path
+    dest: Path
+
+def ia_search_identifiers(query: str) -> Iterator[str]:
+    """Yield identifiers from successive search pages until the results run out."""
+    page = 1
+    while True:
+        try:
+            resp = ia_search(query, rows=IA_SEARCH_ROWS, page=page)
+        except Exception as e:
+            print(f"[ia] search error on page {page}: {e}", file=sys.stderr)
+            return
+        docs = resp.get('response', {}).get('docs', [])
+        if not docs:
+            return
+        for doc in docs:
+            if doc.get('identifier'):
+                yield doc['identifier']
+        page += 1
+
+def ia_resolve_item(identifier: str, out_dir: Path, preferred_format: str, fallback_to_mp3: bool, skip_if_missing_format: bool) -> Optional[IaItem]:
+    """Fetch an item's metadata and pick its file; None if it isn't PD/CC0 or has no usable audio."""
+    try:
+        meta_resp = http_get(IA_METADATA_URL.format(identifier=identifier), timeout=30)
+        if meta_resp.status_code != 200:
+            return None
+        meta = meta_resp.json()
+    except (requests.RequestException, ValueError):
+        return None
     files = meta.get('files', []) or []
     mdmd = meta.get('metadata', {}) or {}
 
@@ -268,70 +329,75 @@ def ia_download_item(identifier: str, out_dir: Path, index_path: Path, preferred
     # safety check on license (PD/CC0 only)
     lic = base_info["licenseurl"]
     if not (("publicdomain" in lic) or ("cc0" in lic)):
-        return 0
+        return None
 
     chosen = pick_file(files, identifier, preferred_format, fallback_to_mp3, skip_if_missing_format)
     if not chosen:
-        return 0
+        return None
 
     name = chosen.get('name')
-    file_url = f"https://archive.org/download/{identifier}/{name}"
     folder = slugify((base_info.get('collection') or base_info.get('creator') or 'ia'))
     item_slug = slugify(base_info.get('title') or identifier)
     item_dir = out_dir / folder / item_slug
-    ensure_dir(item_dir)
-    dest = item_dir / name
-
-    # Check if file already exists (duplicate detection)
-    if dest.exists():
-        print(f"  ⏭️  SKIP (exists): {base_info.get('title', identifier)[:60]}")
-        return 0
-
+    return IaItem(identifier, base_info, chosen, f"https://archive.org/download/{identifier}/{name}",
+                  item_dir, item_dir / name)
+
+def ia_fetch_item(item: IaItem) -> Optional[dict]:
+    """Download the item's file and build its metadata.json; None if the download failed."""
+    ensure_dir(item.item_dir)
+    # Written under a temporary name so a failed or interrupted download never looks finished
+    part = item.dest.with_name(item.dest.name + ".part")
     try:
-        with requests.get(file_url, stream=True, timeout=60) as r:
+        with http_get(item.file_url, stream=True, timeout=60) as r:
             r.raise_for_status()
-            with open(dest, 'wb') as fh:
+            with open(part, 'wb') as fh:
                 for chunk in r.iter_content(chunk_size=1024 * 64):
                     if chunk:
                         fh.write(chunk)
+        os.replace(part, item.dest)
     except Exception:
-        return 0
+        part.unlink(missing_ok=True)
+        return None
 
-    md = dict(base_info)
+    md = dict(item.info)
     md.update({
-        "file": name,
-        "format": chosen.get('format'),
-        "bytes": chosen.get('size'),
-        "original": file_url,
+        "file": item.dest.name,
+        "format": item.chosen.get('format'),
+        "bytes": item.chosen.get('size'),
+        "original": item.file_url,
     })
 
     # Musopen verify (best-effort) before saving metadata
     verify = musopen_verify(md.get('title'), md.get('creator'))
     md.update(verify)
+    return md
 
-    write_json(item_dir / "metadata.json", md)
+def ia_write_item(item: IaItem, md: dict, out_dir: Path, index_path: Path) -> None:
+    """Write metadata.json, the index row, tags and .nfo for a downloaded item."""
+    base_info = item.info
+    write_json(item.item_dir / "metadata.json", md)
 
     # index
     save_index_row(
         index_path,
         [
             "internet_archive",
-            identifier,
+            item.identifier,
             base_info.get('title') or '',
             base_info.get('creator') or '',
             str(base_info.get('year') or ''),
             base_info.get('licenseurl') or '',
-            file_url,
-            str(dest.relative_to(out_dir))
+            item.file_url,
+            str(item.dest.relative_to(out_dir))
         ],
         header=["source","id","title","creator","year","license","download_url","relative_path"]
     )
 
     # tagging + nfo
-    safe_tagging(dest, title=base_info.get('title'), artist=base_info.get('creator'),
+    safe_tagging(item.dest, title=base_info.get('title'), artist=base_info.get('creator'),
                  album=base_info.get('collection'), year=str(base_info.get('year') or ''),
                  comment=f"License: {base_info.get('licenseurl')}; Source: {base_info.get('url')}")
-    write_nfo(item_dir / (dest.stem + ".nfo"),
+    write_nfo(item.item_dir / (item.dest.stem + ".nfo"),
               title=base_info.get('title'),
               artist=base_info.get('creator'),
               album=base_info.get('collection'),
@@ -339,8 +405,90 @@ def ia_download_item(identifier: str, out_dir: Path, index_path: Path, preferred
               license_url=base_info.get('licenseurl'),
               source_url=base_info.get('url'))
 
-    print(f"  ✅ Downloaded: {base_info.get('title', identifier)[:60]}")
-    return 1
+    print(f"  ✅ Downloaded: {str(base_info.get('title') or item.identifier)[:60]}")
+
+def ia_download(query: str, out_dir: Path, index_path: Path, max_items: float, preferred_format: str, fallback_to_mp3: bool, skip_if_missing_format: bool,
+                workers: int = DEFAULT_WORKERS, meta_workers: int = DEFAULT_META_WORKERS) -> int:
+    """
+    Download up to `max_items` IA search hits through a three-stage pipeline.
+
+    `meta_workers` threads fetch item metadata ahead of the downloads, `workers`
+    threads download files, and a single writer thread writes metadata.json,
+    index.csv rows, tags and .nfo files in search order.  A download only starts while the
+    finished plus in-flight downloads are below `max_items`, so a failure frees
+    its slot for the next hit and the count is exact.  Downloads start in search
+    order; metadata lookups still queued when the limit is reached are cancelled.
+    """
+    workers = max(1, workers)
+    meta_workers = max(1, meta_workers)
+    resolver = ThreadPoolExecutor(meta_workers, thread_name_prefix="ia-meta")
+    fetchers = ThreadPoolExecutor(workers, thread_name_prefix="ia-fetch")
+    writer = ThreadPoolExecutor(1, thread_name_prefix="ia-write")
+    identifiers = ia_search_identifiers(query)
+    resolving: deque = deque()             # metadata futures, in search order
+    downloading: Dict[Future, IaItem] = {}
+    started: deque = deque()               # (download future, item), in start order
+    writes: deque = deque()
+    claimed = set()                        # destinations taken by this run
+    exhausted = False
+    saved = 0
+
+    def has_slot() -> bool:
+        return len(downloading) < workers and saved + len(downloading) < max_items
+
+    try:
+        while saved < max_items:
+            # Keep metadata lookups a little ahead of the downloads
+            while not exhausted and len(resolving) < 2 * meta_workers:
+                identifier = next(identifiers, None)
+                if identifier is None:
+                    exhausted = True
+                    break
+                resolving.append(resolver.submit(ia_resolve_item, identifier, out_dir, preferred_format,
+                                                 fallback_to_mp3, skip_if_missing_format))
+
+            while resolving and resolving[0].done() and has_slot():
+                item = resolving.popleft().result()
+                if item is None:
+                    continue
+                # Duplicate detection: already in the library, or another hit of this run maps to it
+                if item.dest in claimed or item.dest.exists():
+                    print(f"  ⏭️  SKIP (exists): {str(item.info.get('title') or item.identifier)[:60]}")
+                    continue
+                claimed.add(item.dest)
+                fut = fetchers.submit(ia_fetch_item, item)
+                downloading[fut] = item
+                started.append((fut, item))
+
+            pending = set(downloading)
+            if resolving and has_slot():
+                pending.add(resolving[0])
+            if not pending:
+                break  # search exhausted and nothing left in flight
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                item = downloading.pop(fut, None)
+                if item is None:
+                    continue
+                if fut.result() is None:
+                    claimed.discard(item.dest)
+                else:
+                    saved += 1
+            # Hand finished downloads to the writer in start order so index.csv follows the search
+            while started and started[0][0].done():
+                fut, item = started.popleft()
+                md = fut.result()
+                if md is not None:
+                    writes.append(writer.submit(ia_write_item, item, md, out_dir, index_path))
+            while writes and writes[0].done():
+                writes.popleft().result()  # surface write errors
+    finally:
+        resolver.shutdown(cancel_futures=True)
+        fetchers.shutdown(cancel_futures=True)
+        writer.shutdown()
+    for fut in writes:
+        fut.result()
+    return saved
 
 # ---------------- Commons (Wikimedia) ----------------
 
@@ -355,7 +503,7 @@ def commons_search_audio(query: str, limit: int, cont: Optional[str] = None) ->
     }
     if cont:
         params["sroffset"] = cont
-    r = requests.get(COMMONS_API, params=params, timeout=30)
+    r = http_get(COMMONS_API, params=params, timeout=30)
     r.raise_for_status()
     return r.json()
 
@@ -367,7 +515,7 @@ def commons_get_info(titles: List[str]) -> dict:
         "iiprop": "url|mime|size|extmetadata",
         "format": "json",
     }
-    r = requests.get(COMMONS_API, params=params, timeout=30)
+    r = http_get(COMMONS_API, params=params, timeout=30)
     r.raise_for_status()
     return r.json()
 
@@ -449,7 +597,7 @@ def commons_download(query: str, out_dir: Path, max_items: int, preferred_format
                 continue
 
             try:
-                with requests.get(url, stream=True, timeout=60) as r:
+                with http_get(url, stream=True, timeout=60) as r:
                     r.raise_for_status()
                     with open(dest, 'wb') as fh:
                         for chunk in r.iter_content(chunk_size=1024*64):
@@ -504,7 +652,6 @@ def commons_download(query: str, out_dir: Path, max_items: int, preferred_format
         sroffset = resp.get('continue', {}).get('sroffset')
         if not sroffset:
             break
-        time.sleep(0.4)
     return saved
 
 # ---------------- Tagging & NFO ----------------
@@ -600,7 +747,7 @@ def musopen_verify(title: Optional[str], composer: Optional[str]) -> Dict[str, s
     if not q:
         return {"musopen_verified": "unknown"}
     try:
-        resp = requests.get(MUSOPEN_SEARCH.format(q=requests.utils.quote(q)), timeout=10)
+        resp = http_get(MUSOPEN_SEARCH.format(q=requests.utils.quote(q)), timeout=10)
         if resp.status_code != 200:
             return {"musopen_verified": "unknown"}
         data = resp.json()
@@ -812,8 +959,15 @@ def main():
     ap.add_argument("--preferred-format", default="flac", help="Preferred audio format (flac|ogg|wav|mp3)")
     ap.add_argument("--fallback-to-mp3", action="store_true", help="If preferred format isn't available, allow fallback to MP3")
     ap.add_argument("--skip-if-missing-format", action="store_true", help="Skip track if preferred format is not available")
+    ap.add_argument("--rate", type=float, default=DEFAULT_RATE, help=f"Requests per second per host; 0 means unlimited (default: {DEFAULT_RATE})")
+    ap.add_argument("--burst", type=int, default=DEFAULT_BURST, help=f"Requests a host may receive back-to-back before --rate applies (default: {DEFAULT_BURST})")
+    ap.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help=f"Concurrent Internet Archive file downloads (default: {DEFAULT_WORKERS})")
+    ap.add_argument("--meta-workers", type=int, default=DEFAULT_META_WORKERS, help=f"Concurrent Internet Archive metadata lookups ahead of the downloads (default: {DEFAULT_META_WORKERS})")
     args = ap.parse_args()
 
+    global limiter
+    limiter = RateLimiter(args.rate, args.burst)
+
     # Display usage warning with 5-second delay
     print_usage_warning()
 
@@ -877,30 +1031,18 @@ def main():
             print(f"[ia] Query: {query}")
             print(f"[ia] Searching Internet Archive...\n")
             
-            page = 1
-            source_saved = 0
-            while source_saved < max_per_source:
-                try:
-                    fetch_count = 50 if args.max_items == -1 else min(50, args.max_items - source_saved)
-                    resp = ia_search(query, rows=fetch_count, page=page)
-                except Exception as e:
-                    print(f"[ia] search error on page {page}: {e}", file=sys.stderr)
-                    break
-                docs = resp.get('response', {}).get('docs', [])
-                if not docs:
-                    break
-                for doc in docs:
-                    identifier = doc.get('identifier')
-                    if not identifier:
-                        continue
-                    saved = ia_download_item(identifier, out_root, index_path, args.preferred_format, args.fallback_to_mp3, args.skip_if_missing_format)
-                    if saved > 0:
-                        source_saved += saved
-                        total_saved += saved
-                        if source_saved >= max_per_source:
-                            break
-                page += 1
-                time.sleep(0.4)
+            source_saved = ia_download(
+                query=query,
+                out_dir=out_root,
+                index_path=index_path,
+                max_items=max_per_source,
+                preferred_format=args.preferred_format,
+                fallback_to_mp3=args.fallback_to_mp3,
+                skip_if_missing_format=args.skip_if_missing_format,
+                workers=args.workers,
+                meta_workers=args.meta_workers,
+            )
+            total_saved += source_saved
             print(f"\n[ia] Downloaded {source_saved} files from Internet Archive")
 
         elif source == "commons":